@@ -1,9 +1,9 @@
 import streamlit as st
-import cv2
 import os
 import tempfile
 import time
 import sys
+from collections import deque
 from pathlib import Path
 
 # Add src directory to Python path for imports
@@ -12,7 +12,18 @@ if str(src_path) not in sys.path:
     sys.path.insert(0, str(src_path))
 
 try:
-    from src.video_processing import process_video
+    from src.video_processing import (DEFAULT_IMGSZ, DEFAULT_LINE_NAME, DEFAULT_WEIGHTS, detection_key,
+                                      line_coords_from_percent, probe_video, process_video, replay_detections)
+    from src.motion_gate import MotionGate, roi_around_line
+    from src.keyframes import KeyframePolicy
+    from src.detection_store import DetectionStore, copy_and_hash
+    from src.result_cache import ResultCache
+    from src.model_registry import model_timings
+    from src.inference_service import get_inference_service
+    from src.inference_geometry import InferenceGeometry
+    from src.metrics import PipelineMetrics
+    from src.display import BackgroundRunner, LogBuffer, preview_image
+    from src.streaming import DROP_NEWEST, DROP_OLDEST, FrameGrabber, process_stream
 except ImportError as e:
     st.error(f"Error importing video processing module: {e}")
     st.stop()
@@ -20,6 +31,33 @@ except ImportError as e:
 # --- Interfaz de Streamlit ---
 st.set_page_config(page_title="Análisis de Video: Conteo de Ciclistas", layout="wide", page_icon="🚴")
 
+# Detecciones guardadas por video, modelo y umbral para recontar sin volver a ejecutar YOLO
+detection_store = DetectionStore(Path(__file__).parent / "data" / "detections")
+# Resultados finales por video y configuración: volver a enviar el mismo video responde al instante
+result_cache = ResultCache(Path(__file__).parent / "data" / "results", max_bytes=64 * 1024 * 1024)
+# Métricas exportadas y perfiles de los análisis
+diagnostics_dir = Path(__file__).parent / "data" / "diagnostics"
+
+def stage_table(snapshot):
+    """Tabla en Markdown con los percentiles de duración de cada etapa."""
+    rows = ["| Etapa | Muestras | p50 (ms) | p95 (ms) | p99 (ms) | Total (s) |", "|---|---|---|---|---|---|"]
+    for name, summary in snapshot["stages"].items():
+        rows.append(f"| {name} | {summary['count']} | {summary['p50_ms']:.2f} | {summary['p95_ms']:.2f} | "
+                    f"{summary['p99_ms']:.2f} | {summary['total_s']:.2f} |")
+    return "\n".join(rows)
+
+# --- Carga del Modelo ---
+# El modelo y su servicio de inferencia son compartidos por todo el proceso: solo la primera
+# sesión paga la carga y el calentamiento, y los fotogramas de todas las sesiones que analizan
+# videos a la vez se agrupan en lotes en un único hilo dueño del modelo.
+model_error = None
+inference_service = None
+with st.spinner("Inicializando modelo YOLOv8... Esto puede tomar unos minutos la primera vez."):
+    try:
+        inference_service = get_inference_service(DEFAULT_WEIGHTS, max_batch_size=16, max_wait=0.01)
+    except IOError as e:
+        model_error = e
+
 # --- Barra Lateral (Sidebar) ---
 with st.sidebar:
     st.title("🚴 Análisis de Video IA")
@@ -29,11 +67,26 @@ with st.sidebar:
     )
 
     st.header("Configuración")
-    uploaded_file = st.file_uploader(
-        "Sube tu video",
-        type=["mp4", "avi", "mov"],
-        help="Sube un video para que la IA lo analice."
+    source_mode = st.radio(
+        "Fuente de Video",
+        ("Archivo de video", "Cámara o stream en vivo", "Video subido en bucle (simulación en vivo)"),
+        help="En vivo se analiza siempre el fotograma más reciente y se cuenta por ventanas de tiempo en lugar de mostrar el progreso."
     )
+    live_mode = source_mode != "Archivo de video"
+    stream_source = None
+    if source_mode == "Cámara o stream en vivo":
+        stream_source = st.text_input(
+            "Cámara o URL del Stream",
+            value="0",
+            help="Número de la cámara (0, 1...) o URL del stream (rtsp://, http://...)."
+        )
+    uploaded_file = None
+    if source_mode != "Cámara o stream en vivo":
+        uploaded_file = st.file_uploader(
+            "Sube tu video",
+            type=["mp4", "avi", "mov"],
+            help="Sube un video para que la IA lo analice."
+        )
 
     detection_threshold = st.slider(
         "Umbral de Confianza de Detección",
@@ -41,6 +94,12 @@ with st.sidebar:
         help="Un valor más alto significa que la IA debe estar más segura para detectar una bicicleta. Ayuda a reducir falsos positivos."
     )
 
+    batch_size = st.slider(
+        "Tamaño de Lote de Inferencia",
+        min_value=1, max_value=16, value=4, step=1,
+        help="Número de fotogramas que se analizan juntos en cada llamada al modelo. Un lote mayor aprovecha mejor la CPU."
+    )
+
     st.header("Parámetros de la Línea de Conteo")
     line_type = st.selectbox(
         "Tipo de Línea",
@@ -69,88 +128,536 @@ with st.sidebar:
             line_coords_percent['y2'] = st.slider("Punto 2 - Y (%)", 1, 99, 75)
 
 
+    with st.expander("Parámetros del Tracker"):
+        max_disappeared = st.slider(
+            "Fotogramas sin Detección Permitidos",
+            min_value=1, max_value=200, value=50, step=1,
+            help="Número de fotogramas que un ciclista puede pasar sin ser detectado antes de dejar de seguirlo."
+        )
+        max_distance = st.slider(
+            "Distancia Máxima de Asociación (px)",
+            min_value=10, max_value=300, value=75, step=5,
+            help="Distancia máxima entre fotogramas para considerar que una detección es el mismo ciclista."
+        )
+
+    with st.expander("Detección por Fotogramas Clave"):
+        detection_stride = st.slider(
+            "Intervalo de Detección (fotogramas)",
+            min_value=1, max_value=10, value=1, step=1,
+            help="El modelo se ejecuta cada N fotogramas; entre ellos se predice la posición de cada ciclista con su velocidad. 1 analiza todos los fotogramas."
+        )
+        adaptive_stride = st.checkbox(
+            "Detectar en cada fotograma cerca de la línea",
+            value=True,
+            help="Cuando un ciclista se acerca a la línea de conteo, se vuelve a detectar en cada fotograma para no perder el cruce."
+        )
+
+    with st.expander("Filtro de Movimiento"):
+        use_motion_gate = st.checkbox(
+            "Omitir fotogramas sin movimiento",
+            value=False,
+            help="Antes de ejecutar el modelo se compara cada fotograma (reducido) con el anterior; los fotogramas estáticos no se analizan."
+        )
+        motion_threshold = st.slider(
+            "Sensibilidad del Movimiento",
+            min_value=5, max_value=100, value=25, step=5,
+            help="Diferencia de intensidad para considerar que un píxel se movió. Un valor más alto ignora cambios leves de luz."
+        )
+        motion_min_area = st.slider(
+            "Área Mínima en Movimiento (%)",
+            min_value=0.05, max_value=5.0, value=0.2, step=0.05,
+            help="Porcentaje mínimo de la región que debe moverse para ejecutar el modelo."
+        )
+        motion_line_margin = st.slider(
+            "Margen alrededor de la línea (%)",
+            min_value=0, max_value=100, value=0, step=5,
+            help="Si es mayor que 0, solo se busca movimiento en una banda alrededor de la línea de conteo. 0 usa todo el fotograma."
+        )
+
+    with st.expander("Región de Inferencia"):
+        roi_mode = st.selectbox(
+            "Región Analizada por el Modelo",
+            ("Todo el fotograma", "Banda alrededor de la línea", "Región personalizada"),
+            help="El conteo solo depende de lo que pasa cerca de la línea: analizar solo esa región reduce mucho el cómputo por fotograma."
+        )
+        roi_percent = {}
+        if roi_mode == "Banda alrededor de la línea":
+            roi_percent['margin'] = st.slider(
+                "Ancho de la Banda (%)",
+                min_value=5, max_value=50, value=15, step=1,
+                help="Margen a cada lado de la línea, en porcentaje del lado mayor del video."
+            )
+        elif roi_mode == "Región personalizada":
+            col1, col2 = st.columns(2)
+            with col1:
+                roi_percent['x1'] = st.slider("Izquierda (%)", 0, 99, 0)
+                roi_percent['y1'] = st.slider("Arriba (%)", 0, 99, 25)
+            with col2:
+                roi_percent['x2'] = st.slider("Derecha (%)", 1, 100, 100)
+                roi_percent['y2'] = st.slider("Abajo (%)", 1, 100, 75)
+        inference_imgsz = st.select_slider(
+            "Tamaño de Entrada del Modelo (px)",
+            options=[320, 416, 512, 640, 800, 960, 1280], value=DEFAULT_IMGSZ,
+            help="Resolución a la que se escala cada región antes de la inferencia. Menor es más rápido; mayor detecta mejor ciclistas pequeños."
+        )
+        use_tiling = st.checkbox(
+            "Dividir en mosaicos",
+            value=False,
+            help="Analiza la región en mosaicos solapados, cada uno a la resolución del modelo. Útil en videos 4K donde los ciclistas ocupan pocos píxeles."
+        )
+        tile_size = st.slider(
+            "Tamaño del Mosaico (px)",
+            min_value=320, max_value=1920, value=960, step=160,
+            disabled=not use_tiling
+        )
+
+    with st.expander("Transmisión en Vivo"):
+        window_label = st.selectbox(
+            "Ventana de Conteo",
+            ("Por minuto", "Por hora"),
+            help="Los conteos en vivo se agrupan en ventanas de este tamaño, alineadas con el reloj."
+        )
+        window_seconds = 60 if window_label == "Por minuto" else 3600
+        latency_budget_ms = st.slider(
+            "Latencia Máxima (ms)",
+            min_value=50, max_value=3000, value=500, step=50,
+            help="Tiempo deseado entre la captura de un fotograma y la actualización del conteo. Los fotogramas que no alcanzan a analizarse a tiempo se descartan."
+        )
+        drop_policy = st.selectbox(
+            "Si el análisis no alcanza a la cámara",
+            ("Descartar los fotogramas más antiguos", "Descartar los fotogramas nuevos"),
+            help="Más antiguos: se analiza siempre lo más reciente (menor latencia). Nuevos: se conservan los fotogramas que ya esperaban en el búfer."
+        )
+        stream_buffer = st.slider(
+            "Búfer de Captura (fotogramas)",
+            min_value=1, max_value=30, value=1, step=1,
+            help="Fotogramas que pueden esperar a ser analizados. 1 conserva solo el más reciente."
+        )
+        st.caption("En vivo no se usan los fotogramas clave ni el filtro de movimiento.")
+
+    with st.expander("Visualización"):
+        refresh_rate = st.slider(
+            "Actualizaciones por Segundo",
+            min_value=1, max_value=30, value=5, step=1,
+            help="Frecuencia con la que se refrescan la vista previa y las métricas. El análisis no espera al navegador: los fotogramas intermedios no se muestran."
+        )
+        preview_width = st.slider(
+            "Ancho de la Vista Previa (px)",
+            min_value=320, max_value=1920, value=640, step=160,
+            help="Los fotogramas se reducen a este ancho antes de enviarse al navegador."
+        )
+        log_size = st.slider(
+            "Entradas del Registro",
+            min_value=10, max_value=1000, value=200, step=10,
+            help="Número máximo de cruces que se muestran en el registro; los más antiguos se descartan."
+        )
+
+    with st.expander("Diagnóstico"):
+        show_stage_metrics = st.checkbox(
+            "Mostrar tiempos por etapa",
+            value=True,
+            help="Muestra los percentiles p50/p95/p99 de decodificación, inferencia, tracker, conteo, anotación e interfaz para encontrar el cuello de botella."
+        )
+        metrics_format = st.selectbox(
+            "Exportar Métricas",
+            ("No exportar", "JSON", "Prometheus"),
+            help="Escribe las métricas en data/diagnostics/ durante el análisis y al terminar."
+        )
+        enable_profiler = st.checkbox(
+            "Perfilar el procesamiento",
+            value=False,
+            help="Perfila los hilos del pipeline (pyinstrument si está instalado, si no cProfile) y guarda el informe en data/diagnostics/. Hace el análisis más lento."
+        )
+
+    reuse_detections = st.checkbox(
+        "Reutilizar detecciones guardadas",
+        value=True,
+        help="Si este video ya se analizó con el mismo umbral, se recuenta con la nueva línea o parámetros del tracker sin volver a ejecutar el modelo."
+    )
+
     process_button = st.button("🚀 Iniciar Análisis")
 
+    if model_error is not None:
+        st.error(f"No se pudo cargar el modelo: {model_error}")
+    else:
+        for (weights, imgsz, device), timing in model_timings().items():
+            st.caption(
+                f"Modelo `{weights}` ({imgsz}px) cargado en {timing['load_s']:.2f}s, "
+                f"calentamiento en {timing['warmup_s']:.2f}s."
+            )
+        service_stats = inference_service.stats
+        if service_stats["batches"]:
+            st.caption(
+                f"Servicio de inferencia: {service_stats['sessions']} sesiones activas, "
+                f"lote medio de {service_stats['mean_batch_size']:.1f} fotogramas."
+            )
+
+def build_inference_geometry(line_coords, w, h):
+    """Geometría de la inferencia elegida en la barra lateral, o None para todo el fotograma."""
+    geometry_options = {"imgsz": inference_imgsz, "tile_size": tile_size if use_tiling else None}
+    if roi_mode == "Banda alrededor de la línea":
+        margin = int(max(w, h) * roi_percent['margin'] / 100)
+        return InferenceGeometry.around_line(line_coords, w, h, margin, **geometry_options)
+    if roi_mode == "Región personalizada":
+        roi = (int(w * roi_percent['x1'] / 100), int(h * roi_percent['y1'] / 100),
+               int(w * roi_percent['x2'] / 100), int(h * roi_percent['y2'] / 100))
+        return InferenceGeometry(roi=roi, **geometry_options)
+    if inference_imgsz != DEFAULT_IMGSZ or use_tiling:
+        return InferenceGeometry(**geometry_options)
+    return None
+
+def window_row(window):
+    """Fila en Markdown con los conteos de una ventana de tiempo."""
+    direction_counts = window.counts[DEFAULT_LINE_NAME]
+    return (f"| {time.strftime('%Y-%m-%d %H:%M', time.localtime(window.start))} | {window.count} | "
+            f"{direction_counts['in']} | {direction_counts['out']} | {window.frames} |")
+
 # --- Área Principal ---
 st.title("Panel de Control de Conteo de Ciclistas")
 
-if uploaded_file is None:
+if uploaded_file is None and source_mode != "Cámara o stream en vivo":
     st.warning("Por favor, sube un archivo de video usando el panel de la izquierda para comenzar.")
 
-if uploaded_file and process_button:
-    # Guardar archivo subido a un archivo temporal
-    tfile = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-    tfile.write(uploaded_file.read())
-    video_path = tfile.name
+if live_mode and process_button and (stream_source or uploaded_file):
+    video_path = None
+    if uploaded_file is not None:
+        # El video subido hace de cámara: se reproduce en bucle a su velocidad nativa
+        suffix = Path(uploaded_file.name).suffix.lower() or ".mp4"
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tfile:
+            uploaded_file.seek(0)
+            copy_and_hash(uploaded_file, tfile)
+        video_path = tfile.name
 
-    # Obtener dimensiones del video y calcular coordenadas de la línea
-    cap = cv2.VideoCapture(video_path)
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    cap.release()
+    st.button("⏹️ Detener", help="Detiene el análisis en vivo.")
+    st_frame = st.empty()
+    st.markdown("---")
+    st.subheader("Conteo en Vivo")
+    metrics_placeholder = st.empty()
+    windows_placeholder = st.empty()
+    stages_placeholder = st.empty()
+    log_placeholder = st.empty()
 
-    # Calcular coordenadas de la línea en píxeles
-    if line_type == "Horizontal":
-        y = int(h * (line_coords_percent['y1'] / 100))
-        line_coords = ((0, y), (w, y))
-    elif line_type == "Vertical":
-        x = int(w * (line_coords_percent['x1'] / 100))
-        line_coords = ((x, 0), (x, h))
-    elif line_type == "Inclinada":
-        x1 = int(w * (line_coords_percent['x1'] / 100))
-        y1 = int(h * (line_coords_percent['y1'] / 100))
-        x2 = int(w * (line_coords_percent['x2'] / 100))
-        y2 = int(h * (line_coords_percent['y2'] / 100))
-        line_coords = ((x1, y1), (x2, y2))
-    else: # Fallback
-        line_coords = ((0, h // 2), (w, h // 2))
+    try:
+        start_time = time.time()
+        grabber = FrameGrabber(
+            video_path or stream_source,
+            policy=DROP_OLDEST if drop_policy == "Descartar los fotogramas más antiguos" else DROP_NEWEST,
+            buffer_size=stream_buffer,
+            loop=video_path is not None
+        )
+        # Hasta que `process_stream` empiece a consumirlo, la fuente se libera aquí si algo falla
+        try:
+            w, h = grabber.info.width, grabber.info.height
+            line_coords = line_coords_from_percent(line_type, line_coords_percent, w, h)
+            latency_budget = latency_budget_ms / 1000
+
+            session_service = None
+            if inference_service is not None:
+                session_service = get_inference_service(DEFAULT_WEIGHTS, inference_imgsz, max_batch_size=16,
+                                                        max_wait=0.01)
+            inference_geometry = build_inference_geometry(line_coords, w, h)
+        except Exception:
+            grabber.stop()
+            raise
+        metrics = PipelineMetrics()
+        results = process_stream(
+            grabber,
+            line_coords=line_coords,
+            detection_threshold=detection_threshold,
+            window_seconds=window_seconds,
+            latency_budget=latency_budget,
+            max_disappeared=max_disappeared,
+            max_distance=max_distance,
+            inference_service=session_service,
+            inference_geometry=inference_geometry,
+            metrics=metrics
+        )
 
+        # Solo se muestran las últimas ventanas: en una transmisión de días no se acumulan todas
+        closed_windows = deque(maxlen=24)
+
+        def log_live(result):
+            closed_windows.extend(result.closed_windows)
+            if not result.events:
+                return None
+            direction_counts = result.counts[DEFAULT_LINE_NAME]
+            return (
+                f"**Hora:** {time.strftime('%H:%M:%S')} | **Conteo Actual:** {result.count} | "
+                f"**Entradas:** {direction_counts['in']} | **Salidas:** {direction_counts['out']} | "
+                f"**Latencia:** {result.latency * 1000:.0f} ms"
+            )
+
+        runner = BackgroundRunner(results, log_formatter=log_live, log_size=log_size).start()
+        try:
+            shown = 0
+            finished = False
+            while not finished:
+                finished = runner.wait(1 / refresh_rate)
+                result, received = runner.poll()
+                if result is None or received == shown:
+                    continue
+                shown = received
+                with metrics.time("ui"):
+                    snapshot = metrics.snapshot()
+                    latency = snapshot["stages"].get("latency", {})
+                    grabber_stats = grabber.stats
+                    window = result.window
+                    window_text = ""
+                    if window is not None:
+                        window_counts = window.counts[DEFAULT_LINE_NAME]
+                        window_text = (f"**{window_label}:** {window.count} "
+                                       f"({window_counts['in']} entradas / {window_counts['out']} salidas) | ")
+                    metrics_placeholder.markdown(
+                        f"{window_text}**Total:** {result.count} | "
+                        f"**Latencia p95:** {latency.get('p95_ms', 0):.0f} ms de {latency_budget_ms} ms | "
+                        f"**Fuera de presupuesto:** {result.over_budget} | "
+                        f"**Descartados:** {grabber_stats['drop_ratio']*100:.0f}% | "
+                        f"**Velocidad:** {snapshot['recent_fps']:.1f} FPS | "
+                        f"**Tiempo:** {time.time() - start_time:.0f}s"
+                    )
+                    if closed_windows:
+                        header = ["| Ventana | Ciclistas | Entradas | Salidas | Fotogramas |", "|---|---|---|---|---|"]
+                        windows_placeholder.markdown("\n".join(header + [window_row(item)
+                                                                         for item in reversed(list(closed_windows))]))
+                    if show_stage_metrics:
+                        stages_placeholder.markdown(stage_table(snapshot))
+                    log_placeholder.markdown(runner.log.render())
+                    if result.frame is not None:
+                        st_frame.image(preview_image(result.frame, preview_width), channels="RGB",
+                                       use_column_width=True)
+        finally:
+            # Al detener (o al volver a ejecutarse el script) se cierra la fuente
+            runner.stop()
+        if runner.error is not None:
+            raise runner.error
+        st.info("La fuente de video terminó.")
+
+    except IOError as e:
+        st.error(f"Error en la transmisión en vivo: {e}")
+    except Exception as e:
+        st.error(f"Ocurrió un error inesperado: {e}")
+    finally:
+        if video_path is not None and os.path.exists(video_path):
+            os.remove(video_path)
+elif uploaded_file and process_button:
+    # Copiar el archivo subido a disco por bloques mientras se calcula su hash, sin leerlo entero en memoria
+    suffix = Path(uploaded_file.name).suffix.lower() or ".mp4"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tfile:
+        uploaded_file.seek(0)
+        video_hash = copy_and_hash(uploaded_file, tfile)
+    video_path = tfile.name
 
     # Crear placeholders para la salida
     st_frame = st.empty()
     st.markdown("---")
     st.subheader("Registro de Análisis en Tiempo Real")
+    metrics_placeholder = st.empty()
+    stages_placeholder = st.empty()
     log_placeholder = st.empty()
     progress_bar = st.progress(0)
 
     try:
         start_time = time.time()
-        
-        # Show initial status
-        with st.spinner("Inicializando modelo YOLOv8... Esto puede tomar unos minutos la primera vez."):
-            processor = process_video(
-                video_path=video_path,
-                line_coords=line_coords,
-                detection_threshold=detection_threshold
+
+        # Leer los metadatos del video una sola vez y calcular la línea en píxeles
+        video_info = probe_video(video_path)
+        w, h = video_info.width, video_info.height
+        line_coords = line_coords_from_percent(line_type, line_coords_percent, w, h)
+
+        motion_gate = None
+        if use_motion_gate:
+            roi = None
+            if motion_line_margin > 0:
+                margin = int(max(w, h) * motion_line_margin / 100)
+                roi = roi_around_line(line_coords, w, h, margin)
+            motion_gate = MotionGate(
+                diff_threshold=motion_threshold,
+                min_motion_ratio=motion_min_area / 100,
+                roi=roi
             )
 
-        log_entries = []
-        final_count = 0
-        for frame, count, progress in processor:
-            # Actualizar la barra de progreso
-            progress_bar.progress(progress)
-
-            # Crear y añadir el registro
-            elapsed_time = f"{time.time() - start_time:.2f}s"
-            log_text = f"**Progreso:** {int(progress*100)}% | **Conteo Actual:** {count} | **Tiempo:** {elapsed_time}"
-            log_entries.insert(0, log_text) # Insertar al principio para orden descendente
-
-            # Mostrar los registros
-            log_placeholder.markdown("\n\n".join(log_entries))
-
-            # Mostrar el fotograma procesado
-            st_frame.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), channels="RGB", use_column_width=True)
-            final_count = count
-
-        end_time = time.time()
-        total_time = end_time - start_time
-
-        # Estado final
-        st.success(f"¡Análisis completado en {total_time:.2f} segundos!")
-        final_log = f"**FINALIZADO** | **Conteo Final:** {final_count} | **Tiempo Total:** {total_time:.2f}s"
-        log_entries.insert(0, final_log)
-        log_placeholder.markdown("\n\n".join(log_entries))
-        progress_bar.progress(1.0)
+        keyframe_policy = None
+        if detection_stride > 1:
+            keyframe_policy = KeyframePolicy(stride=detection_stride, adaptive=adaptive_stride)
+
+        inference_geometry = build_inference_geometry(line_coords, w, h)
+
+        result_key = ResultCache.make_key(
+            video_hash, DEFAULT_WEIGHTS, detection_threshold, line_coords,
+            tracker={"max_disappeared": max_disappeared, "max_distance": max_distance},
+            motion_gate=motion_gate.config() if motion_gate is not None else None,
+            keyframes=keyframe_policy.config() if keyframe_policy is not None else None,
+            geometry=inference_geometry.config() if inference_geometry is not None else None
+        )
+        cached = result_cache.get(result_key)
+
+        def crossing_text(crossing):
+            return (
+                f"**Fotograma:** {crossing['frame']} | **Conteo Actual:** {crossing['count']} | "
+                f"**Entradas:** {crossing['in']} | **Salidas:** {crossing['out']} | "
+                f"**Tiempo:** {crossing['elapsed_s']:.2f}s"
+            )
+
+        if cached is not None:
+            # Mismo video y misma configuración: mostrar el resultado guardado sin procesar nada
+            st.info("Este video ya se analizó con la misma configuración: mostrando el resultado guardado.")
+            log = LogBuffer(log_size)
+            for crossing in cached["crossings"]:
+                log.add(crossing_text(crossing))
+            direction_counts = cached["counts"][DEFAULT_LINE_NAME]
+            metrics_placeholder.markdown(
+                f"**Progreso:** 100% | **Conteo Actual:** {cached['count']} | "
+                f"**Entradas:** {direction_counts['in']} | **Salidas:** {direction_counts['out']}"
+            )
+            log.add(f"**FINALIZADO** | **Conteo Final:** {cached['count']} | "
+                    f"**Tiempo Original:** {cached['processing_s']:.2f}s")
+            log_placeholder.markdown(log.render())
+            progress_bar.progress(1.0)
+            st.success("¡Resultado recuperado de la caché!")
+        else:
+            stored = None
+            if reuse_detections:
+                stored = detection_store.load(
+                    detection_key(detection_store, video_hash, DEFAULT_WEIGHTS, detection_threshold, motion_gate,
+                                  keyframe_policy, inference_geometry))
+
+            crossings = []
+
+            def log_crossings(result):
+                # Solo los fotogramas con cruces van al registro (y al resultado guardado en caché)
+                if not result.events:
+                    return None
+                direction_counts = result.counts[DEFAULT_LINE_NAME]
+                crossings.append({
+                    "frame": result.frame_index,
+                    "count": result.count,
+                    "in": direction_counts["in"],
+                    "out": direction_counts["out"],
+                    "elapsed_s": round(time.time() - start_time, 3),
+                })
+                return crossing_text(crossings[-1])
+
+            metrics = PipelineMetrics()
+            metrics_path = None
+            if metrics_format != "No exportar":
+                suffix = ".prom" if metrics_format == "Prometheus" else ".json"
+                metrics_path = diagnostics_dir / f"metrics-{video_hash[:12]}{suffix}"
+            profile_path = diagnostics_dir / f"profile-{video_hash[:12]}.txt" if enable_profiler else None
+
+            if stored is not None:
+                # Recontar desde las detecciones guardadas, sin decodificar el video ni ejecutar YOLO
+                st.info("Se encontraron detecciones guardadas para este video: recontando sin ejecutar el modelo.")
+                results = replay_detections(
+                    stored,
+                    line_coords=line_coords,
+                    max_disappeared=max_disappeared,
+                    max_distance=max_distance,
+                    metrics=metrics
+                )
+            else:
+                # Servicio compartido del modelo con el tamaño de entrada elegido
+                session_service = None
+                if inference_service is not None:
+                    session_service = get_inference_service(DEFAULT_WEIGHTS, inference_imgsz, max_batch_size=16,
+                                                            max_wait=0.01)
+                results = process_video(
+                    video_path=video_path,
+                    line_coords=line_coords,
+                    detection_threshold=detection_threshold,
+                    batch_size=batch_size,
+                    max_disappeared=max_disappeared,
+                    max_distance=max_distance,
+                    detection_store=detection_store if reuse_detections else None,
+                    video_hash=video_hash,
+                    motion_gate=motion_gate,
+                    keyframe_policy=keyframe_policy,
+                    video_info=video_info,
+                    inference_service=session_service,
+                    inference_geometry=inference_geometry,
+                    metrics=metrics,
+                    metrics_path=metrics_path,
+                    profile_path=profile_path
+                )
+
+            # El análisis corre en segundo plano; aquí solo se muestra su estado a ritmo fijo
+            runner = BackgroundRunner(results, log_formatter=log_crossings, log_size=log_size).start()
+            final_count = 0
+            final_counts = {DEFAULT_LINE_NAME: {"in": 0, "out": 0}}
+            final_frames = 0
+            try:
+                shown = 0
+                finished = False
+                while not finished:
+                    finished = runner.wait(1 / refresh_rate)
+                    result, received = runner.poll()
+                    if result is None or received == shown:
+                        continue
+                    shown = received
+                    with metrics.time("ui"):
+                        if result.progress is not None:
+                            progress_bar.progress(result.progress)
+                            progress_text = f"**Progreso:** {int(result.progress*100)}%"
+                        else:
+                            progress_text = f"**Fotograma:** {result.frame_index}"
+                        direction_counts = result.counts[DEFAULT_LINE_NAME]
+                        snapshot = metrics.snapshot()
+                        metrics_placeholder.markdown(
+                            f"{progress_text} | **Conteo Actual:** {result.count} | "
+                            f"**Entradas:** {direction_counts['in']} | **Salidas:** {direction_counts['out']} | "
+                            f"**Velocidad:** {snapshot['recent_fps']:.1f} FPS | "
+                            f"**Objetos Seguidos:** {snapshot['active_tracks']} | "
+                            f"**Colas:** {snapshot['queue_depths']} | **Tiempo:** {time.time() - start_time:.2f}s"
+                        )
+                        if show_stage_metrics:
+                            stages_placeholder.markdown(stage_table(snapshot))
+                        log_placeholder.markdown(runner.log.render())
+                        if result.frame is not None:
+                            st_frame.image(preview_image(result.frame, preview_width), channels="RGB",
+                                           use_column_width=True)
+                    final_count = result.count
+                    final_counts = result.counts
+                    final_frames = result.frame_index
+            finally:
+                runner.stop()
+            if runner.error is not None:
+                raise runner.error
+
+            end_time = time.time()
+            total_time = end_time - start_time
+            result_cache.put(result_key, {
+                "count": final_count,
+                "counts": final_counts,
+                "crossings": crossings,
+                "frames": final_frames,
+                "processing_s": round(total_time, 3),
+            })
+
+            # Estado final
+            st.success(f"¡Análisis completado en {total_time:.2f} segundos!")
+            runner.log.add(f"**FINALIZADO** | **Conteo Final:** {final_count} | **Tiempo Total:** {total_time:.2f}s")
+            if keyframe_policy is not None and stored is None:
+                keyframe_stats = keyframe_policy.stats
+                runner.log.add((
+                    f"**Fotogramas Clave:** {keyframe_stats['keyframes']} de {keyframe_stats['frames']} "
+                    f"fotogramas con detección ({keyframe_stats['keyframe_ratio']*100:.1f}%)"
+                ))
+            if motion_gate is not None and stored is None:
+                gate_stats = motion_gate.stats
+                runner.log.add((
+                    f"**Filtro de Movimiento:** {gate_stats['active']} de {gate_stats['frames']} fotogramas "
+                    f"analizados por el modelo ({gate_stats['skip_ratio']*100:.1f}% omitidos)"
+                ))
+            snapshot = metrics.snapshot()
+            runner.log.add(f"**Velocidad Media:** {snapshot['fps']:.1f} FPS en {snapshot['frames']} fotogramas")
+            if show_stage_metrics:
+                stages_placeholder.markdown(stage_table(snapshot))
+            if metrics_path is not None:
+                metrics.export(metrics_path)
+                runner.log.add(f"**Métricas:** `{metrics_path}`")
+            if profile_path is not None and profile_path.exists():
+                runner.log.add(f"**Perfil:** `{profile_path}`")
+            log_placeholder.markdown(runner.log.render())
+            progress_bar.progress(1.0)
 
         st.balloons()
 
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Procesa en lote videos grabados sin interfaz, repartidos en un grupo de procesos.
+
+Cada proceso carga su propio modelo una sola vez y usa el camino rápido de
+`process_video` (sin anotar fotogramas). Por cada video se escribe un JSON con los
+conteos, los cruces con su marca de tiempo y el rendimiento, y al final un resumen en
+CSV. Los videos que ya tienen resultado con los mismos parámetros se omiten, por lo
+que el proceso puede reanudarse después de una interrupción.
+
+Con --split, los videos se procesan uno tras otro, cada uno dividido en segmentos que
+se reparten entre los procesos (útil para pocas grabaciones de varias horas). Con
+--events-jsonl los cruces no se acumulan en el JSON sino que se escriben a medida que
+ocurren en un archivo JSON Lines junto al resultado, para grabaciones de días.
+
+Ejemplos:
+    python batch_process.py data/ --line h:50 --workers 4
+    python batch_process.py grabacion_larga.mp4 --line v:50 --workers 8 --split
+    python batch_process.py "grabaciones/*.mp4" --line 10,80,90,60 --output resultados/
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from event_sink import JsonlEventSink
+from video_processing import DEFAULT_WEIGHTS, line_coords_from_percent, probe_video, process_video
+from segments import init_worker, process_video_segments
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+def parse_line_spec(spec):
+    """
+    Convierte la especificación de línea de la línea de comandos al formato de la aplicación.
+
+    Formatos (en porcentaje del ancho/alto del video):
+        h:Y            línea horizontal a Y% desde arriba
+        v:X            línea vertical a X% desde la izquierda
+        X1,Y1,X2,Y2    línea inclinada entre dos puntos
+
+    Returns:
+        tuple: (line_type, line_coords_percent) como los usa `line_coords_from_percent`.
+    """
+    try:
+        if spec[:2].lower() == "h:":
+            return "Horizontal", {"y1": float(spec[2:])}
+        if spec[:2].lower() == "v:":
+            return "Vertical", {"x1": float(spec[2:])}
+        x1, y1, x2, y2 = (float(value) for value in spec.split(","))
+        return "Inclinada", {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Especificación de línea no válida: '{spec}'. Use h:Y, v:X o X1,Y1,X2,Y2.")
+
+def find_videos(inputs):
+    """Expande directorios y patrones glob a una lista ordenada de videos sin duplicados."""
+    videos = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.iterdir()
+        else:
+            candidates = (Path(match) for match in glob.glob(item, recursive=True))
+        videos.update(p.resolve() for p in candidates if p.is_file() and p.suffix.lower() in VIDEO_EXTENSIONS)
+    return sorted(videos)
+
+def result_path(output_dir, video_path):
+    """Ruta del JSON de resultados de un video (única aunque dos videos tengan el mismo nombre)."""
+    digest = hashlib.sha1(str(video_path).encode("utf-8")).hexdigest()[:10]
+    return Path(output_dir) / f"{Path(video_path).stem}-{digest}.json"
+
+def events_path_for(output_dir, video_path):
+    """Ruta del archivo JSON Lines con los cruces de un video, junto a su resultado."""
+    return result_path(output_dir, video_path).with_suffix(".events.jsonl")
+
+def load_result(path, settings):
+    """Retorna el resultado guardado si existe y se obtuvo con los mismos parámetros."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return result if result.get("settings") == settings else None
+
+def _write_json(path, data):
+    # Escribir a un archivo temporal y renombrarlo: un resultado a medias nunca cuenta como terminado
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _probe(video_path):
+    try:
+        return probe_video(video_path)
+    except IOError:
+        raise IOError(f"Error al abrir el archivo de video: {video_path}")
+
+def _crossing(event, fps):
+    return {
+        "frame": event.frame_index,
+        "time_s": round(event.frame_index / fps, 3) if fps else None,
+        "object_id": event.object_id,
+        "line": event.name,
+        "direction": event.direction,
+    }
+
+def _result(video_path, settings, width, height, fps, frames, count, counts, crossings, elapsed):
+    return {
+        "video": str(video_path),
+        "settings": settings,
+        "width": width,
+        "height": height,
+        "video_fps": fps,
+        "frames": frames,
+        "count": count,
+        "counts": counts,
+        "crossings": crossings,
+        "processing_s": round(elapsed, 3),
+        "throughput_fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+def _open_event_sink(events_path, fps):
+    # Un intento anterior interrumpido pudo dejar cruces a medias: se empieza de cero
+    Path(events_path).unlink(missing_ok=True)
+    return JsonlEventSink(events_path, fps)
+
+def _stream_crossings(result, events_path):
+    result["crossings"] = None
+    result["crossings_file"] = str(events_path)
+    return result
+
+def process_one(video_path, settings, profile_path=None, events_path=None):
+    """
+    Procesa un video completo sin anotar y retorna su resultado como diccionario, incluidas
+    las métricas por etapa. Con `profile_path` se perfila el procesamiento y el informe se
+    escribe en ese archivo. Con `events_path` los cruces se escriben en ese archivo JSON
+    Lines a medida que ocurren en lugar de acumularse en el resultado.
+    """
+    info = _probe(video_path)
+    width, height, fps = info.width, info.height, info.fps
+    line_coords = line_coords_from_percent(settings["line_type"], settings["line_percent"], width, height)
+    event_sink = _open_event_sink(events_path, fps) if events_path else None
+    start = time.perf_counter()
+    frames = 0
+    last = None
+    crossings = []
+    try:
+        for result in process_video(
+            video_path=str(video_path),
+            line_coords=line_coords,
+            detection_threshold=settings["threshold"],
+            batch_size=settings["batch_size"],
+            model_weights=settings["model"],
+            annotate=False,
+            video_info=info,
+            profile_path=profile_path,
+            event_sink=event_sink,
+        ):
+            frames = result.frame_index
+            last = result
+            if event_sink is None:
+                crossings.extend(_crossing(event, fps) for event in result.events)
+    finally:
+        if event_sink is not None:
+            event_sink.close()
+    elapsed = time.perf_counter() - start
+
+    result = _result(video_path, settings, width, height, fps, frames, last.count if last else 0,
+                     last.counts if last else {}, crossings, elapsed)
+    result["metrics"] = last.metrics.snapshot() if last else None
+    return _stream_crossings(result, events_path) if events_path else result
+
+def process_one_split(video_path, settings, workers, threads, events_path=None, profile_path=None):
+    """
+    Procesa un video dividido en segmentos paralelos y retorna su resultado como diccionario.
+    Con `events_path` los cruces se escriben en ese archivo JSON Lines en lugar del resultado.
+    Con `profile_path` se perfila cada segmento (un informe por segmento junto a esa ruta).
+    """
+    width, height, fps, _ = _probe(video_path)
+    line_coords = line_coords_from_percent(settings["line_type"], settings["line_percent"], width, height)
+    merged = process_video_segments(
+        str(video_path), line_coords, settings["threshold"], workers=workers, threads_per_worker=threads,
+        batch_size=settings["batch_size"], model_weights=settings["model"], profile_path=profile_path)
+    if events_path:
+        with _open_event_sink(events_path, fps) as event_sink:
+            event_sink.write(merged["events"])
+        crossings = None
+    else:
+        crossings = [_crossing(event, fps) for event in merged["events"]]
+    result = _result(video_path, settings, width, height, fps, merged["frames"], merged["count"],
+                     merged["counts"], crossings, merged["elapsed"])
+    return _stream_crossings(result, events_path) if events_path else result
+
+def write_summary(path, results):
+    """Escribe el resumen CSV con una fila por video."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["video", "frames", "count", "count_in", "count_out", "processing_s", "throughput_fps"])
+        for result in results:
+            direction_counts = next(iter(result["counts"].values()), {"in": 0, "out": 0})
+            writer.writerow([result["video"], result["frames"], result["count"], direction_counts["in"],
+                             direction_counts["out"], result["processing_s"], result["throughput_fps"]])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Directorios, videos o patrones glob a procesar.")
+    parser.add_argument("--line", required=True, type=parse_line_spec,
+                        help="Línea de conteo: h:Y, v:X o X1,Y1,X2,Y2 (en porcentaje).")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Umbral de confianza de detección.")
+    parser.add_argument("--batch-size", type=int, default=4, help="Fotogramas por llamada al modelo.")
+    parser.add_argument("--model", default=DEFAULT_WEIGHTS, help="Pesos del modelo YOLOv8.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="Número de procesos en paralelo.")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Hilos de PyTorch por proceso (por defecto, núcleos / procesos).")
+    parser.add_argument("--output", default="batch_results", help="Directorio de resultados.")
+    parser.add_argument("--force", action="store_true", help="Reprocesar aunque ya exista el resultado.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar el procesamiento de cada video y guardar el informe junto a su resultado.")
+    parser.add_argument("--split", action="store_true",
+                        help="Dividir cada video en segmentos procesados en paralelo en lugar de "
+                             "repartir los videos entre los procesos.")
+    parser.add_argument("--events-jsonl", action="store_true",
+                        help="Escribir los cruces de cada video en un archivo .events.jsonl junto a su "
+                             "resultado a medida que ocurren, en lugar de acumularlos en el JSON.")
+    args = parser.parse_args()
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        print("No se encontraron videos.")
+        sys.exit(1)
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    line_type, line_percent = args.line
+    settings = {
+        "line_type": line_type,
+        "line_percent": line_percent,
+        "threshold": args.threshold,
+        "batch_size": args.batch_size,
+        "model": args.model,
+    }
+
+    results = {}
+    pending = []
+    for video in videos:
+        previous = None if args.force else load_result(result_path(output_dir, video), settings)
+        if previous is not None:
+            results[video] = previous
+        else:
+            pending.append(video)
+    print(f"{len(videos)} videos: {len(results)} ya procesados, {len(pending)} pendientes.")
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    start = time.perf_counter()
+    processed_frames = 0
+    failures = 0
+    if pending and args.split:
+        for video in pending:
+            try:
+                profile_path = result_path(output_dir, video).with_suffix(".profile.txt") if args.profile else None
+                events_path = events_path_for(output_dir, video) if args.events_jsonl else None
+                result = process_one_split(video, settings, args.workers, threads, events_path, profile_path)
+            except Exception as e:
+                failures += 1
+                print(f"✗ {video}: {e}")
+                continue
+            _write_json(result_path(output_dir, video), result)
+            results[video] = result
+            processed_frames += result["frames"]
+            print(f"✓ {video.name}: {result['count']} ciclistas, {result['frames']} fotogramas, "
+                  f"{result['throughput_fps']:.1f} FPS")
+    elif pending:
+        # "spawn" evita heredar el estado de hilos de PyTorch del proceso principal
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                                 initializer=init_worker, initargs=(args.model, threads)) as executor:
+            futures = {}
+            for video in pending:
+                profile_path = result_path(output_dir, video).with_suffix(".profile.txt") if args.profile else None
+                events_path = events_path_for(output_dir, video) if args.events_jsonl else None
+                futures[executor.submit(process_one, video, settings, profile_path, events_path)] = video
+            for future in as_completed(futures):
+                video = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"✗ {video}: {e}")
+                    continue
+                _write_json(result_path(output_dir, video), result)
+                results[video] = result
+                processed_frames += result["frames"]
+                print(f"✓ {video.name}: {result['count']} ciclistas, {result['frames']} fotogramas, "
+                      f"{result['throughput_fps']:.1f} FPS")
+    elapsed = time.perf_counter() - start
+
+    write_summary(output_dir / "summary.csv", [results[video] for video in videos if video in results])
+    print(f"\nResumen escrito en {output_dir / 'summary.csv'}")
+    if processed_frames:
+        print(f"Procesados {processed_frames} fotogramas en {elapsed:.1f}s: "
+              f"{processed_frames / elapsed:.1f} FPS agregados con {args.workers} procesos.")
+    if failures:
+        print(f"{failures} videos fallaron; vuelva a ejecutar para reintentarlos.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Prueba de memoria de una ejecución larga (días) del seguimiento y conteo.
+
+Simula una cámara fija durante `--hours` horas a `--fps` fotogramas por segundo: los
+ciclistas llegan según un proceso de Poisson (`--cyclists-per-hour`) y atraviesan el
+cuadro cruzando la línea vertical del centro. Las cajas se pasan directamente al mismo
+`_FrameAnalyzer` que usa `process_video`, junto con los conteos por ventanas, las métricas
+del pipeline y un `JsonlEventSink` en un archivo temporal, sin decodificar video ni usar
+el modelo.
+
+Con `tracemalloc` se mide la memoria de Python (incluidos los arreglos de NumPy) retenida
+por el pipeline al final de cada hora simulada, junto con los objetos seguidos, los IDs
+con estado de conteo y la capacidad del historial de trayectos. Durante el calentamiento
+(`--warmup` horas) se llenan los histogramas de métricas y las cachés de NumPy; después la
+memoria debe quedar plana: el script termina con código 1 si la mediana del último cuarto
+de la ejecución supera a la del primero en más de `--tolerance`.
+
+Uso:
+    python benchmarks/memory_benchmark.py
+    python benchmarks/memory_benchmark.py --hours 72 --fps 1 --cyclists-per-hour 600
+    python benchmarks/memory_benchmark.py --hours 24 --output benchmarks/memory.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from counting import CountingLine, CrossingCounter
+from event_sink import JsonlEventSink
+from metrics import PipelineMetrics
+from streaming import WindowedCounts
+from video_processing import DEFAULT_LINE_NAME, _FrameAnalyzer
+
+BOX_SIZE = (40, 80)
+
+class CyclistStream:
+    """
+    Ciclistas que llegan sin fin según un proceso de Poisson y cruzan el cuadro de un
+    borde lateral al otro a velocidad constante. Solo se guardan los que están en cuadro.
+
+    Args:
+        width (int), height (int): Tamaño del cuadro.
+        per_frame (float): Llegadas esperadas por fotograma.
+        speed (tuple): Rango de velocidades en px/fotograma.
+        seed (int): Semilla del generador aleatorio.
+    """
+    def __init__(self, width, height, per_frame, speed, seed=0):
+        self.width = width
+        self.height = height
+        self.per_frame = per_frame
+        self.speed = speed
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.vx = np.zeros(0)
+        self.crossed = 0
+
+    def step(self):
+        """Avanza un fotograma y retorna las cajas (x1, y1, x2, y2) de los ciclistas en cuadro."""
+        arrivals = self.rng.poisson(self.per_frame)
+        if arrivals:
+            direction = self.rng.choice([-1.0, 1.0], arrivals)
+            self.x = np.concatenate([self.x, np.where(direction > 0, 0.0, float(self.width))])
+            self.y = np.concatenate([self.y, self.rng.uniform(BOX_SIZE[1], self.height - BOX_SIZE[1], arrivals)])
+            self.vx = np.concatenate([self.vx, direction * self.rng.uniform(*self.speed, arrivals)])
+
+        center = self.width / 2
+        previous = self.x
+        self.x = self.x + self.vx
+        self.crossed += int(np.count_nonzero((previous - center) * (self.x - center) < 0))
+
+        visible = (self.x >= 0) & (self.x <= self.width)
+        self.x, self.y, self.vx = self.x[visible], self.y[visible], self.vx[visible]
+        half_w, half_h = BOX_SIZE[0] / 2, BOX_SIZE[1] / 2
+        return np.stack([self.x - half_w, self.y - half_h, self.x + half_w, self.y + half_h],
+                        axis=1).astype(np.int32)
+
+def _mb(size):
+    return round(size / 1e6, 3)
+
+def _traced_memory():
+    # Sin contar lo que asigna este script (generador de ciclistas y puntos de control), que
+    # crece con las horas simuladas aunque el pipeline no lo haga
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__)])
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+def run(args, events_path):
+    line = CountingLine(DEFAULT_LINE_NAME, (args.width // 2, 0), (args.width // 2, args.height))
+    counter = CrossingCounter([line])
+    metrics = PipelineMetrics()
+    analyzer = _FrameAnalyzer(counter, args.max_disappeared, args.max_distance, metrics=metrics)
+    windows = WindowedCounts(args.window, [line])
+    stream = CyclistStream(args.width, args.height, args.cyclists_per_hour / 3600 / args.fps, args.speed, args.seed)
+
+    frames_per_hour = int(round(3600 * args.fps))
+    checkpoints = []
+    closed_windows = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    with JsonlEventSink(events_path, fps=args.fps) as sink:
+        for hour in range(1, args.hours + 1):
+            for _ in range(frames_per_hour):
+                rects = stream.step()
+                frame_num, snapshot, events = analyzer.step(rects)
+                sink.write(events)
+                closed_windows += len(windows.add(frame_num / args.fps, events))
+                metrics.frame_done(len(snapshot))
+
+            checkpoints.append({
+                "hour": hour,
+                "memory_mb": _mb(_traced_memory()),
+                "active_tracks": len(analyzer.tracker.objects),
+                "counted_ids": len(counter._counted_any),
+                "tracker_capacity": analyzer.tracker.capacity,
+                "path_capacity": analyzer.lifecycle.paths.capacity,
+                "evicted": analyzer.lifecycle.evicted,
+                "count": counter.total,
+                "actual": stream.crossed,
+                "events_written": sink.written,
+                "windows": closed_windows,
+            })
+            print_checkpoint(checkpoints[-1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return checkpoints, _mb(peak), time.perf_counter() - start
+
+def print_checkpoint(checkpoint):
+    print(f"{checkpoint['hour']:>5} {checkpoint['memory_mb']:>10.3f} {checkpoint['active_tracks']:>8} "
+          f"{checkpoint['counted_ids']:>8} {checkpoint['path_capacity']:>9} {checkpoint['evicted']:>10} "
+          f"{checkpoint['count']:>9} {checkpoint['actual']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=int, default=72, help="Horas simuladas (por defecto 72).")
+    parser.add_argument("--fps", type=float, default=1.0, help="Fotogramas por segundo simulados (por defecto 1).")
+    parser.add_argument("--cyclists-per-hour", type=float, default=600,
+                        help="Llegadas promedio de ciclistas por hora (por defecto 600).")
+    parser.add_argument("--speed", type=float, nargs=2, default=(20, 60), metavar=("MIN", "MAX"),
+                        help="Rango de velocidades en px/fotograma (por defecto 20 60).")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--window", type=float, default=3600,
+                        help="Duración de las ventanas de conteo en segundos (por defecto 3600).")
+    parser.add_argument("--max-disappeared", type=int, default=3,
+                        help="Fotogramas sin detección antes de dar de baja un objeto (por defecto 3, "
+                             "unos segundos a 1 FPS).")
+    parser.add_argument("--max-distance", type=int, default=75)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3,
+                        help="Horas de calentamiento antes de tomar la memoria de referencia (por defecto 3).")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Crecimiento relativo de memoria tolerado tras el calentamiento (por defecto 0.10).")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los puntos de control.")
+    args = parser.parse_args()
+    if args.hours <= args.warmup:
+        parser.error("--hours debe ser mayor que --warmup.")
+
+    print(f"{args.hours} h a {args.fps:g} FPS, {args.cyclists_per_hour:g} ciclistas/h, "
+          f"{args.width}x{args.height}")
+    print(f"{'hora':>5} {'memoria MB':>10} {'activos':>8} {'IDs cont':>8} {'trayectos':>9} "
+          f"{'liberados':>10} {'conteo':>9} {'reales':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        events_path = Path(tmp) / "events.jsonl"
+        checkpoints, peak_mb, elapsed = run(args, events_path)
+        events_mb = _mb(os.path.getsize(events_path))
+
+    # Medianas del primer y del último cuarto tras el calentamiento: la memoria de cada hora
+    # sube y baja con los ciclistas en escena, lo que importa es la tendencia
+    memory = [checkpoint["memory_mb"] for checkpoint in checkpoints[args.warmup:]]
+    quarter = max(1, len(memory) // 4)
+    baseline = statistics.median(memory[:quarter])
+    final = statistics.median(memory[-quarter:])
+    growth = (final - baseline) / baseline if baseline else 0.0
+    frames = checkpoints[-1]["hour"] * int(round(3600 * args.fps))
+    print(f"\n{frames} fotogramas en {elapsed:.1f}s; pico {peak_mb:.3f} MB; "
+          f"eventos en disco {events_mb:.3f} MB")
+    print(f"Memoria tras el calentamiento: {baseline:.3f} MB -> {final:.3f} MB ({growth * 100:+.1f}%)")
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "checkpoints": checkpoints, "peak_mb": peak_mb,
+                       "growth": round(growth, 4), "events_mb": events_mb}, f, indent=2)
+        print(f"Resultados guardados en {output}")
+
+    if growth > args.tolerance:
+        print(f"La memoria creció más de {args.tolerance * 100:.0f}% después del calentamiento")
+        sys.exit(1)
+    print("Memoria estable")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks reproducible del conteo de ciclistas con videos sintéticos.
+
+Genera un video por escenario (ver `synthetic.Scenario`) y registra en el registro de
+modelos un detector de prueba que retorna las cajas de referencia con ruido y pérdidas,
+así que no descarga pesos ni usa la red. Mide por separado la latencia (p50/p95/p99) y el
+rendimiento de `CentroidTracker.update`, de la comprobación de cruces
+(`CrossingCounter.update`), de la anotación y de `process_video` completo con y sin
+anotación, y compara los conteos con la verdad de referencia, también con las detecciones
+partidas en mosaicos solapados.
+
+Los resultados se guardan en un JSON que sirve de línea base: con `--compare` se comparan
+con una ejecución anterior y el script termina con código 1 si algún tiempo empeora más
+de `--tolerance` o si baja la exactitud del conteo. Los tiempos solo son comparables entre
+ejecuciones en la misma máquina.
+
+Uso:
+    python benchmarks/pipeline_benchmark.py --output benchmarks/baseline.json
+    python benchmarks/pipeline_benchmark.py --compare benchmarks/baseline.json
+    python benchmarks/pipeline_benchmark.py --scenarios large --cyclists 200 --resolution 3840x2160
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from counting import CountingLine, CrossingCounter
+from inference_geometry import InferenceGeometry
+from metrics import Histogram, PipelineMetrics
+from model_registry import register_model
+from synthetic import Scenario, StubDetector, write_video
+from tracker import CentroidTracker
+from video_processing import DEFAULT_LINE_NAME, _annotate_frame, process_video
+
+SCENARIOS = {
+    "small": {"width": 640, "height": 360, "frames": 300, "cyclists": 10},
+    "medium": {"width": 1280, "height": 720, "frames": 600, "cyclists": 40},
+    "large": {"width": 1920, "height": 1080, "frames": 600, "cyclists": 120},
+}
+
+# (sección, métrica, True si mayor es mejor) que se comparan con la línea base
+COMPARED_METRICS = [
+    ("tracker", "per_s", True),
+    ("tracker", "p95_ms", False),
+    ("crossing", "per_s", True),
+    ("crossing", "p95_ms", False),
+    ("annotate", "per_s", True),
+    ("annotate", "p95_ms", False),
+    ("pipeline", "fps", True),
+    ("pipeline", "frame_p95_ms", False),
+    ("pipeline_headless", "fps", True),
+    ("pipeline_headless", "frame_p95_ms", False),
+]
+ACCURACY_SECTIONS = ["crossing", "tiling", "pipeline", "pipeline_headless"]
+
+def _timing(histogram):
+    """Resumen del histograma con el rendimiento en operaciones por segundo."""
+    summary = histogram.summary()
+    summary["per_s"] = round(summary["count"] / summary["total_s"], 2) if summary["total_s"] > 0 else 0.0
+    return summary
+
+def _accuracy(expected, counts):
+    """Compara los conteos de la línea de conteo con los esperados."""
+    counted = counts["in"] + counts["out"]
+    return {
+        "expected": expected["count"],
+        "counted": counted,
+        "error": counted - expected["count"],
+        "in": counts["in"],
+        "out": counts["out"],
+        "expected_in": expected["in"],
+        "expected_out": expected["out"],
+        "accuracy": round(1 - abs(counted - expected["count"]) / max(expected["count"], 1), 4),
+    }
+
+def bench_tracker(detector, frames, max_disappeared, max_distance):
+    """
+    Mide `CentroidTracker.update` con las detecciones del detector de prueba.
+
+    Retorna el resumen de tiempos y, por fotograma, las entradas de la comprobación de
+    cruces (IDs, posiciones actuales y anteriores) y los objetos a dibujar.
+    """
+    tracker = CentroidTracker(max_disappeared=max_disappeared, max_distance=max_distance)
+    histogram = Histogram(window=max(frames, 1))
+    last_points = {}
+    trace = []
+    for index in range(frames):
+        rects = detector.detections(index).astype(np.int32)
+        start = time.perf_counter()
+        objects = tracker.update(rects)
+        histogram.observe(time.perf_counter() - start)
+
+        object_ids = list(objects)
+        points = [data["centroid"] for data in objects.values()]
+        prev_points = [last_points.get(object_id, point) for object_id, point in zip(object_ids, points)]
+        last_points = dict(zip(object_ids, points))
+        snapshot = [(object_id, data["centroid"], data["rect"]) for object_id, data in objects.items()]
+        trace.append((object_ids, points, prev_points, snapshot))
+    return _timing(histogram), trace
+
+def bench_crossing(scenario, expected, trace):
+    """Mide `CrossingCounter.update` sobre las trayectorias registradas en `bench_tracker`."""
+    counter = CrossingCounter([CountingLine(DEFAULT_LINE_NAME, *scenario.line_coords)])
+    histogram = Histogram(window=max(len(trace), 1))
+    records = []
+    for index, (object_ids, points, prev_points, snapshot) in enumerate(trace, start=1):
+        start = time.perf_counter()
+        events = counter.update(index, object_ids, points, prev_points)
+        histogram.observe(time.perf_counter() - start)
+        records.append((snapshot, events, counter.total, counter.counts()))
+    result = _timing(histogram)
+    result.update(_accuracy(expected, counter.line_counts[DEFAULT_LINE_NAME]))
+    return result, counter, records
+
+def _clip_to_window(boxes, window, min_visible=0.25):
+    """Cajas tal como las vería el modelo en un mosaico: recortadas por su borde y en sus coordenadas."""
+    x1, y1, x2, y2 = window
+    clipped = np.clip(boxes, [x1, y1, x1, y1], [x2, y2, x2, y2])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    visible = (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1])
+    clipped = clipped[visible >= min_visible * np.maximum(areas, 1)]
+    return clipped - np.array([x1, y1, x1, y1], dtype=clipped.dtype)
+
+def bench_tiling(scenario, expected, detector, max_disappeared, max_distance):
+    """
+    Cuenta con las detecciones partidas en mosaicos solapados y unidas por `InferenceGeometry`,
+    como en la inferencia por mosaicos: cada mosaico ve las cajas recortadas por su borde. El
+    conteo debe coincidir con el de las cajas completas (los ciclistas solapados en un mismo
+    mosaico no se unen y los cortados entre mosaicos no se cuentan dos veces).
+    """
+    tile_size = max(32, min(scenario.width, scenario.height) // 2)
+    geometry = InferenceGeometry(tile_size=tile_size, tile_overlap=0.25)
+    windows = geometry.windows(scenario.width, scenario.height)
+    # Los mosaicos solo se usan por su forma: el detector de prueba ya conoce las cajas
+    frame = np.broadcast_to(np.zeros(1, dtype=np.uint8), (scenario.height, scenario.width))
+    tracker = CentroidTracker(max_disappeared=max_disappeared, max_distance=max_distance)
+    counter = CrossingCounter([CountingLine(DEFAULT_LINE_NAME, *scenario.line_coords)])
+    last_points = {}
+    for index in range(scenario.frames):
+        boxes = detector.detections(index)
+        rects = geometry.detect([frame], lambda crops: [_clip_to_window(boxes, window) for window in windows])[0]
+        objects = tracker.update(rects.astype(np.int32))
+        object_ids = list(objects)
+        points = [data["centroid"] for data in objects.values()]
+        prev_points = [last_points.get(object_id, point) for object_id, point in zip(object_ids, points)]
+        last_points = dict(zip(object_ids, points))
+        counter.update(index + 1, object_ids, points, prev_points)
+    result = _accuracy(expected, counter.line_counts[DEFAULT_LINE_NAME])
+    result["tile_size"] = tile_size
+    result["tiles"] = len(windows)
+    return result
+
+def bench_annotation(video_path, counter, records, max_frames):
+    """Mide `_annotate_frame` sobre fotogramas decodificados del video (la copia no se cuenta)."""
+    cap = cv2.VideoCapture(str(video_path))
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+
+    histogram = Histogram(window=max(len(frames), 1))
+    for frame, (snapshot, events, total, counts) in zip(frames, records):
+        canvas = frame.copy()
+        start = time.perf_counter()
+        _annotate_frame(canvas, counter, snapshot, events, total, counts)
+        histogram.observe(time.perf_counter() - start)
+    return _timing(histogram)
+
+def bench_pipeline(scenario, expected, video_path, weights, annotate, batch_size, max_disappeared,
+                   max_distance):
+    """Ejecuta `process_video` completo y mide el rendimiento y el intervalo entre resultados."""
+    metrics = PipelineMetrics(window=max(scenario.frames, 1))
+    intervals = Histogram(window=max(scenario.frames, 1))
+    result = None
+    first_frame = None
+    start = last = time.perf_counter()
+    for result in process_video(str(video_path), scenario.line_coords, 0.5, batch_size=batch_size,
+                                model_weights=weights, annotate=annotate, max_disappeared=max_disappeared,
+                                max_distance=max_distance, metrics=metrics):
+        now = time.perf_counter()
+        if first_frame is None:
+            first_frame = now - start
+        else:
+            intervals.observe(now - last)
+        last = now
+    elapsed = time.perf_counter() - start
+
+    frames = result.frame_index if result is not None else 0
+    frame_times = intervals.summary()
+    summary = {
+        "frames": frames,
+        "elapsed_s": round(elapsed, 4),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "first_frame_s": round(first_frame or 0.0, 4),
+        "frame_p50_ms": frame_times["p50_ms"],
+        "frame_p95_ms": frame_times["p95_ms"],
+        "frame_p99_ms": frame_times["p99_ms"],
+        "stages": metrics.snapshot()["stages"],
+    }
+    counts = result.counts[DEFAULT_LINE_NAME] if result is not None else {"in": 0, "out": 0}
+    summary.update(_accuracy(expected, counts))
+    return summary
+
+def _video_path(scenario, workdir):
+    digest = hashlib.sha256(json.dumps(scenario.config(), sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return Path(workdir) / f"{scenario.name}-{scenario.width}x{scenario.height}-{digest}.mp4"
+
+def run_scenario(scenario, args, workdir):
+    boxes, expected = scenario.ground_truth()
+    video_path = _video_path(scenario, workdir)
+    if not video_path.exists():
+        write_video(scenario, video_path)
+
+    detector = StubDetector(boxes, noise=args.noise, dropout=args.dropout, seed=args.seed)
+    weights = f"stub-{video_path.stem}-{args.noise}-{args.dropout}-{args.seed}"
+    register_model(weights, detector)
+
+    tracker_result, trace = bench_tracker(detector, scenario.frames, args.max_disappeared, args.max_distance)
+    crossing_result, counter, records = bench_crossing(scenario, expected, trace)
+    return {
+        "scenario": scenario.config(),
+        "ground_truth": expected,
+        "detections": int(sum(len(frame_boxes) for frame_boxes in boxes)),
+        "tracker": tracker_result,
+        "crossing": crossing_result,
+        "tiling": bench_tiling(scenario, expected, detector, args.max_disappeared, args.max_distance),
+        "annotate": bench_annotation(video_path, counter, records, args.annotate_frames),
+        "pipeline": bench_pipeline(scenario, expected, video_path, weights, True, args.batch_size,
+                                   args.max_disappeared, args.max_distance),
+        "pipeline_headless": bench_pipeline(scenario, expected, video_path, weights, False, args.batch_size,
+                                            args.max_disappeared, args.max_distance),
+    }
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def print_results(name, result):
+    print(f"\n== {name} ({result['scenario']['width']}x{result['scenario']['height']}, "
+          f"{result['scenario']['frames']} fotogramas, {result['scenario']['cyclists']} ciclistas)")
+    print(f"{'etapa':<18} {'op/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for section in ("tracker", "crossing", "annotate"):
+        timing = result[section]
+        print(f"{section:<18} {timing['per_s']:>10.1f} {timing['p50_ms']:>9.3f} {timing['p95_ms']:>9.3f} "
+              f"{timing['p99_ms']:>9.3f}")
+    for section in ("pipeline", "pipeline_headless"):
+        timing = result[section]
+        print(f"{section:<18} {timing['fps']:>10.1f} {timing['frame_p50_ms']:>9.3f} {timing['frame_p95_ms']:>9.3f} "
+              f"{timing['frame_p99_ms']:>9.3f}")
+    for section in ACCURACY_SECTIONS:
+        accuracy = result[section]
+        print(f"conteo {section:<18} {accuracy['counted']:>4} de {accuracy['expected']:<4} "
+              f"(in {accuracy['in']}/{accuracy['expected_in']}, out {accuracy['out']}/{accuracy['expected_out']}, "
+              f"exactitud {accuracy['accuracy']:.3f})")
+
+def compare(baseline, current, tolerance):
+    """
+    Compara los resultados con una línea base y retorna la lista de regresiones: tiempos que
+    empeoran más de `tolerance` (fracción) o exactitud de conteo menor.
+    """
+    regressions = []
+    if baseline.get("environment") != current["environment"]:
+        print("\nAviso: la línea base se midió en otro entorno; los tiempos pueden no ser comparables.")
+    print(f"\n{'escenario':<10} {'métrica':<32} {'base':>10} {'actual':>10} {'cambio':>8}")
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if previous["scenario"] != result["scenario"]:
+            print(f"{name:<10} (parámetros distintos, se omite)")
+            continue
+        for section, metric, higher_is_better in COMPARED_METRICS:
+            old, new = previous[section][metric], result[section][metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = " REGRESIÓN" if worse > tolerance else ""
+            print(f"{name:<10} {section + '.' + metric:<32} {old:>10.3f} {new:>10.3f} {change:>+8.1%}{flag}")
+            if flag:
+                regressions.append((name, f"{section}.{metric}", old, new))
+        for section in ACCURACY_SECTIONS:
+            if section not in previous:
+                continue
+            old, new = previous[section]["accuracy"], result[section]["accuracy"]
+            flag = " REGRESIÓN" if new < old else ""
+            print(f"{name:<10} {section + '.accuracy':<32} {old:>10.3f} {new:>10.3f} {new - old:>+8.3f}{flag}")
+            if flag:
+                regressions.append((name, f"{section}.accuracy", old, new))
+    return regressions
+
+def _resolution(text):
+    try:
+        width, height = (int(value) for value in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("La resolución debe tener el formato ANCHOxALTO, p. ej. 1920x1080.")
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["small", "medium"])
+    parser.add_argument("--resolution", type=_resolution, help="Resolución de todos los escenarios (ANCHOxALTO).")
+    parser.add_argument("--frames", type=int, help="Fotogramas de todos los escenarios.")
+    parser.add_argument("--cyclists", type=int, help="Ciclistas de todos los escenarios.")
+    parser.add_argument("--speed", type=float, nargs=2, default=(4, 12), metavar=("MIN", "MAX"),
+                        help="Rango de velocidades en px/fotograma (por defecto 4 12).")
+    parser.add_argument("--crossing-ratio", type=float, default=0.7,
+                        help="Fracción de ciclistas que cruzan la línea (por defecto 0.7).")
+    parser.add_argument("--noise", type=float, default=2.0,
+                        help="Ruido de las cajas detectadas en píxeles (por defecto 2).")
+    parser.add_argument("--dropout", type=float, default=0.05,
+                        help="Probabilidad de perder cada detección (por defecto 0.05).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--max-disappeared", type=int, default=50)
+    parser.add_argument("--max-distance", type=int, default=75)
+    parser.add_argument("--annotate-frames", type=int, default=300,
+                        help="Fotogramas usados para medir la anotación (por defecto 300).")
+    parser.add_argument("--workdir", help="Directorio donde generar (y reutilizar) los videos; "
+                                          "por defecto uno temporal.")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados como línea base.")
+    parser.add_argument("--compare", help="Línea base JSON con la que comparar los resultados.")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Empeoramiento relativo tolerado al comparar (por defecto 0.10).")
+    args = parser.parse_args()
+
+    scenarios = []
+    for name in args.scenarios:
+        params = dict(SCENARIOS[name])
+        if args.resolution:
+            params["width"], params["height"] = args.resolution
+        if args.frames:
+            params["frames"] = args.frames
+        if args.cyclists:
+            params["cyclists"] = args.cyclists
+        scenarios.append(Scenario(name, speed=args.speed, crossing_ratio=args.crossing_ratio, seed=args.seed,
+                                  **params))
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {"noise": args.noise, "dropout": args.dropout, "seed": args.seed,
+                     "batch_size": args.batch_size, "max_disappeared": args.max_disappeared,
+                     "max_distance": args.max_distance, "annotate_frames": args.annotate_frames},
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for scenario in scenarios:
+            result = run_scenario(scenario, args, workdir)
+            report["scenarios"][scenario.name] = result
+            print_results(scenario.name, result)
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones respecto a {args.compare}")
+            sys.exit(1)
+        print(f"\nSin regresiones respecto a {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Videos sintéticos con "ciclistas" y un detector de prueba determinista para los benchmarks.
+
+Cada escenario describe una escena (resolución, duración, número de ciclistas, rango de
+velocidades y fracción que cruza la línea de conteo) y se genera siempre igual a partir de
+su semilla. La verdad de referencia (cajas por fotograma y cruces esperados) se calcula de
+los mismos parámetros, sin leer el video.
+
+El índice de cada fotograma se escribe como un código de barras en la franja superior
+izquierda, de modo que `StubDetector` sabe qué fotograma recibe aunque el pipeline los
+agrupe en lotes u omita algunos, y retorna las cajas de referencia con ruido y pérdidas
+opcionales. No necesita pesos, red ni GPU.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Trayecto de un ciclista: fotograma de aparición, carril (y), posiciones x por fotograma,
+# si cruza la línea y en qué dirección ("in"/"out" según `CountingLine`).
+Cyclist = namedtuple("Cyclist", ["start", "y", "xs", "crosses", "direction"])
+
+BARCODE_BITS = 20
+BARCODE_BLOCK = 16
+
+class Scenario:
+    """
+    Parámetros de una escena sintética.
+
+    La línea de conteo es vertical, en el centro del fotograma. Los ciclistas se mueven en
+    horizontal por carriles al azar; los que cruzan van de un lado al otro de la línea y los
+    demás dan la vuelta antes de llegar a ella.
+
+    Args:
+        name (str): Nombre del escenario.
+        width, height (int): Resolución del video.
+        frames (int): Número de fotogramas.
+        cyclists (int): Número de ciclistas en todo el video.
+        speed (tuple): Rango (mínimo, máximo) de velocidades en px/fotograma.
+        crossing_ratio (float): Fracción de ciclistas que cruzan la línea.
+        fps (float): Fotogramas por segundo del video.
+        seed (int): Semilla de la escena.
+    """
+    def __init__(self, name, width=1280, height=720, frames=300, cyclists=20, speed=(4, 12),
+                 crossing_ratio=0.7, fps=30.0, seed=0):
+        if width < BARCODE_BITS * BARCODE_BLOCK:
+            raise ValueError(f"El ancho debe ser de al menos {BARCODE_BITS * BARCODE_BLOCK} píxeles.")
+        self.name = name
+        self.width = int(width)
+        self.height = int(height)
+        self.frames = int(frames)
+        self.cyclists = int(cyclists)
+        self.speed = (float(speed[0]), float(speed[1]))
+        self.crossing_ratio = float(crossing_ratio)
+        self.fps = float(fps)
+        self.seed = int(seed)
+        self.box_size = (max(8, self.height // 16), max(12, self.height // 10))
+
+    @property
+    def line_coords(self):
+        x = self.width // 2
+        return ((x, 0), (x, self.height))
+
+    def config(self):
+        return {
+            "name": self.name, "width": self.width, "height": self.height, "frames": self.frames,
+            "cyclists": self.cyclists, "speed": list(self.speed), "crossing_ratio": self.crossing_ratio,
+            "fps": self.fps, "seed": self.seed,
+        }
+
+    def cyclist_paths(self):
+        """Genera los trayectos de todos los ciclistas de forma determinista."""
+        rng = np.random.default_rng(self.seed)
+        line_x = self.width // 2
+        box_w, box_h = self.box_size
+        margin = box_w
+        top = 2 * BARCODE_BLOCK + box_h // 2
+        paths = []
+        for index in range(self.cyclists):
+            speed = rng.uniform(*self.speed)
+            crosses = index < round(self.cyclists * self.crossing_ratio)
+            from_left = rng.random() < 0.5
+            y = int(rng.uniform(top, self.height - box_h // 2 - 1))
+            # Distancias a la línea al empezar y al terminar (o al dar la vuelta)
+            far = rng.uniform(3 * box_w, line_x - margin)
+            if crosses:
+                near = rng.uniform(3 * box_w, line_x - margin)
+                length = far + near
+            else:
+                near = rng.uniform(2 * box_w, far)
+                length = 2 * (far - near)
+            duration = max(2, int(length / speed) + 1)
+            if duration >= self.frames:
+                duration = self.frames - 1
+            sign = 1 if from_left else -1
+            offsets = np.minimum(np.arange(duration) * speed, length)
+            if not crosses:
+                # Ir hasta `near` de la línea y volver
+                half = length / 2
+                offsets = np.where(offsets <= half, offsets, length - offsets)
+            xs = np.rint(line_x - sign * far + sign * offsets).astype(np.int64)
+            start = int(rng.integers(0, self.frames - duration + 1))
+            # Moverse hacia la izquierda es "in" para una línea vertical trazada de arriba abajo
+            direction = ("out" if from_left else "in") if crosses else None
+            paths.append(Cyclist(start, y, xs, crosses, direction))
+        return paths
+
+    def ground_truth(self):
+        """Retorna (cajas por fotograma, cruces esperados)."""
+        box_w, box_h = self.box_size
+        paths = self.cyclist_paths()
+        boxes = [[] for _ in range(self.frames)]
+        for cyclist in paths:
+            for offset, x in enumerate(cyclist.xs):
+                boxes[cyclist.start + offset].append((x - box_w // 2, cyclist.y - box_h // 2,
+                                                      x + box_w // 2, cyclist.y + box_h // 2))
+        boxes = [np.array(frame_boxes, dtype=np.int32).reshape(-1, 4) for frame_boxes in boxes]
+        expected = {
+            "count": sum(cyclist.crosses for cyclist in paths),
+            "in": sum(cyclist.direction == "in" for cyclist in paths),
+            "out": sum(cyclist.direction == "out" for cyclist in paths),
+        }
+        return boxes, expected
+
+def write_barcode(frame, index):
+    """Escribe `index` como código de barras binario en la franja superior del fotograma."""
+    for bit in range(BARCODE_BITS):
+        value = 255 if (index >> bit) & 1 else 0
+        frame[:BARCODE_BLOCK, bit * BARCODE_BLOCK:(bit + 1) * BARCODE_BLOCK] = value
+
+def read_barcode(frame):
+    """Lee el índice escrito con `write_barcode`, o None si el fotograma es demasiado pequeño."""
+    if frame.shape[0] < BARCODE_BLOCK or frame.shape[1] < BARCODE_BITS * BARCODE_BLOCK:
+        return None
+    quarter = BARCODE_BLOCK // 4
+    strip = frame[quarter:BARCODE_BLOCK - quarter, :BARCODE_BITS * BARCODE_BLOCK].mean(axis=(0, 2))
+    blocks = strip.reshape(BARCODE_BITS, BARCODE_BLOCK)[:, quarter:BARCODE_BLOCK - quarter].mean(axis=1)
+    bits = blocks > 127
+    return int(np.dot(bits, 1 << np.arange(BARCODE_BITS)))
+
+def write_video(scenario, path):
+    """Genera el video del escenario en `path` (MP4) y retorna la ruta."""
+    box_w, box_h = scenario.box_size
+    paths = scenario.cyclist_paths()
+    rng = np.random.default_rng(scenario.seed + 1)
+    # Fondo con textura estática, como una calle grabada con cámara fija
+    background = rng.integers(90, 140, size=(scenario.height, scenario.width, 1), dtype=np.uint8)
+    background = cv2.GaussianBlur(np.repeat(background, 3, axis=2), (5, 5), 0)
+    colors = rng.integers(0, 256, size=(len(paths), 3)).tolist()
+
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), scenario.fps,
+                             (scenario.width, scenario.height))
+    if not writer.isOpened():
+        raise IOError(f"No se pudo crear el video {path}.")
+    try:
+        for index in range(scenario.frames):
+            frame = background.copy()
+            for cyclist, color in zip(paths, colors):
+                offset = index - cyclist.start
+                if 0 <= offset < len(cyclist.xs):
+                    x = int(cyclist.xs[offset])
+                    cv2.rectangle(frame, (x - box_w // 2, cyclist.y - box_h // 2),
+                                  (x + box_w // 2, cyclist.y + box_h // 2), color, -1)
+            write_barcode(frame, index)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+class _StubTensor:
+    """Arreglo con la interfaz mínima de un tensor de PyTorch (`.cpu().numpy()`)."""
+    def __init__(self, array):
+        self._array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._array
+
+class _StubBoxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = _StubTensor(xyxy)
+        self.conf = _StubTensor(conf)
+        self.cls = _StubTensor(cls)
+
+    def __len__(self):
+        return len(self.conf.numpy())
+
+class _StubResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+def perturb_boxes(boxes, frame_index, seed=0, noise=0.0, dropout=0.0):
+    """
+    Aplica a las cajas de referencia de un fotograma un ruido gaussiano de `noise` píxeles
+    y descarta cada caja con probabilidad `dropout`. El resultado depende solo de la semilla
+    y del índice del fotograma.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0 or (noise <= 0 and dropout <= 0):
+        return boxes
+    rng = np.random.default_rng([seed, frame_index])
+    if noise > 0:
+        boxes = boxes + rng.normal(0, noise, size=boxes.shape)
+    if dropout > 0:
+        boxes = boxes[rng.random(len(boxes)) >= dropout]
+    return boxes
+
+class StubDetector:
+    """
+    Detector de prueba con la interfaz del modelo de Ultralytics (`detector(frames, ...)`
+    y `detector.names`) que retorna las cajas de referencia del escenario como bicicletas.
+
+    Identifica cada fotograma por su código de barras, así que necesita el fotograma
+    completo (no sirve con recortes de `InferenceGeometry`).
+
+    Args:
+        boxes (list): Cajas de referencia por fotograma (ver `Scenario.ground_truth`).
+        noise (float): Desviación estándar del ruido de las cajas en píxeles.
+        dropout (float): Probabilidad de perder cada detección.
+        confidence (float): Confianza asignada a todas las detecciones.
+        seed (int): Semilla del ruido y las pérdidas.
+    """
+    names = {0: "person", 1: "bicycle"}
+
+    def __init__(self, boxes, noise=0.0, dropout=0.0, confidence=0.9, seed=0):
+        self.boxes = boxes
+        self.noise = noise
+        self.dropout = dropout
+        self.confidence = confidence
+        self.seed = seed
+        self.calls = 0
+        self.frames = 0
+
+    def detections(self, frame_index):
+        """Cajas (N, 4) que el detector retorna para el fotograma `frame_index`."""
+        if frame_index is None or not 0 <= frame_index < len(self.boxes):
+            return np.empty((0, 4), dtype=np.float32)
+        boxes = perturb_boxes(self.boxes[frame_index], frame_index, self.seed, self.noise, self.dropout)
+        return boxes.astype(np.float32)
+
+    def __call__(self, source, classes=None, conf=0.25, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        self.calls += 1
+        self.frames += len(frames)
+        results = []
+        for frame in frames:
+            xyxy = self.detections(read_barcode(frame))
+            scores = np.full(len(xyxy), self.confidence, dtype=np.float32)
+            labels = np.ones(len(xyxy), dtype=np.float32)
+            keep = scores > conf
+            if classes is not None:
+                keep &= np.isin(labels.astype(np.int64), classes)
+            results.append(_StubResult(_StubBoxes(xyxy[keep], scores[keep], labels[keep])))
+        return results
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escalabilidad del CentroidTracker con cientos de objetos simultáneos.
+
+Simula N ciclistas que se mueven con velocidad constante y ruido, con detecciones
+perdidas al azar, y mide el tiempo medio de `CentroidTracker.update` por fotograma.
+
+Uso:
+    python benchmarks/tracker_benchmark.py --tracks 50 100 200 400 800
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from tracker import CentroidTracker
+
+def simulate_rects(n_tracks, n_frames, seed=0, dropout=0.05):
+    """Genera las cajas por fotograma de `n_tracks` objetos repartidos en una escena de 4K."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((0, 0), (3840, 2160), size=(n_tracks, 2))
+    velocities = rng.normal(0, 6, size=(n_tracks, 2))
+    frames = []
+    for _ in range(n_frames):
+        positions += velocities + rng.normal(0, 1, size=positions.shape)
+        visible = positions[rng.random(n_tracks) > dropout]
+        frames.append(np.hstack([visible - 20, visible + 20]).astype(np.int64))
+    return frames
+
+def bench(n_tracks, n_frames):
+    frames = simulate_rects(n_tracks, n_frames)
+    tracker = CentroidTracker(max_disappeared=50, max_distance=75)
+    tracker.update(frames[0])
+    start = time.perf_counter()
+    for rects in frames[1:]:
+        tracker.update(rects)
+    elapsed = time.perf_counter() - start
+    return elapsed / (n_frames - 1), len(tracker.objects)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, nargs="+", default=[50, 100, 200, 400, 800])
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'objetos':>8} {'ms/update':>10} {'activos':>8}")
+    for n_tracks in args.tracks:
+        per_update, active = bench(n_tracks, args.frames)
+        print(f"{n_tracks:>8} {per_update * 1000:>10.3f} {active:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Evento de conteo producido en un fotograma.
+#   kind: "line" para cruces de línea o "zone" para entradas/salidas de zona.
+#   direction: "in"/"out" para líneas, "enter"/"exit" para zonas.
+CrossingEvent = namedtuple("CrossingEvent", ["frame_index", "object_id", "name", "kind", "direction", "point"])
+
+class CountingLine:
+    """
+    Línea de conteo con dirección, definida por dos puntos (p1 -> p2).
+
+    Un cruce es "in" si el objeto pasa al lado derecho de la línea recorrida de p1 a p2
+    (en coordenadas de imagen, con el eje y hacia abajo) y "out" en el sentido contrario.
+    Para una línea horizontal trazada de izquierda a derecha, "in" es moverse hacia abajo.
+    """
+    def __init__(self, name, p1, p2):
+        self.name = name
+        self.p1 = (int(p1[0]), int(p1[1]))
+        self.p2 = (int(p2[0]), int(p2[1]))
+
+class CountingZone:
+    """Zona poligonal de conteo; registra entradas y salidas de los objetos seguidos."""
+    def __init__(self, name, polygon):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError(f"La zona '{name}' necesita al menos 3 vértices.")
+
+def _orientation(p, q, r):
+    """Versión vectorizada de `orientation`: signo del producto cruz (0, 1 o -1) por elemento."""
+    val = (q[..., 1] - p[..., 1]) * (r[..., 0] - q[..., 0]) - \
+          (q[..., 0] - p[..., 0]) * (r[..., 1] - q[..., 1])
+    return np.sign(val)
+
+def _on_segment(p, q, r):
+    """Versión vectorizada de `on_segment` para puntos colineales."""
+    return ((q[..., 0] <= np.maximum(p[..., 0], r[..., 0])) & (q[..., 0] >= np.minimum(p[..., 0], r[..., 0])) &
+            (q[..., 1] <= np.maximum(p[..., 1], r[..., 1])) & (q[..., 1] >= np.minimum(p[..., 1], r[..., 1])))
+
+def segments_intersect(p1, q1, p2, q2):
+    """
+    Prueba de intersección de segmentos vectorizada, equivalente a `do_intersect`.
+
+    Args:
+        p1, q1 (np.array): Extremos de los segmentos de movimiento, forma (T, 1, 2).
+        p2, q2 (np.array): Extremos de las líneas de conteo, forma (1, L, 2).
+
+    Returns:
+        np.array: Matriz booleana (T, L) con True donde los segmentos se intersectan.
+    """
+    o1 = _orientation(p1, q1, p2)
+    o2 = _orientation(p1, q1, q2)
+    o3 = _orientation(p2, q2, p1)
+    o4 = _orientation(p2, q2, q1)
+
+    # Caso general: las orientaciones son diferentes
+    hits = (o1 != o2) & (o3 != o4)
+
+    # Casos especiales de colinealidad; son raros, así que solo se evalúan si hay alguno
+    if (o1 == 0).any() or (o2 == 0).any() or (o3 == 0).any() or (o4 == 0).any():
+        hits = (hits |
+                ((o1 == 0) & _on_segment(p1, p2, q1)) |
+                ((o2 == 0) & _on_segment(p1, q2, q1)) |
+                ((o3 == 0) & _on_segment(p2, p1, q2)) |
+                ((o4 == 0) & _on_segment(p2, q1, q2)))
+    return hits
+
+def distance_to_segments(points, p1, p2):
+    """
+    Distancia de cada punto a cada segmento.
+
+    Args:
+        points (np.array): Puntos, forma (T, 2).
+        p1, p2 (np.array): Extremos de los segmentos, forma (L, 2).
+
+    Returns:
+        np.array: Matriz (T, L) de distancias.
+    """
+    points = np.asarray(points, dtype=np.float64)[:, None, :]
+    p1 = np.asarray(p1, dtype=np.float64)[None, :, :]
+    direction = np.asarray(p2, dtype=np.float64)[None, :, :] - p1
+    length_sq = np.maximum((direction ** 2).sum(axis=2), 1e-12)
+    t = np.clip(((points - p1) * direction).sum(axis=2) / length_sq, 0.0, 1.0)
+    closest = p1 + t[..., None] * direction
+    return np.linalg.norm(points - closest, axis=2)
+
+def points_in_polygon(points, polygon):
+    """Prueba de punto en polígono (ray casting) vectorizada. Retorna un arreglo booleano (T,)."""
+    x = points[:, 0:1]
+    y = points[:, 1:2]
+    xi, yi = polygon[:, 0], polygon[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+    straddles = (yi > y) != (yj > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+    crossings = straddles & (x < x_cross)
+    return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+class CrossingCounter:
+    """
+    Motor de conteo para cualquier número de líneas y zonas con nombre.
+
+    En cada fotograma prueba el último segmento de movimiento de todos los objetos contra
+    todas las líneas a la vez con NumPy. Cada objeto se cuenta como máximo una vez por
+    línea, en la dirección de su primer cruce. Las zonas registran entradas y salidas
+    cada vez que un objeto cambia de estar fuera a dentro o viceversa.
+
+    El estado por objeto (líneas ya cruzadas, dentro/fuera de cada zona) se libera con
+    `forget` cuando el tracker da de baja el objeto, así que la memoria depende de los
+    objetos seguidos a la vez y no de todos los que pasaron.
+    """
+    def __init__(self, lines=(), zones=()):
+        self.lines = list(lines)
+        self.zones = list(zones)
+        names = [item.name for item in self.lines + self.zones]
+        if len(set(names)) != len(names):
+            raise ValueError("Los nombres de líneas y zonas deben ser únicos.")
+
+        self._line_p1 = np.array([line.p1 for line in self.lines], dtype=np.int64).reshape(1, -1, 2)
+        self._line_p2 = np.array([line.p2 for line in self.lines], dtype=np.int64).reshape(1, -1, 2)
+        self._counted = [set() for _ in self.lines]
+        self._counted_any = set()
+        self._inside = {}
+        self._total = 0
+
+        self.line_counts = {line.name: {"in": 0, "out": 0} for line in self.lines}
+        self.zone_counts = {zone.name: {"enter": 0, "exit": 0, "inside": 0} for zone in self.zones}
+
+    @property
+    def total(self):
+        """Número de objetos distintos que cruzaron al menos una línea."""
+        return self._total
+
+    def counts(self):
+        """Retorna una copia de los conteos por línea y por zona."""
+        counts = {name: dict(value) for name, value in self.line_counts.items()}
+        counts.update({name: dict(value) for name, value in self.zone_counts.items()})
+        return counts
+
+    def forget(self, object_id):
+        """
+        Libera el estado del objeto (p. ej. al darlo de baja el tracker). Los conteos no cambian;
+        como los IDs no se reutilizan, el objeto no puede volver a contarse.
+        """
+        for counted in self._counted:
+            counted.discard(object_id)
+        self._counted_any.discard(object_id)
+        self._inside.pop(object_id, None)
+
+    def update(self, frame_index, object_ids, points, prev_points):
+        """
+        Actualiza los conteos con la posición actual y anterior de cada objeto.
+
+        Args:
+            frame_index (int): Índice del fotograma (desde 1).
+            object_ids (list): IDs de los objetos seguidos.
+            points (np.array): Posiciones actuales, forma (T, 2).
+            prev_points (np.array): Posiciones en el fotograma anterior, forma (T, 2). Para
+                objetos nuevos se pasa la posición actual; los segmentos de longitud cero
+                no se consideran cruces.
+
+        Returns:
+            list: Lista de `CrossingEvent` ocurridos en este fotograma.
+        """
+        events = []
+        if len(object_ids) == 0:
+            return events
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        prev_points = np.asarray(prev_points, dtype=np.int64).reshape(-1, 2)
+
+        if self.lines:
+            moving = np.any(points != prev_points, axis=1)
+            hits = segments_intersect(prev_points[:, None, :], points[:, None, :], self._line_p1, self._line_p2)
+            hits &= moving[:, None]
+            if hits.any():
+                # Lado de la línea en que queda cada extremo del movimiento
+                direction = self._line_p2 - self._line_p1
+                side_now = np.sign(direction[..., 0] * (points[:, None, 1] - self._line_p1[..., 1]) -
+                                   direction[..., 1] * (points[:, None, 0] - self._line_p1[..., 0]))
+                side_before = np.sign(direction[..., 0] * (prev_points[:, None, 1] - self._line_p1[..., 1]) -
+                                      direction[..., 1] * (prev_points[:, None, 0] - self._line_p1[..., 0]))
+                inward = np.where(side_now != 0, side_now > 0, side_before < 0)
+
+                for row, col in zip(*np.nonzero(hits)):
+                    object_id = object_ids[row]
+                    if object_id in self._counted[col]:
+                        continue
+                    self._counted[col].add(object_id)
+                    if object_id not in self._counted_any:
+                        self._counted_any.add(object_id)
+                        self._total += 1
+                    line = self.lines[col]
+                    label = "in" if inward[row, col] else "out"
+                    self.line_counts[line.name][label] += 1
+                    events.append(CrossingEvent(frame_index, object_id, line.name, "line", label,
+                                                tuple(points[row].tolist())))
+
+        if self.zones:
+            inside = np.stack([points_in_polygon(points, zone.polygon) for zone in self.zones], axis=1)
+            # Los objetos nuevos toman su estado actual como estado previo (sin evento)
+            before = np.array([self._inside.get(object_id, now) for object_id, now in zip(object_ids, inside)])
+            self._inside.update(zip(object_ids, inside))
+            for row, col in zip(*np.nonzero(before != inside)):
+                label = "enter" if inside[row, col] else "exit"
+                zone = self.zones[col]
+                self.zone_counts[zone.name][label] += 1
+                events.append(CrossingEvent(frame_index, object_ids[row], zone.name, "zone", label,
+                                            tuple(points[row].tolist())))
+            occupancy = inside.sum(axis=0)
+            for col, zone in enumerate(self.zones):
+                self.zone_counts[zone.name]["inside"] = int(occupancy[col])
+
+        return events
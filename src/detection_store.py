@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+def hash_file(path, chunk_size=1 << 20):
+    """Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def copy_and_hash(source, destination, chunk_size=1 << 20):
+    """
+    Copia por bloques un archivo abierto en modo binario (`source`) a otro (`destination`)
+    y retorna el SHA-256 del contenido, sin tener nunca el archivo completo en memoria.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        digest.update(chunk)
+        destination.write(chunk)
+    return digest.hexdigest()
+
+class StoredDetections:
+    """
+    Detecciones guardadas de un video, abiertas como arreglos NumPy mapeados en memoria.
+
+    Las cajas de todos los fotogramas están concatenadas en `boxes` (forma (N, 4));
+    las del fotograma i (desde 0) son `boxes[offsets[i]:offsets[i + 1]]`. `detected[i]`
+    indica si el detector se ejecutó en ese fotograma (False entre fotogramas clave).
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.boxes = np.load(self.path / "boxes.npy", mmap_mode="r")
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        detected_path = self.path / "detected.npy"
+        if detected_path.exists():
+            self.detected = np.load(detected_path, mmap_mode="r")
+        else:
+            self.detected = np.ones(len(self.offsets) - 1, dtype=bool)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, frame_index):
+        """
+        Retorna las cajas (M, 4) del fotograma `frame_index` (desde 0), o None si en ese
+        fotograma no se ejecutó el detector.
+        """
+        if frame_index >= len(self):
+            return np.empty((0, 4), dtype=np.int32)
+        if not self.detected[frame_index]:
+            return None
+        start, end = self.offsets[frame_index], self.offsets[frame_index + 1]
+        return np.asarray(self.boxes[start:end])
+
+class DetectionWriter:
+    """Acumula las detecciones por fotograma y las guarda de forma atómica al confirmar."""
+    def __init__(self, store, key, meta):
+        self._store = store
+        self._key = key
+        self._meta = dict(meta)
+        self._boxes = []
+        self._detected = []
+
+    def append(self, boxes):
+        """Agrega las cajas del siguiente fotograma; None si el detector no se ejecutó en él."""
+        self._detected.append(boxes is not None)
+        if boxes is None:
+            boxes = ()
+        self._boxes.append(np.asarray(boxes, dtype=np.int32).reshape(-1, 4))
+
+    def commit(self):
+        """Escribe las detecciones en el almacén y retorna la entrada guardada."""
+        counts = np.array([len(b) for b in self._boxes], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        boxes = np.concatenate(self._boxes) if self._boxes else np.empty((0, 4), dtype=np.int32)
+        meta = dict(self._meta, frames=len(self._boxes))
+
+        # Escribir en un directorio temporal y renombrarlo para no dejar entradas a medias
+        self._store.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=self._store.root, prefix=".tmp-"))
+        try:
+            np.save(tmp_dir / "boxes.npy", boxes)
+            np.save(tmp_dir / "offsets.npy", offsets)
+            np.save(tmp_dir / "detected.npy", np.array(self._detected, dtype=bool))
+            with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            target = self._store.root / self._key
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return StoredDetections(target)
+
+class DetectionStore:
+    """
+    Almacén en disco de las detecciones crudas por fotograma.
+
+    Cada entrada se identifica por el hash del contenido del video, el modelo y el umbral
+    de detección, de modo que cambiar solo la línea de conteo o los parámetros del tracker
+    permite reutilizar las detecciones sin volver a ejecutar YOLO.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+
+    @staticmethod
+    def make_key(video_hash, model_weights, detection_threshold, **options):
+        """
+        Retorna la clave de una entrada a partir de lo que determina las detecciones.
+
+        Las opciones adicionales (serializables en JSON) que cambian las detecciones, como el
+        filtro de movimiento, se pasan como argumentos con nombre; las que son None se ignoran.
+        """
+        params = {
+            "video": video_hash,
+            "model": str(model_weights),
+            "threshold": round(float(detection_threshold), 6),
+        }
+        params.update({name: value for name, value in options.items() if value is not None})
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def load(self, key):
+        """Retorna las detecciones guardadas para `key`, o None si no existen."""
+        path = self.root / key
+        if not (path / "meta.json").exists():
+            return None
+        return StoredDetections(path)
+
+    def create(self, key, meta=None):
+        """Retorna un escritor para guardar las detecciones de una nueva entrada."""
+        return DetectionWriter(self, key, meta or {})
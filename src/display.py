@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+import cv2
+
+def preview_image(frame, max_width=640):
+    """
+    Retorna una copia RGB del fotograma reducida a `max_width` píxeles de ancho como máximo,
+    lista para enviarse al navegador.
+    """
+    height, width = frame.shape[:2]
+    if width > max_width:
+        scale = max_width / width
+        frame = cv2.resize(frame, (max_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+class LogBuffer:
+    """
+    Registro acotado: conserva solo las últimas `max_entries` entradas, de modo que
+    mostrarlo cuesta lo mismo al principio que al final de un video largo.
+
+    Es seguro agregar desde un hilo y leer desde otro.
+    """
+    def __init__(self, max_entries=200):
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def add(self, text):
+        """Agrega una entrada; si el registro está lleno se descarta la más antigua."""
+        with self._lock:
+            self._entries.append(text)
+            self.total += 1
+
+    def render(self, separator="\n\n"):
+        """Retorna las entradas de la más reciente a la más antigua unidas por `separator`."""
+        with self._lock:
+            return separator.join(reversed(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+class BackgroundRunner:
+    """
+    Consume en un hilo de fondo los resultados de `process_video` (o de cualquier iterable)
+    y guarda solo el último, para que la interfaz lo consulte a su propio ritmo.
+
+    Así la velocidad del procesamiento no depende de lo que tarda el navegador en
+    dibujar cada fotograma: la interfaz refresca la vista previa y las métricas unas
+    pocas veces por segundo y los fotogramas intermedios simplemente no se muestran.
+
+    Args:
+        results (iterable): Resultados a consumir, normalmente el generador de `process_video`.
+        log_formatter (callable): Función opcional que recibe un resultado y retorna el texto
+            a agregar al registro, o None para no agregar nada.
+        log_size (int): Número máximo de entradas del registro.
+    """
+    def __init__(self, results, log_formatter=None, log_size=200):
+        self._results = results
+        self._log_formatter = log_formatter
+        self.log = LogBuffer(log_size)
+        self._lock = threading.Lock()
+        self._latest = None
+        self._received = 0
+        self.error = None
+        self._stop_event = threading.Event()
+        self._done_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="background-runner", daemon=True)
+
+    def start(self):
+        """Inicia el hilo de fondo y retorna el propio objeto."""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for result in self._results:
+                if self._log_formatter is not None:
+                    text = self._log_formatter(result)
+                    if text:
+                        self.log.add(text)
+                with self._lock:
+                    self._latest = result
+                    self._received += 1
+                if self._stop_event.is_set():
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            # Cerrar el generador en este hilo detiene y limpia el pipeline de procesamiento
+            close = getattr(self._results, "close", None)
+            if close is not None:
+                close()
+            self._done_event.set()
+
+    def poll(self):
+        """Retorna (último resultado, número de resultados recibidos)."""
+        with self._lock:
+            return self._latest, self._received
+
+    def wait(self, timeout=None):
+        """Espera hasta `timeout` segundos a que termine; retorna True si ya terminó."""
+        return self._done_event.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done_event.is_set()
+
+    def stop(self, timeout=5):
+        """Pide al hilo que se detenga tras el resultado actual y espera a que termine."""
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+
+class JsonlEventSink:
+    """
+    Destino de eventos de conteo que los escribe en un archivo JSON Lines a medida que
+    ocurren (una línea por cruce o entrada/salida de zona), en lugar de acumularlos en
+    memoria. Para grabaciones de un día o transmisiones continuas la memoria no crece con
+    el número de cruces, y el archivo se puede leer mientras se escribe.
+
+    Args:
+        path (str): Archivo de salida; se agrega al final si ya existe.
+        fps (float): FPS del video; si se indica, cada evento incluye `time_s` (segundos desde el inicio).
+    """
+    def __init__(self, path, fps=None):
+        self.path = Path(path)
+        self.fps = fps
+        self.written = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, events, timestamp=None):
+        """
+        Escribe los eventos de un fotograma. `timestamp` (segundos desde la época) es la hora
+        de captura en transmisiones en vivo.
+        """
+        if not events:
+            return
+        lines = []
+        for event in events:
+            record = {
+                "frame": event.frame_index,
+                "object_id": event.object_id,
+                "name": event.name,
+                "kind": event.kind,
+                "direction": event.direction,
+                "point": list(event.point),
+            }
+            if self.fps:
+                record["time_s"] = round(event.frame_index / self.fps, 3)
+            if timestamp is not None:
+                record["timestamp"] = round(timestamp, 3)
+            lines.append(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        self.written += len(events)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_events(path):
+    """Lee los eventos escritos por `JsonlEventSink` uno por uno, sin cargar el archivo entero."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,162 @@
+import numpy as np
+
+try:
+    from model_registry import DEFAULT_IMGSZ
+    from motion_gate import roi_around_line
+except ImportError:
+    from src.model_registry import DEFAULT_IMGSZ
+    from src.motion_gate import roi_around_line
+
+def _tile_starts(start, end, tile, step):
+    """Posiciones de inicio de los mosaicos que cubren [start, end); el último queda alineado al final."""
+    if end - start <= tile:
+        return [start]
+    starts = list(range(start, end - tile, step))
+    starts.append(end - tile)
+    return starts
+
+def merge_overlapping_boxes(boxes, windows, overlap_threshold=0.6):
+    """
+    Une las cajas repetidas por el solapamiento entre mosaicos.
+
+    Se recorren de mayor a menor área y se descarta cada caja cuya intersección con una
+    caja ya conservada de otro mosaico cae dentro del solapamiento de ambos mosaicos y
+    cubre más de `overlap_threshold` de su propia área (una bicicleta cortada por el borde
+    de un mosaico queda contenida en la caja del mosaico vecino). Las cajas de un mismo
+    mosaico ya pasaron por la supresión de no máximos del modelo y no se comparan entre
+    sí, así que dos ciclistas solapados en un grupo se conservan.
+
+    Args:
+        boxes (np.array): Cajas (x1, y1, x2, y2) en coordenadas del fotograma, forma (N, 4).
+        windows (np.array): Mosaico (x1, y1, x2, y2) del que proviene cada caja, forma (N, 4).
+    """
+    if len(boxes) < 2:
+        return boxes
+    boxes = np.asarray(boxes)
+    windows = np.asarray(windows)
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 1) * np.maximum(boxes[:, 3] - boxes[:, 1], 1)
+    order = np.argsort(-areas, kind="stable")
+    boxes, windows, areas = boxes[order], windows[order], areas[order]
+
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    # Región que comparten los mosaicos de cada par; vacía si es el mismo mosaico
+    other_tile = np.any(windows[:, None, :] != windows[None, :, :], axis=2)
+    in_overlap = ((x1 >= np.maximum(windows[:, None, 0], windows[None, :, 0])) &
+                  (y1 >= np.maximum(windows[:, None, 1], windows[None, :, 1])) &
+                  (x2 <= np.minimum(windows[:, None, 2], windows[None, :, 2])) &
+                  (y2 <= np.minimum(windows[:, None, 3], windows[None, :, 3])))
+    # covered[i, j]: la caja i es la caja j repetida por otro mosaico
+    covered = (intersection / areas[:, None] > overlap_threshold) & other_tile & in_overlap
+
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(1, len(boxes)):
+        if np.any(covered[i, :i] & keep[:i]):
+            keep[i] = False
+    return boxes[keep]
+
+class InferenceGeometry:
+    """
+    Geometría de la inferencia: qué parte del fotograma se envía al modelo y a qué resolución.
+
+    El conteo solo depende de lo que ocurre cerca de las líneas, así que la región de interés
+    (`roi`) se recorta antes de la inferencia y las cajas se trasladan de vuelta a
+    coordenadas del fotograma. Con `tile_size`, la región se divide además en mosaicos
+    solapados que el modelo analiza por separado (en un mismo lote), útil en videos 4K donde
+    los ciclistas ocupan pocos píxeles; las cajas repetidas en los solapamientos se unen.
+
+    Args:
+        roi (tuple): Región (x1, y1, x2, y2) en píxeles a analizar, o None para todo el fotograma.
+        imgsz (int): Tamaño de entrada del modelo; cada recorte o mosaico se escala a este tamaño.
+        tile_size (int): Lado de los mosaicos en píxeles del fotograma, o None para no dividir.
+        tile_overlap (float): Fracción de solapamiento entre mosaicos vecinos.
+    """
+    def __init__(self, roi=None, imgsz=DEFAULT_IMGSZ, tile_size=None, tile_overlap=0.2):
+        if roi is not None:
+            x1, y1, x2, y2 = (int(value) for value in roi)
+            if x2 <= x1 or y2 <= y1:
+                raise ValueError("La región de interés debe tener ancho y alto positivos.")
+            roi = (x1, y1, x2, y2)
+        if tile_size is not None and tile_size < 32:
+            raise ValueError("tile_size debe ser de al menos 32 píxeles.")
+        if not 0 <= tile_overlap < 1:
+            raise ValueError("tile_overlap debe estar entre 0 y 1.")
+        self.roi = roi
+        self.imgsz = int(imgsz)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+
+    @classmethod
+    def around_line(cls, line_coords, frame_width, frame_height, margin, **kwargs):
+        """Crea la geometría con una banda de `margin` píxeles alrededor de la línea de conteo."""
+        return cls(roi=roi_around_line(line_coords, frame_width, frame_height, margin), **kwargs)
+
+    def config(self):
+        """Parámetros que determinan las detecciones (p. ej. para claves de caché)."""
+        return {
+            "roi": list(self.roi) if self.roi is not None else None,
+            "imgsz": self.imgsz,
+            "tile_size": self.tile_size,
+            "tile_overlap": self.tile_overlap if self.tile_size else None,
+        }
+
+    def windows(self, frame_width, frame_height):
+        """Retorna las ventanas (x1, y1, x2, y2) que se envían al modelo para un fotograma."""
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(frame_width, x2), min(frame_height, y2)
+            if x2 <= x1 or y2 <= y1:
+                return []
+        else:
+            x1, y1, x2, y2 = 0, 0, frame_width, frame_height
+        if not self.tile_size:
+            return [(x1, y1, x2, y2)]
+
+        tile = self.tile_size
+        step = max(1, int(tile * (1 - self.tile_overlap)))
+        return [(tx, ty, min(tx + tile, x2), min(ty + tile, y2))
+                for ty in _tile_starts(y1, y2, tile, step)
+                for tx in _tile_starts(x1, x2, tile, step)]
+
+    def detect(self, frames, detector):
+        """
+        Ejecuta `detector` (una función lista de imágenes -> lista de cajas (N, 4)) sobre los
+        recortes de todos los fotogramas en una sola llamada y retorna las cajas de cada
+        fotograma en sus coordenadas.
+        """
+        if len(frames) == 0:
+            return []
+        crops = []
+        windows = []
+        owners = []
+        for index, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            for x1, y1, x2, y2 in self.windows(width, height):
+                crops.append(np.ascontiguousarray(frame[y1:y2, x1:x2]))
+                windows.append((x1, y1, x2, y2))
+                owners.append(index)
+
+        per_frame = [[] for _ in frames]
+        if crops:
+            for owner, window, boxes in zip(owners, windows, detector(crops)):
+                if len(boxes):
+                    x1, y1 = window[:2]
+                    boxes = np.asarray(boxes, dtype=np.int32) + np.array((x1, y1, x1, y1), dtype=np.int32)
+                    per_frame[owner].append((boxes, np.tile(np.array(window, dtype=np.int32), (len(boxes), 1))))
+
+        results = []
+        for detections in per_frame:
+            if not detections:
+                results.append(np.empty((0, 4), dtype=np.int32))
+            elif len(detections) == 1:
+                # Un solo mosaico con detecciones: no hay cajas repetidas entre mosaicos
+                results.append(detections[0][0])
+            else:
+                boxes, box_windows = zip(*detections)
+                results.append(merge_overlapping_boxes(np.concatenate(boxes), np.concatenate(box_windows)))
+        return results
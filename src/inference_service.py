@@ -0,0 +1,251 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+try:
+    from model_registry import DEFAULT_IMGSZ, DEFAULT_WEIGHTS, get_model
+    from video_processing import detect_bicycles_batch
+except ImportError:
+    from src.model_registry import DEFAULT_IMGSZ, DEFAULT_WEIGHTS, get_model
+    from src.video_processing import detect_bicycles_batch
+
+class _Request:
+    """Fotogramas enviados por una sesión en una llamada; se completa cuando todos tienen resultado."""
+    def __init__(self, frames, detection_threshold):
+        self.frames = frames
+        self.detection_threshold = detection_threshold
+        self.results = [None] * len(frames)
+        self.remaining = len(frames)
+        self.error = None
+        self.done = threading.Event()
+        if not frames:
+            self.done.set()
+
+    def _resolve(self, index, boxes):
+        self.results[index] = boxes
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+    def _fail(self, error):
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Espera los resultados y retorna la lista de cajas por fotograma."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("La inferencia no terminó a tiempo.")
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+class InferenceSession:
+    """
+    Cliente de `InferenceService` para una sesión (p. ej. una ejecución de `process_video`).
+
+    Cada sesión tiene su propia cola, limitada a `max_queue` fotogramas pendientes:
+    si se llena, `submit` espera a que el servicio la vacíe (contrapresión).
+    """
+    def __init__(self, service, session_id):
+        self._service = service
+        self.session_id = session_id
+        self.closed = False
+
+    def submit(self, frames, detection_threshold):
+        """Encola los fotogramas y retorna una solicitud; `solicitud.wait()` da las cajas por fotograma."""
+        return self._service._submit(self, list(frames), detection_threshold)
+
+    def detect(self, frames, detection_threshold, timeout=None):
+        """Detecta bicicletas en los fotogramas (como `detect_bicycles_batch`) a través del servicio."""
+        return self.submit(frames, detection_threshold).wait(timeout)
+
+    def close(self):
+        """Retira la sesión del servicio y cancela sus fotogramas pendientes."""
+        if not self.closed:
+            self.closed = True
+            self._service._close_session(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class InferenceService:
+    """
+    Servicio de inferencia del proceso: un hilo dueño del modelo que agrupa en lotes los
+    fotogramas de todas las sesiones concurrentes.
+
+    Cada lote se cierra cuando reúne `max_batch_size` fotogramas o cuando el fotograma más
+    antiguo lleva `max_wait` segundos esperando. Los fotogramas se toman de las sesiones por
+    turnos (round-robin), de modo que una sesión con muchos fotogramas pendientes no deja sin
+    servicio a las demás. Como cada sesión puede tener su propio umbral, el modelo se ejecuta
+    con el menor y cada fotograma se filtra con el de su sesión.
+
+    Args:
+        model: Modelo YOLOv8 (normalmente de `get_model`).
+        max_batch_size (int): Máximo de fotogramas por llamada al modelo.
+        max_wait (float): Segundos máximos que un fotograma espera a que se complete un lote.
+        max_queue (int): Máximo de fotogramas pendientes por sesión.
+    """
+    def __init__(self, model, max_batch_size=16, max_wait=0.01, max_queue=32):
+        if max_batch_size < 1 or max_queue < 1:
+            raise ValueError("max_batch_size y max_queue deben ser al menos 1.")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queues = {}
+        self._order = deque()
+        self._pending = 0
+        self._session_ids = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+
+    def session(self):
+        """Abre una nueva sesión en el servicio."""
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("El servicio de inferencia está detenido.")
+            session = InferenceSession(self, next(self._session_ids))
+            self._queues[session.session_id] = deque()
+            self._order.append(session.session_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="inference-service", daemon=True)
+                self._thread.start()
+            return session
+
+    def _submit(self, session, frames, detection_threshold):
+        request = _Request(frames, detection_threshold)
+        with self._condition:
+            for index in range(len(frames)):
+                while True:
+                    if self._stopped or session.closed:
+                        raise RuntimeError("La sesión de inferencia está cerrada.")
+                    queue = self._queues[session.session_id]
+                    if len(queue) < self.max_queue:
+                        break
+                    self._condition.wait()
+                queue.append((request, index, time.monotonic()))
+                self._pending += 1
+                self._condition.notify_all()
+        return request
+
+    def _close_session(self, session):
+        with self._condition:
+            queue = self._queues.pop(session.session_id, None)
+            if session.session_id in self._order:
+                self._order.remove(session.session_id)
+            if queue:
+                self._pending -= len(queue)
+                error = RuntimeError("La sesión de inferencia se cerró.")
+                for request, _, _ in queue:
+                    request._fail(error)
+            self._condition.notify_all()
+
+    def _take_batch(self):
+        """Toma hasta `max_batch_size` fotogramas, uno por sesión en cada turno."""
+        batch = []
+        while len(batch) < self.max_batch_size and self._pending > 0:
+            session_id = self._order.popleft()
+            self._order.append(session_id)
+            queue = self._queues[session_id]
+            if queue:
+                batch.append(queue.popleft())
+                self._pending -= 1
+        return batch
+
+    def _oldest_arrival(self):
+        return min(queue[0][2] for queue in self._queues.values() if queue)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and self._pending == 0:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                # Esperar a completar el lote, pero no más de max_wait desde el fotograma más antiguo
+                # ni cuando todas las sesiones ya tienen fotogramas en espera (nadie más va a enviar)
+                deadline = self._oldest_arrival() + self.max_wait
+                while (not self._stopped and 0 < self._pending < self.max_batch_size and
+                       not all(self._queues.values())):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped:
+                    return
+                batch = self._take_batch()
+                # Hay espacio en las colas: despertar a las sesiones bloqueadas en submit
+                self._condition.notify_all()
+            if not batch:
+                continue
+
+            frames = [request.frames[index] for request, index, _ in batch]
+            thresholds = [request.detection_threshold for request, _, _ in batch]
+            try:
+                results = detect_bicycles_batch(frames, self.model, thresholds)
+            except Exception as e:
+                for request, _, _ in batch:
+                    request._fail(e)
+                continue
+            with self._condition:
+                for (request, index, _), boxes in zip(batch, results):
+                    request._resolve(index, boxes)
+                self.batches += 1
+                self.frames += len(batch)
+
+    @property
+    def stats(self):
+        """Estadísticas de lotes ejecutados, fotogramas y sesiones abiertas."""
+        with self._condition:
+            return {
+                "batches": self.batches,
+                "frames": self.frames,
+                "mean_batch_size": self.frames / self.batches if self.batches else 0.0,
+                "sessions": len(self._queues),
+                "pending": self._pending,
+            }
+
+    def stop(self):
+        """Detiene el hilo del servicio; las solicitudes pendientes fallan."""
+        with self._condition:
+            self._stopped = True
+            error = RuntimeError("El servicio de inferencia está detenido.")
+            for queue in self._queues.values():
+                for request, _, _ in queue:
+                    request._fail(error)
+                queue.clear()
+            self._pending = 0
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+# Servicios compartidos por todo el proceso, uno por modelo
+_services = {}
+_services_lock = threading.Lock()
+
+def get_inference_service(weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ, device=None, **options):
+    """
+    Retorna el servicio de inferencia compartido del proceso para el modelo dado, creándolo
+    (con las `options` de `InferenceService`) la primera vez.
+
+    Raises:
+        IOError: Si el modelo no se puede cargar.
+    """
+    key = (str(weights), int(imgsz), device)
+    with _services_lock:
+        service = _services.get(key)
+    if service is not None:
+        return service
+
+    # La carga puede tardar minutos: se hace fuera del candado para no bloquear a las sesiones
+    # que usan otros modelos (el registro ya serializa las cargas del mismo modelo)
+    model = get_model(weights, imgsz, device)
+    with _services_lock:
+        return _services.setdefault(key, InferenceService(model, **options))
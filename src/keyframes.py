@@ -0,0 +1,76 @@
+import numpy as np
+
+try:
+    from counting import distance_to_segments
+except ImportError:
+    from src.counting import distance_to_segments
+
+class KeyframePolicy:
+    """
+    Decide en qué fotogramas se ejecuta el detector cuando no se analiza cada fotograma.
+
+    El detector corre cada `stride` fotogramas (fotogramas clave); entre ellos el tracker
+    avanza los objetos con su velocidad estimada (`CentroidTracker.predict`). Con la política
+    adaptativa, si algún objeto está cerca de una línea de conteo (a menos de `near_distance`
+    más lo que recorrería en `stride` fotogramas), se vuelve a detectar en cada fotograma
+    para no perder el momento del cruce.
+
+    Args:
+        stride (int): Número de fotogramas entre detecciones (1 detecta en todos).
+        adaptive (bool): Si se reduce el intervalo a 1 cuando hay objetos cerca de una línea.
+        near_distance (int): Distancia en píxeles a una línea a partir de la cual se considera cerca.
+    """
+    def __init__(self, stride=1, adaptive=True, near_distance=50):
+        if stride < 1:
+            raise ValueError("stride debe ser al menos 1.")
+        self.stride = stride
+        self.adaptive = adaptive
+        self.near_distance = near_distance
+        self._since_keyframe = None
+        self.frames = 0
+        self.keyframes = 0
+
+    def config(self):
+        """Parámetros que determinan qué fotogramas se detectan (p. ej. para claves de caché)."""
+        return {"stride": self.stride, "adaptive": self.adaptive, "near_distance": self.near_distance}
+
+    def current_stride(self, tracker, counter):
+        """Intervalo entre detecciones según el estado actual de los objetos y las líneas."""
+        if self.stride == 1 or not self.adaptive or not counter.lines:
+            return self.stride
+        centroids, velocities = tracker.motion_state()
+        if len(centroids) == 0:
+            return self.stride
+        p1 = np.array([line.p1 for line in counter.lines])
+        p2 = np.array([line.p2 for line in counter.lines])
+        distances = distance_to_segments(centroids, p1, p2).min(axis=1)
+        reach = self.near_distance + np.linalg.norm(velocities, axis=1) * self.stride
+        return 1 if np.any(distances <= reach) else self.stride
+
+    def plan(self, n_frames, tracker, counter):
+        """
+        Retorna, para los siguientes `n_frames` fotogramas, si cada uno es fotograma clave.
+
+        El intervalo se decide con el estado al inicio del lote.
+        """
+        stride = self.current_stride(tracker, counter)
+        flags = []
+        for _ in range(n_frames):
+            if self._since_keyframe is None or self._since_keyframe + 1 >= stride:
+                self._since_keyframe = 0
+                flags.append(True)
+            else:
+                self._since_keyframe += 1
+                flags.append(False)
+        self.frames += n_frames
+        self.keyframes += sum(flags)
+        return flags
+
+    @property
+    def stats(self):
+        """Estadísticas de fotogramas totales y fotogramas clave."""
+        return {
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "keyframe_ratio": self.keyframes / self.frames if self.frames else 0.0,
+        }
@@ -0,0 +1,224 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from pyinstrument import Profiler as _PyinstrumentProfiler
+    from pyinstrument.renderers import ConsoleRenderer as _PyinstrumentRenderer
+    from pyinstrument.session import Session as _PyinstrumentSession
+except ImportError:
+    _PyinstrumentProfiler = None
+
+class Histogram:
+    """
+    Duraciones de una etapa: conteo y total exactos, y percentiles sobre las últimas
+    `window` muestras (un arreglo circular, así que la memoria no crece con el video).
+    """
+    def __init__(self, window=4096):
+        self._samples = np.zeros(window, dtype=np.float64)
+        self._next = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % len(self._samples)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        """Retorna conteo, total, media, máximo y percentiles 50/95/99 en milisegundos."""
+        if self.count == 0:
+            return {"count": 0, "total_s": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0,
+                    "max_ms": 0.0}
+        samples = self._samples[:min(self.count, len(self._samples))]
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 4),
+            "p50_ms": round(float(p50), 4),
+            "p95_ms": round(float(p95), 4),
+            "p99_ms": round(float(p99), 4),
+            "max_ms": round(self.max * 1000, 4),
+        }
+
+class PipelineMetrics:
+    """
+    Métricas de una ejecución del pipeline de procesamiento.
+
+    Registra un histograma de duraciones por etapa (decodificación, detección, tracker,
+    conteo, anotación, interfaz...), los fotogramas producidos, los FPS promedio y
+    recientes, el número de objetos seguidos y la ocupación de las colas entre etapas.
+    Es seguro actualizarlo desde los hilos del pipeline y leerlo desde otro hilo;
+    `snapshot()` calcula los percentiles, así que conviene llamarlo solo al refrescar.
+
+    Args:
+        window (int): Número de muestras recientes por etapa para calcular percentiles.
+    """
+    def __init__(self, window=4096):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._queues = []
+        self._frame_times = deque(maxlen=120)
+        self.start_time = time.perf_counter()
+        self.frames = 0
+        self.active_tracks = 0
+
+    def observe(self, stage, seconds):
+        """Registra una duración (en segundos) para la etapa `stage`."""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Mide la duración del bloque y la registra en la etapa `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def frame_done(self, active_tracks=None):
+        """Registra un fotograma terminado y, opcionalmente, el número de objetos seguidos."""
+        with self._lock:
+            self.frames += 1
+            self._frame_times.append(time.perf_counter())
+            if active_tracks is not None:
+                self.active_tracks = active_tracks
+
+    def track_queues(self, queues):
+        """Registra las colas del pipeline cuya ocupación se reporta en las métricas."""
+        self._queues = list(queues)
+
+    def snapshot(self):
+        """Retorna las métricas actuales como diccionario serializable en JSON."""
+        with self._lock:
+            elapsed = time.perf_counter() - self.start_time
+            recent = 0.0
+            if len(self._frame_times) > 1:
+                span = self._frame_times[-1] - self._frame_times[0]
+                recent = (len(self._frame_times) - 1) / span if span > 0 else 0.0
+            return {
+                "frames": self.frames,
+                "elapsed_s": round(elapsed, 3),
+                "fps": round(self.frames / elapsed, 2) if elapsed > 0 else 0.0,
+                "recent_fps": round(recent, 2),
+                "active_tracks": self.active_tracks,
+                "queue_depths": [q.qsize() for q in self._queues],
+                "stages": {name: histogram.summary() for name, histogram in self._stages.items()},
+            }
+
+    def to_prometheus(self, prefix="cycling"):
+        """Retorna las métricas en el formato de texto de Prometheus."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# TYPE {prefix}_frames_total counter",
+            f"{prefix}_frames_total {snapshot['frames']}",
+            f"# TYPE {prefix}_fps gauge",
+            f"{prefix}_fps {snapshot['fps']}",
+            f"# TYPE {prefix}_recent_fps gauge",
+            f"{prefix}_recent_fps {snapshot['recent_fps']}",
+            f"# TYPE {prefix}_active_tracks gauge",
+            f"{prefix}_active_tracks {snapshot['active_tracks']}",
+            f"# TYPE {prefix}_queue_depth gauge",
+        ]
+        lines += [f'{prefix}_queue_depth{{queue="{i}"}} {depth}' for i, depth in enumerate(snapshot["queue_depths"])]
+        lines.append(f"# TYPE {prefix}_stage_seconds summary")
+        for name, summary in snapshot["stages"].items():
+            for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{quantile}"}} '
+                             f'{summary[key] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {summary["total_s"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        Escribe las métricas en `path` de forma atómica: en formato de texto de Prometheus si
+        la extensión es .prom, o en JSON en cualquier otro caso.
+        """
+        path = Path(path)
+        text = self.to_prometheus() if path.suffix == ".prom" else json.dumps(self.snapshot(), indent=2)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+class SamplingProfiler:
+    """
+    Perfilador opcional de los hilos del pipeline.
+
+    Usa pyinstrument (por muestreo) si está instalado y cProfile en caso contrario. Como
+    ambos perfilan solo el hilo en que se inician, cada hilo del pipeline entra en
+    `profile_thread()` y al final se combinan los resultados y se escribe un informe de
+    texto en `path`.
+    """
+    def __init__(self, path, interval=0.001):
+        self.path = Path(path)
+        self.interval = interval
+        self.backend = "pyinstrument" if _PyinstrumentProfiler is not None else "cProfile"
+        self._lock = threading.Lock()
+        self._results = []
+
+    @contextmanager
+    def profile_thread(self):
+        """Perfila el bloque en el hilo actual."""
+        if self.backend == "pyinstrument":
+            profiler = _PyinstrumentProfiler(interval=self.interval, async_mode="disabled")
+            profiler.start()
+            try:
+                yield
+            finally:
+                session = profiler.stop()
+                with self._lock:
+                    self._results.append(session)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                with self._lock:
+                    self._results.append(profiler)
+
+    def write(self):
+        """Combina los perfiles de todos los hilos y escribe el informe; retorna su ruta."""
+        with self._lock:
+            results = list(self._results)
+        if not results:
+            return None
+        if self.backend == "pyinstrument":
+            session = results[0]
+            for other in results[1:]:
+                session = _PyinstrumentSession.combine(session, other)
+            text = _PyinstrumentRenderer(unicode=True, color=False).render(session)
+        else:
+            stream = io.StringIO()
+            stats = pstats.Stats(results[0], stream=stream)
+            for other in results[1:]:
+                stats.add(other)
+            stats.sort_stats("cumulative").print_stats(60)
+            text = stream.getvalue()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return self.path
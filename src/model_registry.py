@@ -0,0 +1,141 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    from ultralytics import YOLO
+except ImportError as e:
+    print(f"Error importing ultralytics: {e}")
+    sys.exit(1)
+
+DEFAULT_WEIGHTS = "yolov8n.pt"
+DEFAULT_IMGSZ = 640
+
+class LoadedModel:
+    """
+    Modelo YOLOv8 cargado una sola vez y compartido por todo el proceso.
+
+    Se usa igual que el modelo de Ultralytics (`loaded(frames, ...)` y `loaded.names`),
+    pero serializa las inferencias con un candado porque el predictor de Ultralytics
+    no es seguro para usarse desde varios hilos a la vez.
+    """
+    def __init__(self, model, weights, imgsz, device, load_time, warmup_time):
+        self.model = model
+        self.weights = weights
+        self.imgsz = imgsz
+        self.device = device
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, source, **kwargs):
+        kwargs.setdefault("imgsz", self.imgsz)
+        if self.device is not None:
+            kwargs.setdefault("device", self.device)
+        with self._lock:
+            return self.model(source, **kwargs)
+
+class ModelRegistry:
+    """
+    Registro de modelos del proceso, indexado por (pesos, tamaño de entrada, dispositivo).
+
+    Cada combinación se carga y se calienta una sola vez; las llamadas concurrentes
+    para la misma clave esperan a que termine la primera carga en lugar de repetirla.
+    """
+    def __init__(self):
+        self._models = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ, device=None):
+        """
+        Retorna el modelo cargado para la clave dada, cargándolo y calentándolo si hace falta.
+
+        Raises:
+            IOError: Si el modelo no se puede cargar.
+        """
+        key = (str(weights), int(imgsz), device)
+        with self._lock:
+            loaded = self._models.get(key)
+            if loaded is not None:
+                return loaded
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Otra sesión pudo haber terminado la carga mientras esperábamos
+            with self._lock:
+                loaded = self._models.get(key)
+            if loaded is not None:
+                return loaded
+
+            loaded = self._load(*key)
+            with self._lock:
+                self._models[key] = loaded
+            return loaded
+
+    def register(self, weights, model, imgsz=DEFAULT_IMGSZ, device=None):
+        """
+        Registra un modelo ya construido bajo la clave dada, sin cargarlo ni calentarlo.
+
+        Sirve para usar un detector propio con la misma interfaz que el de Ultralytics
+        (p. ej. el detector de prueba de los benchmarks) en lugar de descargar pesos.
+        """
+        key = (str(weights), int(imgsz), device)
+        loaded = LoadedModel(model, str(weights), int(imgsz), device, 0.0, 0.0)
+        with self._lock:
+            self._models[key] = loaded
+        return loaded
+
+    def _load(self, weights, imgsz, device):
+        start = time.perf_counter()
+        try:
+            model = YOLO(weights)
+        except Exception as e:
+            raise IOError(f"Error loading YOLOv8 model: {e}. Please check your internet connection for first-time model download.")
+        load_time = time.perf_counter() - start
+
+        # La primera inferencia inicializa el predictor; se hace aquí y no con el primer fotograma real
+        start = time.perf_counter()
+        warmup_frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        kwargs = {"imgsz": imgsz, "verbose": False}
+        if device is not None:
+            kwargs["device"] = device
+        model(warmup_frame, **kwargs)
+        warmup_time = time.perf_counter() - start
+
+        return LoadedModel(model, weights, imgsz, device, load_time, warmup_time)
+
+    def timings(self):
+        """Retorna los tiempos de carga y calentamiento (en segundos) de cada modelo cargado."""
+        with self._lock:
+            return {
+                key: {"load_s": loaded.load_time, "warmup_s": loaded.warmup_time}
+                for key, loaded in self._models.items()
+            }
+
+    def clear(self):
+        """Descarta todos los modelos cargados."""
+        with self._lock:
+            self._models.clear()
+            self._key_locks.clear()
+
+# Registro compartido por todo el proceso (todas las sesiones de Streamlit)
+_registry = ModelRegistry()
+
+def get_model(weights=DEFAULT_WEIGHTS, imgsz=DEFAULT_IMGSZ, device=None):
+    """Retorna el modelo compartido del proceso para (pesos, tamaño de entrada, dispositivo)."""
+    return _registry.get(weights, imgsz, device)
+
+def register_model(weights, model, imgsz=DEFAULT_IMGSZ, device=None):
+    """Registra `model` en el registro compartido del proceso bajo (pesos, tamaño de entrada, dispositivo)."""
+    return _registry.register(weights, model, imgsz, device)
+
+def model_timings():
+    """Retorna los tiempos de carga y calentamiento de los modelos del registro compartido."""
+    return _registry.timings()
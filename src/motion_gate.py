@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+
+def roi_around_line(line_coords, frame_width, frame_height, margin):
+    """
+    Retorna la región (x1, y1, x2, y2) que rodea la línea de conteo con un margen en píxeles.
+
+    La región se recorta a los límites del fotograma.
+    """
+    (x1, y1), (x2, y2) = line_coords
+    return (max(0, min(x1, x2) - margin), max(0, min(y1, y2) - margin),
+            min(frame_width, max(x1, x2) + margin), min(frame_height, max(y1, y2) + margin))
+
+class MotionGate:
+    """
+    Filtro barato de movimiento que decide si vale la pena ejecutar el detector en un fotograma.
+
+    Trabaja sobre fotogramas reducidos en escala de grises, con diferencia entre fotogramas
+    consecutivos ("diff") o con sustracción de fondo MOG2 ("mog2"), opcionalmente solo dentro
+    de una región de interés. Un fotograma se considera activo si la fracción de píxeles en
+    movimiento supera `min_motion_ratio`; después de un fotograma activo se mantienen activos
+    los siguientes `hold_frames` para no cortar el seguimiento cuando el movimiento es leve.
+
+    Args:
+        scale (float): Factor de reducción aplicado antes de analizar el movimiento.
+        method (str): "diff" para diferencia de fotogramas o "mog2" para sustracción de fondo.
+        diff_threshold (int): Diferencia de intensidad (0-255) para marcar un píxel como en movimiento.
+        min_motion_ratio (float): Fracción mínima de píxeles en movimiento para activar el detector.
+        roi (tuple): Región (x1, y1, x2, y2) en píxeles del fotograma original, o None para todo el fotograma.
+        hold_frames (int): Fotogramas que se mantienen activos después de detectar movimiento.
+    """
+    def __init__(self, scale=0.25, method="diff", diff_threshold=25, min_motion_ratio=0.002,
+                 roi=None, hold_frames=5):
+        if method not in ("diff", "mog2"):
+            raise ValueError("method debe ser 'diff' o 'mog2'.")
+        if not 0 < scale <= 1:
+            raise ValueError("scale debe estar entre 0 y 1.")
+        self.scale = scale
+        self.method = method
+        self.diff_threshold = diff_threshold
+        self.min_motion_ratio = min_motion_ratio
+        self.roi = roi
+        self.hold_frames = hold_frames
+        self.reset()
+
+    def reset(self):
+        """Reinicia el estado y las estadísticas del filtro."""
+        self._previous = None
+        self._hold = 0
+        self._subtractor = None
+        if self.method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=self.diff_threshold, detectShadows=False)
+        self.frames = 0
+        self.skipped = 0
+
+    def config(self):
+        """Parámetros que determinan qué fotogramas se omiten (p. ej. para claves de caché)."""
+        return {
+            "scale": self.scale, "method": self.method, "diff_threshold": self.diff_threshold,
+            "min_motion_ratio": self.min_motion_ratio,
+            "roi": list(self.roi) if self.roi is not None else None, "hold_frames": self.hold_frames,
+        }
+
+    @property
+    def stats(self):
+        """Estadísticas de fotogramas analizados y omitidos."""
+        active = self.frames - self.skipped
+        return {
+            "frames": self.frames,
+            "active": active,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+        }
+
+    def _prepare(self, frame):
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            frame = frame[y1:y2, x1:x2]
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _motion_ratio(self, gray):
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+        else:
+            if self._previous is None or self._previous.shape != gray.shape:
+                self._previous = gray
+                return 1.0
+            diff = cv2.absdiff(gray, self._previous)
+            self._previous = gray
+            _, mask = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        return np.count_nonzero(mask) / mask.size if mask.size else 0.0
+
+    def is_active(self, frame):
+        """Retorna True si se debe ejecutar el detector en este fotograma."""
+        self.frames += 1
+        if self._motion_ratio(self._prepare(frame)) >= self.min_motion_ratio:
+            self._hold = self.hold_frames
+            return True
+        if self._hold > 0:
+            self._hold -= 1
+            return True
+        self.skipped += 1
+        return False
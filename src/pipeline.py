@@ -0,0 +1,116 @@
+import queue
+import threading
+from contextlib import nullcontext
+
+# Marcador que indica que una etapa ya no producirá más elementos
+_DONE = object()
+
+class _Failure:
+    """Envuelve una excepción lanzada en un hilo de trabajo para relanzarla en el consumidor."""
+    def __init__(self, error):
+        self.error = error
+
+def _put(q, item, stop_event):
+    """Coloca un elemento en una cola acotada sin bloquearse para siempre si se pide detener."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop_event):
+    """Obtiene un elemento de una cola; retorna _DONE si se pide detener."""
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _run_source(source, out_q, stop_event, profiler=None):
+    with profiler.profile_thread() if profiler is not None else nullcontext():
+        _read_source(source, out_q, stop_event)
+
+def _read_source(source, out_q, stop_event):
+    try:
+        for item in source:
+            if not _put(out_q, item, stop_event):
+                break
+    except Exception as e:
+        _put(out_q, _Failure(e), stop_event)
+        return
+    finally:
+        # Cerrar el generador en este mismo hilo libera sus recursos (p. ej. el VideoCapture)
+        if hasattr(source, "close"):
+            source.close()
+    _put(out_q, _DONE, stop_event)
+
+def _run_stage(stage, in_q, out_q, stop_event, profiler=None):
+    with profiler.profile_thread() if profiler is not None else nullcontext():
+        _process_stage(stage, in_q, out_q, stop_event)
+
+def _process_stage(stage, in_q, out_q, stop_event):
+    while True:
+        item = _get(in_q, stop_event)
+        if item is _DONE or isinstance(item, _Failure):
+            _put(out_q, item, stop_event)
+            return
+        try:
+            for result in stage(item):
+                if not _put(out_q, result, stop_event):
+                    return
+        except Exception as e:
+            _put(out_q, _Failure(e), stop_event)
+            return
+
+def run_pipeline(source, stages, queue_size=8, metrics=None, profiler=None):
+    """
+    Ejecuta un pipeline por etapas y produce los resultados de la última etapa.
+
+    La fuente y cada etapa corren en su propio hilo y se conectan con colas acotadas,
+    de modo que una etapa lenta frena a las anteriores (contrapresión) en lugar de
+    acumular fotogramas en memoria. Como cada etapa procesa sus elementos en un solo
+    hilo y en orden FIFO, los resultados salen en el mismo orden en que los produjo
+    la fuente.
+
+    Args:
+        source (iterable): Iterable que produce los elementos de entrada (p. ej. lotes de fotogramas).
+        stages (list): Funciones que reciben un elemento y retornan un iterable de elementos de salida.
+        queue_size (int): Capacidad máxima de cada cola entre etapas.
+        metrics (PipelineMetrics): Métricas opcionales en las que se reporta la ocupación de las colas.
+        profiler (SamplingProfiler): Perfilador opcional; cada hilo del pipeline se perfila con él.
+
+    Yields:
+        Los elementos producidos por la última etapa, en orden.
+    """
+    if queue_size < 1:
+        raise ValueError("queue_size debe ser al menos 1.")
+
+    stop_event = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    if metrics is not None:
+        metrics.track_queues(queues)
+    threads = [threading.Thread(target=_run_source, args=(iter(source), queues[0], stop_event, profiler),
+                                name="pipeline-source", daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_run_stage,
+                                        args=(stage, queues[i], queues[i + 1], stop_event, profiler),
+                                        name=f"pipeline-stage-{i}", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # El consumidor terminó o dejó de iterar: detener y esperar a los hilos de trabajo
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=5)
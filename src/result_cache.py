@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+class ResultCache:
+    """
+    Caché en disco de resultados finales de análisis, direccionada por contenido.
+
+    Cada entrada es un JSON pequeño (conteo final, conteos por línea y lista de cruces)
+    identificado por el hash del video y todos los parámetros que cambian el conteo, de
+    modo que volver a enviar el mismo video con la misma configuración responde al
+    instante. Cuando el tamaño total supera `max_bytes` se eliminan las entradas usadas
+    hace más tiempo (LRU, según la fecha de modificación, que se actualiza en cada acierto).
+
+    Args:
+        root (str): Directorio de la caché.
+        max_bytes (int): Tamaño máximo total de las entradas en bytes.
+    """
+    def __init__(self, root, max_bytes=64 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(video_hash, model_weights, detection_threshold, line_coords, **options):
+        """
+        Retorna la clave de un resultado. Las opciones adicionales (serializables en JSON) que
+        cambian el conteo, como los parámetros del tracker, se pasan como argumentos con
+        nombre; las que son None se ignoran.
+        """
+        params = {
+            "video": video_hash,
+            "model": str(model_weights),
+            "threshold": round(float(detection_threshold), 6),
+            "line": [[int(x), int(y)] for x, y in line_coords],
+        }
+        params.update({name: value for name, value in options.items() if value is not None})
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return self.root / f"{key}.json"
+
+    def get(self, key):
+        """Retorna el resultado guardado para `key`, o None si no existe."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            # Marcar la entrada como usada recientemente
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Guarda `result` (serializable en JSON) de forma atómica y aplica el límite de tamaño."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Elimina las entradas menos usadas hasta que el tamaño total quede bajo `max_bytes`."""
+        entries = []
+        total = 0
+        for path in self.root.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        return total
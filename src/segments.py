@@ -0,0 +1,230 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError as e:
+    print(f"Error importing scipy: {e}")
+    sys.exit(1)
+
+try:
+    from video_processing import DEFAULT_WEIGHTS, get_model, probe_video, process_video
+except ImportError:
+    from src.video_processing import DEFAULT_WEIGHTS, get_model, probe_video, process_video
+
+def split_frames(total_frames, segments):
+    """
+    Divide `total_frames` fotogramas en `segments` rangos contiguos [inicio, fin) de tamaño similar.
+
+    El último rango termina en None para procesar hasta el final aunque el número de
+    fotogramas que reporta el contenedor no sea exacto.
+    """
+    segments = max(1, min(segments, total_frames))
+    bounds = np.linspace(0, total_frames, segments + 1).astype(int)
+    ranges = [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+def init_worker(model_weights, threads):
+    """
+    Inicializa cada proceso de un grupo: limita los hilos de PyTorch y carga (y calienta) su
+    modelo. La comparten el procesamiento por segmentos y el procesamiento en lote.
+    """
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    get_model(model_weights)
+
+def _process_segment(video_path, line_coords, detection_threshold, start, end, warmup_frames, options):
+    """
+    Procesa un segmento empezando `warmup_frames` antes de `start` para que el tracker llegue
+    al inicio del segmento con los objetos ya seguidos.
+
+    Returns:
+        dict: Eventos del segmento y objetos seguidos en sus fotogramas de frontera
+        (índices desde 1, los del video completo).
+    """
+    # Al menos un fotograma de solapamiento para poder unir los objetos en la frontera
+    first = max(0, start - max(1, warmup_frames))
+    events = []
+    start_objects = []
+    end_objects = []
+    last = None
+    for result in process_video(video_path, line_coords, detection_threshold, annotate=False,
+                                start_frame=first, end_frame=end, **options):
+        events.extend(result.events)
+        if result.frame_index == start:
+            start_objects = result.objects
+        end_objects = result.objects
+        last = result
+    return {
+        "start": start,
+        "end": last.frame_index if last is not None else start,
+        "events": events,
+        "start_objects": start_objects,
+        "end_objects": end_objects,
+        "counts": last.counts if last is not None else {},
+    }
+
+def _match_objects(previous, current, max_distance):
+    """
+    Empareja los objetos de dos segmentos en el mismo fotograma de frontera por distancia
+    entre centroides (asignación húngara). Retorna un diccionario id actual -> id anterior.
+    """
+    if not previous or not current:
+        return {}
+    prev_centroids = np.array([centroid for _, centroid, _ in previous], dtype=np.float64)
+    curr_centroids = np.array([centroid for _, centroid, _ in current], dtype=np.float64)
+    distances = np.linalg.norm(curr_centroids[:, None, :] - prev_centroids[None, :, :], axis=2)
+    rows, cols = linear_sum_assignment(distances)
+    return {current[row][0]: previous[col][0]
+            for row, col in zip(rows, cols) if distances[row, col] <= max_distance}
+
+def merge_segments(results, stitch_distance=75):
+    """
+    Une los resultados de segmentos consecutivos en un único conteo.
+
+    Los IDs locales de cada segmento se traducen a IDs globales: un objeto que está siendo
+    seguido en el fotograma de frontera se identifica con el objeto más cercano del segmento
+    anterior en ese mismo fotograma. De cada segmento se conservan solo los eventos posteriores
+    a su inicio (los del calentamiento pertenecen al segmento anterior) y cada objeto global
+    se cuenta como máximo una vez por línea, igual que en el procesamiento secuencial.
+
+    Args:
+        results (list): Resultados de `_process_segment` en orden.
+        stitch_distance (float): Distancia máxima en píxeles para unir dos objetos en la frontera.
+
+    Returns:
+        dict: count, counts y events (con IDs globales) del video completo.
+    """
+    next_id = 0
+    previous_map = {}
+    previous_end_objects = []
+    counted = set()
+    counted_any = set()
+    line_counts = {}
+    zone_counts = {}
+    events = []
+
+    for result in results:
+        local_map = {}
+        for local_id, previous_local in _match_objects(previous_end_objects, result["start_objects"],
+                                                       stitch_distance).items():
+            if previous_local in previous_map:
+                local_map[local_id] = previous_map[previous_local]
+
+        def global_id(local_id):
+            nonlocal next_id
+            if local_id not in local_map:
+                local_map[local_id] = next_id
+                next_id += 1
+            return local_map[local_id]
+
+        for name, value in result["counts"].items():
+            if "inside" in value:
+                zone_counts.setdefault(name, {"enter": 0, "exit": 0, "inside": 0})
+            else:
+                line_counts.setdefault(name, {"in": 0, "out": 0})
+
+        for event in result["events"]:
+            if event.frame_index <= result["start"]:
+                continue
+            object_id = global_id(event.object_id)
+            if event.kind == "line":
+                if (object_id, event.name) in counted:
+                    continue
+                counted.add((object_id, event.name))
+                counted_any.add(object_id)
+                line_counts[event.name][event.direction] += 1
+            else:
+                zone_counts[event.name][event.direction] += 1
+            events.append(event._replace(object_id=object_id))
+
+        # Los IDs de los objetos vivos al final se necesitan para la siguiente frontera
+        for object_id, _, _ in result["end_objects"]:
+            global_id(object_id)
+        previous_map = local_map
+        previous_end_objects = result["end_objects"]
+
+    # La ocupación de las zonas es la del último fotograma del video
+    if results:
+        for name, value in results[-1]["counts"].items():
+            if name in zone_counts:
+                zone_counts[name]["inside"] = value["inside"]
+
+    counts = dict(line_counts)
+    counts.update(zone_counts)
+    return {"count": len(counted_any), "counts": counts, "events": events}
+
+def _segment_profile(profile_path, index):
+    if not profile_path:
+        return None
+    path = Path(profile_path)
+    return str(path.with_name(f"{path.stem}.segment{index}{path.suffix}"))
+
+def process_video_segments(video_path, line_coords, detection_threshold, workers=None, segments=None,
+                           warmup_frames=60, stitch_distance=None, threads_per_worker=None, profile_path=None,
+                           **options):
+    """
+    Procesa un video largo dividiéndolo en segmentos que se procesan en paralelo en varios procesos.
+
+    Cada proceso posiciona el video en su segmento con `CAP_PROP_POS_FRAMES` y empieza
+    `warmup_frames` fotogramas antes para que el tracker ya siga a los ciclistas que están
+    en escena al inicio del segmento. Después, `merge_segments` une los objetos en cada
+    frontera para que ningún ciclista se cuente dos veces ni se pierda.
+
+    Args:
+        video_path (str): Ruta al archivo de video.
+        line_coords (tuple): Tupla con dos puntos ((x1, y1), (x2, y2)) que definen la línea.
+        detection_threshold (float): Umbral de confianza para la detección.
+        workers (int): Número de procesos (por defecto, uno por núcleo).
+        segments (int): Número de segmentos (por defecto, uno por proceso).
+        warmup_frames (int): Fotogramas de solapamiento antes de cada segmento.
+        stitch_distance (float): Distancia máxima para unir objetos en la frontera (por defecto,
+            `max_distance` del tracker).
+        threads_per_worker (int): Hilos de PyTorch por proceso (por defecto, núcleos / procesos).
+        profile_path (str): Si se indica, se perfila cada segmento y su informe se escribe junto a
+            esta ruta con el número de segmento (p. ej. `perfil.segment0.txt`).
+        **options: Argumentos adicionales de `process_video` (batch_size, model_weights, lines,
+            zones, max_disappeared, max_distance, ...). Deben poder enviarse a otro proceso.
+
+    Returns:
+        dict: count, counts, events (IDs globales), frames, segments y elapsed (segundos).
+    """
+    info = probe_video(video_path)
+    total_frames = info.frame_count
+
+    workers = workers or os.cpu_count() or 1
+    ranges = split_frames(total_frames, segments or workers) if total_frames > 0 else [(0, None)]
+    workers = min(workers, len(ranges))
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    if stitch_distance is None:
+        stitch_distance = options.get("max_distance", 75)
+    model_weights = options.get("model_weights", DEFAULT_WEIGHTS)
+
+    start_time = time.perf_counter()
+    # "spawn" evita heredar el estado de hilos de PyTorch del proceso principal
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(model_weights, threads)) as executor:
+        futures = [executor.submit(_process_segment, str(video_path), line_coords, detection_threshold,
+                                   start, end, warmup_frames,
+                                   dict(options, video_info=info, profile_path=_segment_profile(profile_path, index)))
+                   for index, (start, end) in enumerate(ranges)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start_time
+
+    merged = merge_segments(results, stitch_distance)
+    merged.update({
+        "frames": results[-1]["end"] if results else 0,
+        "segments": [(start, end if end is not None else result["end"])
+                     for (start, end), result in zip(ranges, results)],
+        "elapsed": elapsed,
+    })
+    return merged
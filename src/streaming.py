@@ -0,0 +1,429 @@
+import math
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+try:
+    from video_processing import (DEFAULT_IMGSZ, DEFAULT_WEIGHTS, VideoInfo, _FrameAnalyzer, _annotate_frame,
+                                  _make_counter, detect_bicycles_batch, get_model)
+    from metrics import PipelineMetrics
+except ImportError:
+    from src.video_processing import (DEFAULT_IMGSZ, DEFAULT_WEIGHTS, VideoInfo, _FrameAnalyzer, _annotate_frame,
+                                      _make_counter, detect_bicycles_batch, get_model)
+    from src.metrics import PipelineMetrics
+
+# Fotograma leído por `FrameGrabber`.
+#   index: número de fotograma desde 1, en orden de captura (incluye los descartados).
+#   capture_time: instante de captura según `time.perf_counter()` (para medir latencia).
+#   timestamp: hora de captura según `time.time()` (para las ventanas de conteo).
+#   frame: imagen BGR (np.array).
+GrabbedFrame = namedtuple("GrabbedFrame", ["index", "capture_time", "timestamp", "frame"])
+
+# Conteos de una ventana de tiempo [start, end) en segundos desde la época.
+#   count: ciclistas distintos que cruzaron alguna línea en la ventana.
+#   counts: cruces por línea ({"in", "out"}) y entradas/salidas por zona ({"enter", "exit"}).
+#   frames: fotogramas analizados en la ventana.
+CountWindow = namedtuple("CountWindow", ["start", "end", "count", "counts", "frames"])
+
+# Resultado producido por `process_stream` para cada fotograma analizado.
+#   frame, count, frame_index, events, counts, objects, metrics: como en `FrameResult`.
+#   window: `CountWindow` en curso (parcial).
+#   closed_windows: ventanas que se cerraron con este fotograma (normalmente ninguna).
+#   latency: segundos desde la captura del fotograma hasta la actualización del conteo.
+#   over_budget: fotogramas analizados hasta ahora cuya latencia superó el presupuesto.
+# Si la fuente no entrega fotogramas durante `heartbeat` segundos se produce un resultado sin
+# fotograma (frame, objects y events vacíos, latency None) que cierra las ventanas vencidas.
+StreamResult = namedtuple("StreamResult", ["frame", "count", "frame_index", "events", "counts", "objects",
+                                           "metrics", "window", "closed_windows", "latency", "over_budget"])
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+def parse_source(source):
+    """Convierte un número de dispositivo escrito como texto ("0") en entero; deja URLs y rutas igual."""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source.strip())
+    return source
+
+class FrameGrabber:
+    """
+    Lee una fuente en vivo en un hilo propio y conserva solo los fotogramas más recientes.
+
+    La fuente puede ser cualquier cosa que acepte `cv2.VideoCapture`: un número de
+    dispositivo, una URL (RTSP, HTTP...) o un archivo local. Un archivo se reproduce a su
+    velocidad nativa (como lo haría una cámara) y, con `loop`, vuelve a empezar al terminar,
+    lo que permite simular una cámara con una grabación.
+
+    El búfer guarda como máximo `buffer_size` fotogramas. Cuando el análisis no alcanza a la
+    cámara y el búfer está lleno, `policy` decide qué se descarta: "drop_oldest" descarta el
+    fotograma más antiguo (se analiza siempre lo más reciente, con la menor latencia) y
+    "drop_newest" descarta el recién capturado (se conservan los que ya esperaban).
+
+    Args:
+        source: Número de dispositivo, URL o ruta de la fuente.
+        policy (str): "drop_oldest" o "drop_newest".
+        buffer_size (int): Máximo de fotogramas en espera.
+        loop (bool): Si la fuente es un archivo, volver a empezar al terminar.
+        realtime (bool): Leer a la velocidad nativa de la fuente. Por defecto, solo para
+            archivos locales (las cámaras y streams ya entregan a su propio ritmo).
+
+    Raises:
+        IOError: Si la fuente no se puede abrir.
+    """
+    def __init__(self, source, policy=DROP_OLDEST, buffer_size=1, loop=False, realtime=None):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Política de descarte no válida: '{policy}'. Use '{DROP_OLDEST}' o '{DROP_NEWEST}'.")
+        if buffer_size < 1:
+            raise ValueError("buffer_size debe ser al menos 1.")
+        self.source = parse_source(source)
+        self.is_file = isinstance(self.source, (str, os.PathLike)) and os.path.isfile(self.source)
+        self.policy = policy
+        self.loop = loop and self.is_file
+        self.realtime = self.is_file if realtime is None else realtime
+
+        self._cap = cv2.VideoCapture(self.source if isinstance(self.source, int) else str(self.source))
+        if not self._cap.isOpened():
+            raise IOError(f"Error al abrir la fuente de video: {source}")
+        self.info = VideoInfo(int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                              int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                              self._cap.get(cv2.CAP_PROP_FPS) or 0.0,
+                              int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.is_file else 0)
+
+        self._buffer = deque()
+        self._buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._ended = False
+        self._thread = None
+        self.error = None
+        self.grabbed = 0
+        self.dropped = 0
+        self.stale = 0
+        self.delivered = 0
+
+    def start(self):
+        """Inicia el hilo de captura y retorna el propio objeto."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        interval = 1.0 / self.info.fps if self.realtime and self.info.fps > 0 else 0.0
+        next_time = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = self._cap.read()
+                if not ret:
+                    if self.loop and self.grabbed > 0:
+                        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                capture_time = time.perf_counter()
+                grabbed = GrabbedFrame(self.grabbed + 1, capture_time, time.time(), frame)
+                with self._condition:
+                    self.grabbed += 1
+                    if len(self._buffer) < self._buffer_size:
+                        self._buffer.append(grabbed)
+                    elif self.policy == DROP_OLDEST:
+                        self._buffer.popleft()
+                        self._buffer.append(grabbed)
+                        self.dropped += 1
+                    else:
+                        self.dropped += 1
+                    self._condition.notify_all()
+
+                if interval:
+                    # Entregar los fotogramas de un archivo al ritmo en que los daría la cámara,
+                    # sin intentar recuperar el tiempo perdido si la lectura se atrasa
+                    next_time = max(next_time + interval, capture_time)
+                    self._stop_event.wait(max(0.0, next_time - time.perf_counter()))
+        except Exception as e:
+            self.error = e
+        finally:
+            self._cap.release()
+            with self._condition:
+                self._ended = True
+                self._condition.notify_all()
+
+    def read(self, timeout=None):
+        """
+        Espera el siguiente fotograma del búfer y lo retorna como `GrabbedFrame`, o None si la
+        fuente terminó y el búfer está vacío.
+
+        Raises:
+            TimeoutError: Si no llega ningún fotograma en `timeout` segundos.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._buffer or self._ended, timeout):
+                raise TimeoutError("La fuente de video no entregó fotogramas a tiempo.")
+            if not self._buffer:
+                return None
+            self.delivered += 1
+            return self._buffer.popleft()
+
+    def read_batch(self, max_age=None, max_frames=None, timeout=None):
+        """
+        Espera al menos un fotograma y retorna los del búfer, descartando los capturados hace
+        más de `max_age` segundos y, si quedan más de `max_frames`, los más antiguos. El más
+        reciente se conserva siempre. Retorna una lista vacía si la fuente terminó.
+
+        Raises:
+            TimeoutError: Si no llega ningún fotograma en `timeout` segundos.
+        """
+        first = self.read(timeout)
+        if first is None:
+            return []
+        with self._condition:
+            waiting = [first] + list(self._buffer)
+            self._buffer.clear()
+            frames = waiting
+            if max_age is not None:
+                now = time.perf_counter()
+                frames = [item for item in waiting[:-1] if now - item.capture_time <= max_age] + waiting[-1:]
+            if max_frames is not None:
+                frames = frames[-max(1, max_frames):]
+            self.stale += len(waiting) - len(frames)
+            # `read` ya contó el primero
+            self.delivered += len(frames) - 1
+            return frames
+
+    @property
+    def stats(self):
+        """
+        Fotogramas capturados, descartados por la política del búfer (`dropped`) o por haber
+        esperado demasiado (`stale`) y entregados al análisis.
+        """
+        with self._condition:
+            return {
+                "grabbed": self.grabbed,
+                "dropped": self.dropped,
+                "stale": self.stale,
+                "delivered": self.delivered,
+                "buffered": len(self._buffer),
+                "drop_ratio": (self.dropped + self.stale) / self.grabbed if self.grabbed else 0.0,
+            }
+
+    def stop(self, timeout=5):
+        """Detiene la captura y libera la fuente."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            self._cap.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class WindowedCounts:
+    """
+    Conteos por ventanas de tiempo fijas (p. ej. por minuto o por hora) alineadas con el reloj.
+
+    Se alimenta con los eventos de cada fotograma y su hora de captura; cuando un fotograma
+    cae en una ventana posterior, la ventana en curso se cierra y se retorna. Las ventanas
+    intermedias sin fotogramas (p. ej. por un corte de la cámara) se retornan vacías para
+    que la serie no tenga huecos.
+    """
+    def __init__(self, window_seconds, lines=(), zones=()):
+        if window_seconds <= 0:
+            raise ValueError("window_seconds debe ser positivo.")
+        self.window_seconds = float(window_seconds)
+        self._line_names = [line.name for line in lines]
+        self._zone_names = [zone.name for zone in zones]
+        self._start = None
+        self._reset()
+
+    def _reset(self):
+        self._counts = {name: {"in": 0, "out": 0} for name in self._line_names}
+        self._counts.update({name: {"enter": 0, "exit": 0} for name in self._zone_names})
+        self._objects = set()
+        self._frames = 0
+
+    def _window(self):
+        return CountWindow(self._start, self._start + self.window_seconds, len(self._objects),
+                           {name: dict(value) for name, value in self._counts.items()}, self._frames)
+
+    def advance(self, timestamp):
+        """
+        Cierra y retorna las ventanas que terminaron antes de `timestamp`, sin registrar un
+        fotograma (p. ej. cuando la fuente deja de entregar fotogramas).
+        """
+        closed = []
+        if self._start is None:
+            return closed
+        window_start = math.floor(timestamp / self.window_seconds) * self.window_seconds
+        if window_start > self._start:
+            closed.append(self._window())
+            self._reset()
+            self._start += self.window_seconds
+            while self._start < window_start:
+                closed.append(self._window())
+                self._start += self.window_seconds
+        return closed
+
+    def add(self, timestamp, events):
+        """Registra los eventos de un fotograma capturado en `timestamp`; retorna las ventanas cerradas."""
+        if self._start is None:
+            self._start = math.floor(timestamp / self.window_seconds) * self.window_seconds
+        closed = self.advance(timestamp)
+        self._frames += 1
+        for event in events:
+            self._counts[event.name][event.direction] += 1
+            if event.kind == "line":
+                self._objects.add(event.object_id)
+        return closed
+
+    def current(self):
+        """Retorna la ventana en curso (parcial), o None si aún no hay fotogramas."""
+        return self._window() if self._start is not None else None
+
+    def flush(self):
+        """Cierra y retorna la ventana en curso, o None si no hay ninguna."""
+        window = self.current()
+        self._start = None
+        self._reset()
+        return window
+
+def process_stream(source, line_coords, detection_threshold, window_seconds=60.0, latency_budget=0.5,
+                   policy=DROP_OLDEST, buffer_size=1, loop=False, model_weights=DEFAULT_WEIGHTS,
+                   lines=None, zones=None, max_disappeared=50, max_distance=75, annotate=True,
+                   inference_service=None, inference_geometry=None, metrics=None, event_sink=None,
+                   heartbeat=1.0):
+    """
+    Cuenta ciclistas en una fuente en vivo (cámara, stream o archivo reproducido en tiempo real).
+
+    Un hilo (`FrameGrabber`) captura continuamente y conserva solo los fotogramas recientes;
+    el análisis toma lo que hay en el búfer, descarta los fotogramas que ya esperaron más de
+    `latency_budget` (salvo el más reciente) y analiza el resto en un solo lote, limitado
+    según el costo medio por fotograma para que la espera más el análisis quepan en el
+    presupuesto. Así la
+    latencia desde la captura hasta el conteo queda acotada aunque el modelo sea más lento que
+    la cámara (a costa de analizar menos fotogramas). En lugar del progreso se producen
+    conteos por ventanas de `window_seconds` segundos.
+
+    Args:
+        source: `FrameGrabber` ya abierto (para conocer las dimensiones antes de calcular la
+            línea) o número de dispositivo, URL o ruta con la que abrir uno.
+        line_coords (tuple): Tupla con dos puntos ((x1, y1), (x2, y2)) que definen la línea.
+            Se ignora si se pasan `lines`.
+        detection_threshold (float): Umbral de confianza para la detección.
+        window_seconds (float): Duración de las ventanas de conteo (60 por minuto, 3600 por hora).
+        latency_budget (float): Latencia máxima deseada, en segundos, entre la captura y el conteo.
+            Los fotogramas que la superan se cuentan en `over_budget` de cada resultado.
+        policy (str): Política de descarte del búfer de captura (ver `FrameGrabber`).
+        buffer_size (int): Máximo de fotogramas en espera en el búfer de captura.
+        loop (bool): Si la fuente es un archivo, reproducirlo en bucle.
+        model_weights (str): Pesos del modelo YOLOv8; se obtienen del registro compartido del proceso.
+        lines (list): Lista opcional de `CountingLine` con nombre.
+        zones (list): Lista opcional de `CountingZone`.
+        max_disappeared (int): Fotogramas analizados sin detección antes de dar de baja un objeto.
+        max_distance (int): Distancia máxima (en píxeles) para asociar un objeto con una detección;
+            con fotogramas descartados los ciclistas avanzan más entre análisis.
+        annotate (bool): Si es False no se dibuja nada y `frame` es None en los resultados.
+        inference_service (InferenceService): Servicio de inferencia compartido opcional.
+        inference_geometry (InferenceGeometry): Región de interés y tamaño de entrada opcionales.
+        metrics (PipelineMetrics): Objeto de métricas a usar; si es None se crea uno. Además de las
+            etapas de `process_video`, registra "latency" (captura a conteo) por fotograma.
+        event_sink (JsonlEventSink): Destino opcional al que se envían los eventos a medida que
+            ocurren, con su hora de captura (cualquier objeto con `write(events, timestamp)`).
+        heartbeat (float): Segundos sin fotogramas tras los que se produce un resultado sin
+            fotograma, para que una fuente detenida (p. ej. un stream colgado) no bloquee a quien
+            consume los resultados y este pueda cerrar el generador.
+
+    Yields:
+        StreamResult: Un resultado por fotograma analizado. Al terminar la fuente se produce un
+        último resultado sin fotograma (`frame` None) cuya `closed_windows` tiene la ventana parcial.
+
+    Raises:
+        IOError: Si la fuente o el modelo no se pueden abrir.
+    """
+    grabber = source if isinstance(source, FrameGrabber) else FrameGrabber(source, policy, buffer_size, loop)
+    counter = _make_counter(line_coords, lines, zones)
+    windows = WindowedCounts(window_seconds, counter.lines, counter.zones)
+    if metrics is None:
+        metrics = PipelineMetrics()
+    analyzer = _FrameAnalyzer(counter, max_disappeared, max_distance, metrics=metrics)
+
+    session = None
+    try:
+        if inference_service is not None:
+            session = inference_service.session()
+
+            def run_model(images):
+                return session.detect(images, detection_threshold)
+        else:
+            imgsz = inference_geometry.imgsz if inference_geometry is not None else DEFAULT_IMGSZ
+            model = get_model(model_weights, imgsz)
+
+            def run_model(images):
+                return detect_bicycles_batch(images, model, detection_threshold)
+
+        grabber.start()
+        over_budget = 0
+        frame_cost = None
+        last = None
+        while True:
+            # La espera en el búfer más el análisis del lote no debe superar el presupuesto: con el
+            # costo medio por fotograma se limita el tamaño del lote y la edad de sus fotogramas
+            if frame_cost:
+                max_frames = max(1, int(latency_budget / (2 * frame_cost)))
+                max_age = max(0.0, latency_budget - max_frames * frame_cost)
+            else:
+                max_frames, max_age = 1, latency_budget
+            try:
+                batch = grabber.read_batch(max_age=max_age, max_frames=max_frames, timeout=heartbeat)
+            except TimeoutError:
+                last = StreamResult(None, counter.total, last.frame_index if last is not None else 0, [],
+                                    counter.counts(), [], metrics, windows.current(), windows.advance(time.time()),
+                                    None, over_budget)
+                yield last
+                continue
+            if not batch:
+                break
+            frames = [item.frame for item in batch]
+            start = time.perf_counter()
+            if inference_geometry is None:
+                batch_rects = run_model(frames)
+            else:
+                batch_rects = inference_geometry.detect(frames, run_model)
+            elapsed = time.perf_counter() - start
+            metrics.observe("inference", elapsed)
+            cost = elapsed / len(frames)
+            frame_cost = cost if frame_cost is None else 0.8 * frame_cost + 0.2 * cost
+
+            for item, rects in zip(batch, batch_rects):
+                # Los eventos usan la numeración de captura, como `StreamResult.frame_index`
+                _, snapshot, events = analyzer.step(rects, item.index)
+                closed = windows.add(item.timestamp, events)
+                if event_sink is not None and events:
+                    event_sink.write(events, item.timestamp)
+                latency = time.perf_counter() - item.capture_time
+                metrics.observe("latency", latency)
+                if latency > latency_budget:
+                    over_budget += 1
+                metrics.frame_done(len(snapshot))
+
+                frame = None
+                if annotate:
+                    frame = item.frame
+                    with metrics.time("annotate"):
+                        _annotate_frame(frame, counter, snapshot, events, counter.total, counter.counts())
+                last = StreamResult(frame, counter.total, item.index, events, counter.counts(), snapshot, metrics,
+                                    windows.current(), closed, latency, over_budget)
+                yield last
+
+        if grabber.error is not None:
+            raise IOError(f"Error al leer la fuente de video: {grabber.error}")
+        final = windows.flush()
+        if last is not None and final is not None:
+            yield last._replace(frame=None, events=[], window=None, closed_windows=[final])
+    finally:
+        grabber.stop()
+        if session is not None:
+            session.close()
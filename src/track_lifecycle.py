@@ -0,0 +1,107 @@
+import numpy as np
+
+class PathHistory:
+    """
+    Últimas posiciones de cada objeto seguido, en un arreglo circular preasignado indexado
+    por la posición (slot) del objeto en el tracker.
+
+    Ocupa `capacity * length * 2` enteros de 32 bits sin importar cuántos objetos hayan
+    pasado: al dar de baja un objeto su fila se vacía y la reutiliza el siguiente objeto
+    que ocupe el mismo slot. Crece al doble si el tracker reserva más slots.
+
+    Args:
+        capacity (int): Número inicial de slots.
+        length (int): Posiciones que se conservan por objeto.
+    """
+    def __init__(self, capacity=64, length=30):
+        if length < 2:
+            raise ValueError("length debe ser al menos 2.")
+        self.length = length
+        self._points = np.zeros((capacity, length, 2), dtype=np.int32)
+        self._sizes = np.zeros(capacity, dtype=np.int32)
+        self._heads = np.zeros(capacity, dtype=np.int32)
+
+    @property
+    def capacity(self):
+        return len(self._sizes)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self._points = np.concatenate([self._points, np.zeros((extra, self.length, 2), dtype=np.int32)])
+        self._sizes = np.concatenate([self._sizes, np.zeros(extra, dtype=np.int32)])
+        self._heads = np.concatenate([self._heads, np.zeros(extra, dtype=np.int32)])
+
+    def append(self, slots, points):
+        """
+        Agrega la posición actual de los objetos en `slots` y retorna su posición anterior
+        (la actual para los objetos sin historia).
+
+        Args:
+            slots (np.array): Slots de los objetos, forma (T,).
+            points (np.array): Posiciones actuales, forma (T, 2).
+
+        Returns:
+            np.array: Posiciones anteriores, forma (T, 2).
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        if len(slots) == 0:
+            return points
+        if slots.max() >= self.capacity:
+            self._grow(max(2 * self.capacity, int(slots.max()) + 1))
+
+        heads = self._heads[slots]
+        previous = self._points[slots, (heads - 1) % self.length]
+        previous = np.where((self._sizes[slots] > 0)[:, np.newaxis], previous, points)
+        self._points[slots, heads] = points
+        self._heads[slots] = (heads + 1) % self.length
+        self._sizes[slots] = np.minimum(self._sizes[slots] + 1, self.length)
+        return previous
+
+    def path(self, slot):
+        """Retorna las posiciones guardadas del objeto en `slot`, de la más antigua a la más reciente."""
+        size = int(self._sizes[slot])
+        order = (self._heads[slot] - size + np.arange(size)) % self.length
+        return self._points[slot, order]
+
+    def clear(self, slot):
+        """Vacía la historia del slot (al dar de baja su objeto)."""
+        self._sizes[slot] = 0
+        self._heads[slot] = 0
+
+    @property
+    def nbytes(self):
+        return self._points.nbytes + self._sizes.nbytes + self._heads.nbytes
+
+class TrackLifecycle:
+    """
+    Ciclo de vida de los objetos seguidos: mantiene el trayecto de cada objeto mientras el
+    tracker lo sigue y, cuando lo da de baja, libera su trayecto y su estado en el motor de
+    conteo. Así la memoria queda acotada por los objetos activos también en transmisiones
+    de días.
+
+    Args:
+        tracker (CentroidTracker): Tracker cuyos objetos se siguen.
+        counter (CrossingCounter): Motor de conteo cuyo estado por objeto se libera.
+        path_length (int): Posiciones que se conservan por objeto.
+    """
+    def __init__(self, tracker, counter, path_length=30):
+        self.tracker = tracker
+        self.counter = counter
+        self.paths = PathHistory(tracker.capacity, path_length)
+        self.evicted = 0
+        tracker.on_deregister(self._evict)
+
+    def _evict(self, object_id, slot):
+        self.paths.clear(slot)
+        self.counter.forget(object_id)
+        self.evicted += 1
+
+    def record(self, object_ids, points):
+        """Registra las posiciones actuales de los objetos y retorna sus posiciones anteriores."""
+        slots = [self.tracker.slot(object_id) for object_id in object_ids]
+        return self.paths.append(slots, points)
+
+    def path(self, object_id):
+        """Retorna el trayecto reciente del objeto, de la posición más antigua a la más reciente."""
+        return self.paths.path(self.tracker.slot(object_id))
@@ -1,75 +1,258 @@
+import sys
+
 import numpy as np
 
+try:
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+except ImportError as e:
+    print(f"Error importing scipy: {e}")
+    sys.exit(1)
+
 class CentroidTracker:
-    def __init__(self, max_disappeared=50, max_distance=75):
+    """
+    Tracker de centroides con el estado de los objetos en arreglos NumPy preasignados.
+
+    Cada objeto ocupa una posición (slot) en los arreglos; al darlo de baja, la posición
+    se reutiliza para el siguiente objeto registrado. La asociación entre objetos y
+    detecciones se limita a los pares a menos de `max_distance` (consulta con KD-tree)
+    y se resuelve con una asignación óptima (algoritmo húngaro).
+
+    También estima la velocidad de cada objeto, de modo que `predict()` puede avanzar
+    los objetos entre fotogramas en los que no se ejecuta el detector.
+
+    Los IDs nunca se reutilizan. Las funciones registradas con `on_deregister` se llaman
+    al dar de baja cada objeto, para que el estado que otros componentes guardan por
+    objeto (trayectos, conteos) se libere con él.
+    """
+    def __init__(self, max_disappeared=50, max_distance=75, capacity=64):
         self.next_object_id = 0
-        self.objects = {}
-        self.disappeared = {}
         self.max_disappeared = max_disappeared
         self.max_distance = max_distance
+        # Por debajo de este número de pares objeto-detección se usa una matriz de distancias densa
+        self.dense_match_limit = 1024
+
+        # Suavizado exponencial de la velocidad estimada entre detecciones (0 a 1)
+        self.velocity_smoothing = 0.5
+
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._centroids = np.zeros((capacity, 2), dtype=np.int64)
+        self._rects = np.zeros((capacity, 4), dtype=np.int64)
+        self._disappeared = np.zeros(capacity, dtype=np.int64)
+        # Última posición medida, velocidad estimada (px/fotograma) y fotogramas desde la medición
+        self._measured_centroids = np.zeros((capacity, 2), dtype=np.int64)
+        self._measured_rects = np.zeros((capacity, 4), dtype=np.int64)
+        self._velocities = np.zeros((capacity, 2), dtype=np.float64)
+        self._since_measured = np.zeros(capacity, dtype=np.int64)
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._slots = {}
+        self._deregister_callbacks = []
+        self.objects = {}
+
+    @property
+    def disappeared(self):
+        """Fotogramas consecutivos sin detección de cada objeto, indexado por ID."""
+        return {object_id: int(self._disappeared[slot]) for object_id, slot in self._slots.items()}
+
+    @property
+    def capacity(self):
+        """Número de posiciones (slots) reservadas en los arreglos; crece al doble cuando se llenan."""
+        return len(self._ids)
+
+    def slot(self, object_id):
+        """Posición que ocupa el objeto en los arreglos; se reutiliza después de darlo de baja."""
+        return self._slots[object_id]
+
+    def on_deregister(self, callback):
+        """Registra `callback(object_id, slot)`, que se llama cada vez que se da de baja un objeto."""
+        self._deregister_callbacks.append(callback)
+
+    def _grow(self):
+        capacity = len(self._ids)
+        self._ids = np.concatenate([self._ids, np.full(capacity, -1, dtype=np.int64)])
+        for name in ("_centroids", "_rects", "_disappeared", "_measured_centroids", "_measured_rects",
+                     "_velocities", "_since_measured"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self._free_slots.extend(range(2 * capacity - 1, capacity - 1, -1))
 
     def register(self, centroid, rect):
-        self.objects[self.next_object_id] = {'centroid': centroid, 'rect': rect}
-        self.disappeared[self.next_object_id] = 0
+        if not self._free_slots:
+            self._grow()
+        slot = self._free_slots.pop()
+        object_id = self.next_object_id
+        self._ids[slot] = object_id
+        self._centroids[slot] = centroid
+        self._rects[slot] = rect
+        self._disappeared[slot] = 0
+        self._measured_centroids[slot] = centroid
+        self._measured_rects[slot] = rect
+        self._velocities[slot] = 0
+        self._since_measured[slot] = 0
+        self._slots[object_id] = slot
         self.next_object_id += 1
+        return object_id
 
     def deregister(self, object_id):
-        del self.objects[object_id]
-        del self.disappeared[object_id]
+        slot = self._slots.pop(object_id)
+        self._ids[slot] = -1
+        self._free_slots.append(slot)
+        for callback in self._deregister_callbacks:
+            callback(object_id, slot)
+
+    def _active_slots(self):
+        return np.flatnonzero(self._ids >= 0)
+
+    def _age(self, slots):
+        """Incrementa el contador de desaparición y da de baja a los objetos que superan el límite."""
+        self._disappeared[slots] += 1
+        self._since_measured[slots] += 1
+        for slot in slots[self._disappeared[slots] > self.max_disappeared]:
+            self.deregister(int(self._ids[slot]))
+
+    def _match(self, object_centroids, input_centroids):
+        """
+        Asocia objetos con detecciones minimizando la distancia total.
+
+        Solo se consideran los pares a distancia <= max_distance; entre ellos se maximiza
+        primero el número de asociaciones y luego se minimiza la distancia total. El grafo
+        de candidatos se separa en componentes conexas y cada una se resuelve por separado,
+        así el costo crece con el tamaño de los grupos cercanos y no con el total de objetos.
+
+        Returns:
+            tuple: Índices de filas (objetos) y columnas (detecciones) asociadas.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(object_centroids) * len(input_centroids) <= self.dense_match_limit:
+            # Con pocos objetos una matriz densa es más barata que el KD-tree y las componentes
+            D = np.linalg.norm(object_centroids[:, np.newaxis] - input_centroids, axis=2)
+            rows, cols = np.nonzero(D <= self.max_distance)
+            if len(rows) == 0:
+                return empty, empty
+            return self._assign(rows, cols, D[rows, cols])
+
+        pairs = cKDTree(object_centroids).sparse_distance_matrix(
+            cKDTree(input_centroids), self.max_distance, output_type="ndarray")
+        if len(pairs) == 0:
+            return empty, empty
+
+        pair_rows = pairs["i"].astype(np.int64)
+        pair_cols = pairs["j"].astype(np.int64)
+        n_rows = len(object_centroids)
+        graph = coo_matrix((np.ones(len(pairs)), (pair_rows, n_rows + pair_cols)),
+                           shape=(n_rows + len(input_centroids),) * 2)
+        _, labels = connected_components(graph, directed=False)
+        pair_labels = labels[pair_rows]
+
+        # Las componentes con un único par candidato se asocian directamente
+        edges_per_label = np.bincount(pair_labels)
+        single = edges_per_label[pair_labels] == 1
+        matched_rows = [pair_rows[single]]
+        matched_cols = [pair_cols[single]]
+
+        order = np.argsort(pair_labels[~single], kind="stable")
+        group_labels = pair_labels[~single][order]
+        group_rows = pair_rows[~single][order]
+        group_cols = pair_cols[~single][order]
+        group_dists = pairs["v"][~single][order]
+        bounds = np.flatnonzero(np.diff(group_labels)) + 1
+        for g_rows, g_cols, g_dists in zip(np.split(group_rows, bounds), np.split(group_cols, bounds),
+                                          np.split(group_dists, bounds)):
+            if len(g_rows) == 0:
+                continue
+            rows, cols = self._assign(g_rows, g_cols, g_dists)
+            matched_rows.append(rows)
+            matched_cols.append(cols)
+
+        return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+    def _assign(self, pair_rows, pair_cols, pair_dists):
+        """Asignación óptima (algoritmo húngaro) restringida a los pares candidatos dados."""
+        rows, row_index = np.unique(pair_rows, return_inverse=True)
+        cols, col_index = np.unique(pair_cols, return_inverse=True)
+        unmatched_cost = self.max_distance * (min(len(rows), len(cols)) + 1) + 1
+        cost = np.full((len(rows), len(cols)), unmatched_cost, dtype=np.float64)
+        cost[row_index, col_index] = pair_dists
+
+        assigned_rows, assigned_cols = linear_sum_assignment(cost)
+        valid = cost[assigned_rows, assigned_cols] <= self.max_distance
+        return rows[assigned_rows[valid]], cols[assigned_cols[valid]]
+
+    def _measure(self, slots, centroids, rects):
+        """Actualiza los objetos asociados con su nueva detección y su velocidad estimada."""
+        elapsed = (self._since_measured[slots] + 1)[:, np.newaxis]
+        observed = (centroids - self._measured_centroids[slots]) / elapsed
+        alpha = self.velocity_smoothing
+        self._velocities[slots] = alpha * observed + (1 - alpha) * self._velocities[slots]
+
+        self._centroids[slots] = centroids
+        self._rects[slots] = rects
+        self._measured_centroids[slots] = centroids
+        self._measured_rects[slots] = rects
+        self._since_measured[slots] = 0
+        self._disappeared[slots] = 0
+
+    def predict(self):
+        """
+        Avanza todos los objetos un fotograma con su velocidad estimada, sin detecciones.
+
+        Se usa entre fotogramas clave cuando el detector no se ejecuta en cada fotograma. Las
+        posiciones predichas se usan para asociar las siguientes detecciones. A diferencia de
+        `update([])`, no cuenta como fotograma sin detección para `max_disappeared`.
+        """
+        active = self._active_slots()
+        self._since_measured[active] += 1
+        offsets = np.rint(self._velocities[active] * self._since_measured[active][:, np.newaxis]).astype(np.int64)
+        self._centroids[active] = self._measured_centroids[active] + offsets
+        self._rects[active] = self._measured_rects[active] + np.hstack([offsets, offsets])
+        return self._build_objects()
+
+    def motion_state(self):
+        """Retorna las posiciones (N, 2) y velocidades (N, 2) en px/fotograma de los objetos activos."""
+        active = self._active_slots()
+        return self._centroids[active], self._velocities[active]
+
+    def _build_objects(self):
+        slots = self._active_slots()
+        slots = slots[np.argsort(self._ids[slots], kind="stable")]
+        ids = self._ids[slots].tolist()
+        centroids = self._centroids[slots].tolist()
+        rects = self._rects[slots].tolist()
+        self.objects = {
+            object_id: {'centroid': tuple(centroid), 'rect': tuple(rect)}
+            for object_id, centroid, rect in zip(ids, centroids, rects)
+        }
+        return self.objects
 
     def update(self, rects):
+        rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        active = self._active_slots()
+
         if len(rects) == 0:
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
-            return self.objects
-
-        input_centroids = np.zeros((len(rects), 2), dtype="int")
-        for (i, (startX, startY, endX, endY)) in enumerate(rects):
-            cX = int((startX + endX) / 2.0)
-            cY = int((startY + endY) / 2.0)
-            input_centroids[i] = (cX, cY)
-
-        if len(self.objects) == 0:
+            self._age(active)
+            return self._build_objects()
+
+        input_centroids = ((rects[:, :2] + rects[:, 2:]) / 2.0).astype(np.int64)
+
+        if len(active) == 0:
             for i in range(len(rects)):
                 self.register(input_centroids[i], rects[i])
-        else:
-            object_ids = list(self.objects.keys())
-            object_centroids = [d['centroid'] for d in self.objects.values()]
-
-            D = np.linalg.norm(np.array(object_centroids)[:, np.newaxis] - input_centroids, axis=2)
-            rows = D.min(axis=1).argsort()
-            cols = D.argmin(axis=1)[rows]
-
-            used_rows = set()
-            used_cols = set()
-
-            for (row, col) in zip(rows, cols):
-                if row in used_rows or col in used_cols:
-                    continue
-
-                if D[row, col] > self.max_distance:
-                    continue
-
-                object_id = object_ids[row]
-                self.objects[object_id]['centroid'] = input_centroids[col]
-                self.objects[object_id]['rect'] = rects[col]
-                self.disappeared[object_id] = 0
-
-                used_rows.add(row)
-                used_cols.add(col)
-
-            unused_rows = set(range(D.shape[0])).difference(used_rows)
-            unused_cols = set(range(D.shape[1])).difference(used_cols)
-
-            if D.shape[0] >= D.shape[1]:
-                for row in unused_rows:
-                    object_id = object_ids[row]
-                    self.disappeared[object_id] += 1
-                    if self.disappeared[object_id] > self.max_disappeared:
-                        self.deregister(object_id)
-            else:
-                for col in unused_cols:
-                    self.register(input_centroids[col], rects[col])
-        return self.objects
+            return self._build_objects()
+
+        rows, cols = self._match(self._centroids[active], input_centroids)
+        matched = active[rows]
+        self._measure(matched, input_centroids[cols], rects[cols])
+
+        # Los objetos sin detección asociada envejecen y las detecciones sin objeto se registran,
+        # aunque haya más objetos que detecciones: una detección lejana de todos es un ciclista nuevo
+        unused_rows = np.ones(len(active), dtype=bool)
+        unused_rows[rows] = False
+        self._age(active[unused_rows])
+
+        unused_cols = np.ones(len(rects), dtype=bool)
+        unused_cols[cols] = False
+        for col in np.flatnonzero(unused_cols):
+            self.register(input_centroids[col], rects[col])
+        return self._build_objects()
@@ -1,50 +1,106 @@
 import cv2
 import numpy as np
-from collections import deque
+from collections import namedtuple
 import os
 import sys
+import time
 from pathlib import Path
 
-try:
-    from ultralytics import YOLO
-except ImportError as e:
-    print(f"Error importing ultralytics: {e}")
-    sys.exit(1)
-
 try:
     from tracker import CentroidTracker
+    from track_lifecycle import TrackLifecycle
+    from pipeline import run_pipeline
+    from counting import CountingLine, CrossingCounter
+    from detection_store import hash_file
+    from model_registry import DEFAULT_IMGSZ, DEFAULT_WEIGHTS, get_model
+    from metrics import PipelineMetrics, SamplingProfiler
 except ImportError:
     try:
         from src.tracker import CentroidTracker
+        from src.track_lifecycle import TrackLifecycle
+        from src.pipeline import run_pipeline
+        from src.counting import CountingLine, CrossingCounter
+        from src.detection_store import hash_file
+        from src.model_registry import DEFAULT_IMGSZ, DEFAULT_WEIGHTS, get_model
+        from src.metrics import PipelineMetrics, SamplingProfiler
     except ImportError as e:
         print(f"Error importing tracker: {e}")
         sys.exit(1)
 
-def detect_bicycles(frame, model, detection_threshold):
-    """
-    Detecta bicicletas en un fotograma utilizando un modelo YOLOv8 de Ultralytics.
+# Resultado producido por `process_video` para cada fotograma.
+#   frame: fotograma anotado (np.array).
+#   count: número de ciclistas distintos que cruzaron alguna línea.
+#   progress: fracción del video procesada (0 a 1), o None si no se conoce el número de
+#             fotogramas (p. ej. algunos streams o contenedores sin índice).
+#   frame_index: índice del fotograma, desde 1.
+#   events: lista de `CrossingEvent` ocurridos en este fotograma.
+#   counts: conteos por línea ({"in", "out"}) y por zona ({"enter", "exit", "inside"}).
+#   objects: lista de (object_id, centroid, rect) de los objetos seguidos en este fotograma.
+#   metrics: `PipelineMetrics` de la ejecución (el mismo objeto en todos los fotogramas).
+FrameResult = namedtuple("FrameResult", ["frame", "count", "progress", "frame_index", "events", "counts",
+                                         "objects", "metrics"])
+
+# Metadatos de un video, leídos una sola vez con `probe_video`.
+VideoInfo = namedtuple("VideoInfo", ["width", "height", "fps", "frame_count"])
+
+DEFAULT_LINE_NAME = "principal"
+
+def _bicycle_class_ids(model):
+    """Retorna los índices de clase del modelo cuyo nombre es 'bicycle'."""
+    names = model.names
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    return [int(class_id) for class_id, name in items if name == "bicycle"]
+
+def detect_bicycles_batch(frames, model, detection_threshold):
     """
-    # Realizar la predicción en el fotograma
-    results = model(frame, verbose=False)
+    Detecta bicicletas en un lote de fotogramas con una sola llamada al modelo YOLOv8.
 
-    final_boxes = []
-    # Iterar sobre los resultados de la detección
-    for result in results:
-        # Obtener las cajas delimitadoras y las clases
-        boxes = result.boxes
-        for box in boxes:
-            # Obtener la clase y la confianza
-            class_id = int(box.cls[0])
-            confidence = float(box.conf[0])
-            class_name = model.names[class_id]
+    El filtrado por clase y por confianza se hace dentro de la llamada al modelo
+    (`classes` y `conf`) y después con máscaras vectorizadas sobre los tensores,
+    sin recorrer las cajas una por una en Python.
 
-            # Filtrar por la clase 'bicycle' y el umbral de confianza
-            if class_name == "bicycle" and confidence > detection_threshold:
-                # Obtener coordenadas de la caja delimitadora en formato (x1, y1, x2, y2)
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                final_boxes.append((x1, y1, x2, y2))
+    Args:
+        frames (list): Lista de fotogramas (np.array BGR).
+        model: Modelo YOLOv8 de Ultralytics.
+        detection_threshold (float): Umbral de confianza para la detección, o una lista con un
+            umbral por fotograma (el modelo se ejecuta con el menor y se filtra cada fotograma con el suyo).
 
-    return final_boxes
+    Returns:
+        list: Un np.array de forma (N, 4) y tipo int32 con las cajas (x1, y1, x2, y2) por fotograma.
+    """
+    if len(frames) == 0:
+        return []
+
+    class_ids = _bicycle_class_ids(model)
+    if not class_ids:
+        return [np.empty((0, 4), dtype=np.int32) for _ in frames]
+
+    if np.ndim(detection_threshold) == 0:
+        thresholds = [detection_threshold] * len(frames)
+    else:
+        thresholds = list(detection_threshold)
+    results = model(list(frames), classes=class_ids, conf=min(thresholds), verbose=False)
+    return [_bicycle_boxes(result, class_ids, threshold) for result, threshold in zip(results, thresholds)]
+
+def _bicycle_boxes(result, class_ids, detection_threshold):
+    """Retorna las cajas (N, 4) int32 de un resultado de YOLOv8 filtradas por clase y confianza."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    xyxy = boxes.xyxy.cpu().numpy()
+    conf = boxes.conf.cpu().numpy()
+    cls = boxes.cls.cpu().numpy().astype(np.int64)
+
+    # Filtrar por la clase 'bicycle' y el umbral de confianza
+    mask = np.isin(cls, class_ids) & (conf > detection_threshold)
+    return xyxy[mask].astype(np.int32)
+
+def detect_bicycles(frame, model, detection_threshold):
+    """
+    Detecta bicicletas en un fotograma utilizando un modelo YOLOv8 de Ultralytics.
+    """
+    boxes = detect_bicycles_batch([frame], model, detection_threshold)[0]
+    return [tuple(box) for box in boxes.tolist()]
 
 # --- Funciones para Geometría y Detección de Cruce ---
 
@@ -90,83 +146,459 @@ def do_intersect(p1, q1, p2, q2):
 
     return False
 
-def process_video(video_path, line_coords, detection_threshold):
+def _read_batch(cap, batch_size):
+    """Lee hasta `batch_size` fotogramas del video. Retorna una lista vacía al terminar."""
+    frames = []
+    while len(frames) < batch_size:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames
+
+def _decode_batches(cap, batch_size, max_frames=None, metrics=None):
     """
-    Procesa un video para contar ciclistas y produce fotogramas anotados.
+    Genera lotes de fotogramas decodificados y libera el video al terminar.
+
+    Si se indica `max_frames`, se detiene después de decodificar ese número de fotogramas.
+    Con `metrics`, la duración de cada lote se registra en la etapa "decode".
+    """
+    remaining = max_frames
+    try:
+        while cap.isOpened():
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                batch_size = min(batch_size, remaining)
+            start = time.perf_counter()
+            frames = _read_batch(cap, batch_size)
+            if metrics is not None:
+                metrics.observe("decode", time.perf_counter() - start)
+            if not frames:
+                break
+            if remaining is not None:
+                remaining -= len(frames)
+            yield frames
+    finally:
+        cap.release()
+
+def _annotate_frame(frame, counter, objects, events, bicycle_count, counts):
+    """
+    Dibuja las líneas y zonas de conteo, los objetos seguidos y los conteos sobre el fotograma.
 
     Args:
-        video_path (str): Ruta al archivo de video.
-        line_coords (tuple): Tupla con dos puntos ((x1, y1), (x2, y2)) que definen la línea.
-        detection_threshold (float): Umbral de confianza para la detección.
+        frame (np.array): Fotograma a anotar (se modifica en el lugar).
+        counter (CrossingCounter): Motor de conteo con las líneas y zonas a dibujar.
+        objects (list): Lista de tuplas (object_id, centroid, rect) a dibujar.
+        events (list): Eventos de conteo ocurridos en este fotograma.
+        bicycle_count (int): Conteo acumulado a mostrar.
+        counts (dict): Conteos por línea y zona en este fotograma (ver `CrossingCounter.counts`).
+    """
+    crossed = {event.name for event in events if event.kind == "line"}
+
+    # Dibujar las zonas y las líneas de conteo
+    for zone in counter.zones:
+        cv2.polylines(frame, [zone.polygon.astype(np.int32)], True, (255, 0, 0), 2)
+    for line in counter.lines:
+        cv2.line(frame, line.p1, line.p2, (0, 0, 255), 2)
+
+    for (object_id, centroid, rect) in objects:
+        # Dibuja el recuadro, el centroide y el ID
+        (startX, startY, endX, endY) = rect
+        cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
+        text = f"ID {object_id}"
+        cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 255, 0), -1)
+
+    for line in counter.lines:
+        if line.name in crossed:
+            # Resaltar la línea momentáneamente para indicar el cruce
+            cv2.line(frame, line.p1, line.p2, (0, 255, 0), 4)
+
+    # Mostrar el conteo total en el video
+    cv2.putText(frame, f"Conteo: {bicycle_count}", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+
+    # Con varias líneas o zonas, mostrar también el detalle de cada una
+    if len(counter.lines) + len(counter.zones) > 1:
+        y = 70
+        for line in counter.lines:
+            value = counts[line.name]
+            cv2.putText(frame, f"{line.name}: in {value['in']} / out {value['out']}", (20, y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+            y += 25
+        for zone in counter.zones:
+            value = counts[zone.name]
+            cv2.putText(frame, f"{zone.name}: {value['inside']} dentro", (20, y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+            y += 25
+    return frame
+
+class _FrameAnalyzer:
+    """
+    Seguimiento y conteo fotograma a fotograma a partir de las cajas detectadas.
 
-    Yields:
-        tuple: Tupla con el fotograma procesado (np.array), el conteo actual (int) y el progreso (float).
+    Lo comparten el procesamiento completo del video y la repetición desde un almacén
+    de detecciones, para que ambos cuenten exactamente igual. El trayecto y el estado de
+    conteo de cada objeto se liberan al darlo de baja el tracker (ver `TrackLifecycle`).
     """
-    cap = cv2.VideoCapture(video_path)
+    def __init__(self, counter, max_disappeared, max_distance, start_frame=0, metrics=None):
+        self.counter = counter
+        self.tracker = CentroidTracker(max_disappeared=max_disappeared, max_distance=max_distance)
+        self.lifecycle = TrackLifecycle(self.tracker, counter)
+        self.frame_num = start_frame
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+
+    def step(self, rects, frame_index=None):
+        """
+        Actualiza el tracker y los conteos con las cajas de un fotograma. Si `rects` es None
+        (fotograma sin detección), el tracker predice las posiciones con la velocidad estimada.
+        `frame_index` fija el número del fotograma cuando no se analizan todos (p. ej. en vivo,
+        donde se descartan fotogramas); por defecto es el siguiente al anterior.
+
+        Returns:
+            tuple: (frame_index, snapshot, events) donde snapshot es la lista de
+            (object_id, centroid, rect) de los objetos seguidos.
+        """
+        self.frame_num = self.frame_num + 1 if frame_index is None else frame_index
+        start = time.perf_counter()
+        if rects is None:
+            objects = self.tracker.predict()
+        else:
+            objects = self.tracker.update(rects)
+        tracked = time.perf_counter()
+
+        snapshot = [(object_id, data['centroid'], data['rect']) for object_id, data in objects.items()]
+        object_ids = list(objects)
+        points = [data['centroid'] for data in objects.values()]
+        prev_points = self.lifecycle.record(object_ids, points)
+
+        # Comprobar a la vez los trayectos de todos los objetos contra todas las líneas y zonas
+        events = self.counter.update(self.frame_num, object_ids, points, prev_points)
+        self.metrics.observe("track", tracked - start)
+        self.metrics.observe("count", time.perf_counter() - tracked)
+        return self.frame_num, snapshot, events
+
+def detection_key(detection_store, video_hash, model_weights, detection_threshold, motion_gate=None,
+                  keyframe_policy=None, inference_geometry=None):
+    """Retorna la clave en `detection_store` de las detecciones producidas con estos parámetros."""
+    return detection_store.make_key(
+        video_hash, model_weights, detection_threshold,
+        motion_gate=motion_gate.config() if motion_gate is not None else None,
+        keyframes=keyframe_policy.config() if keyframe_policy is not None and keyframe_policy.stride > 1 else None,
+        geometry=inference_geometry.config() if inference_geometry is not None else None)
+
+def probe_video(video_path):
+    """
+    Lee las dimensiones, los FPS y el número de fotogramas de un video.
+
+    Raises:
+        IOError: Si el video no se puede abrir.
+    """
+    cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         raise IOError("Error al abrir el archivo de video.")
-
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    line_p1, line_p2 = line_coords
-
-    # Cargar el modelo YOLOv8 with error handling
     try:
-        model = YOLO("yolov8n.pt")
-    except Exception as e:
-        raise IOError(f"Error loading YOLOv8 model: {e}. Please check your internet connection for first-time model download.")
-
-    tracker = CentroidTracker(max_disappeared=50, max_distance=75)
-    tracked_paths = {}
-    bicycle_count = 0
-    counted_ids = set()
-
-    frame_num = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_num += 1
+        return VideoInfo(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         cap.get(cv2.CAP_PROP_FPS) or 0.0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
 
-        # Usar la nueva función de detección con el modelo YOLOv8
-        rects = detect_bicycles(frame, model, detection_threshold)
-        objects = tracker.update(rects)
-
-        # Dibujar la línea de conteo principal
-        cv2.line(frame, line_p1, line_p2, (0, 0, 255), 2)
+def line_coords_from_percent(line_type, line_coords_percent, width, height):
+    """
+    Calcula las coordenadas en píxeles de la línea de conteo a partir de porcentajes.
 
-        for (object_id, data) in objects.items():
-            centroid = data['centroid']
-            rect = data['rect']
+    Args:
+        line_type (str): "Horizontal" (usa 'y1'), "Vertical" (usa 'x1') o "Inclinada" (usa 'x1', 'y1', 'x2', 'y2').
+        line_coords_percent (dict): Posiciones en porcentaje (0-100) del ancho y alto del video.
+        width (int): Ancho del video en píxeles.
+        height (int): Alto del video en píxeles.
 
-            if object_id not in tracked_paths:
-                tracked_paths[object_id] = deque(maxlen=30)
+    Returns:
+        tuple: Puntos ((x1, y1), (x2, y2)) de la línea.
+    """
+    if line_type == "Horizontal":
+        y = int(height * (line_coords_percent['y1'] / 100))
+        return ((0, y), (width, y))
+    elif line_type == "Vertical":
+        x = int(width * (line_coords_percent['x1'] / 100))
+        return ((x, 0), (x, height))
+    elif line_type == "Inclinada":
+        x1 = int(width * (line_coords_percent['x1'] / 100))
+        y1 = int(height * (line_coords_percent['y1'] / 100))
+        x2 = int(width * (line_coords_percent['x2'] / 100))
+        y2 = int(height * (line_coords_percent['y2'] / 100))
+        return ((x1, y1), (x2, y2))
+    else: # Fallback
+        return ((0, height // 2), (width, height // 2))
+
+def _make_counter(line_coords, lines, zones):
+    if lines is None:
+        lines = [CountingLine(DEFAULT_LINE_NAME, *line_coords)]
+    return CrossingCounter(lines, zones or ())
+
+def process_video(video_path, line_coords, detection_threshold, batch_size=4, queue_size=8,
+                  model_weights=DEFAULT_WEIGHTS, lines=None, zones=None,
+                  max_disappeared=50, max_distance=75, detection_store=None, video_hash=None,
+                  motion_gate=None, keyframe_policy=None, annotate=True, start_frame=0, end_frame=None,
+                  video_info=None, inference_service=None, inference_geometry=None, metrics=None,
+                  metrics_path=None, metrics_interval=5.0, profile_path=None, event_sink=None):
+    """
+    Procesa un video para contar ciclistas y produce fotogramas anotados.
 
-            tracked_paths[object_id].append(centroid)
+    El trabajo se reparte en un pipeline por etapas (ver `pipeline.run_pipeline`):
+    la decodificación, la inferencia con seguimiento y conteo, y la anotación corren
+    en hilos separados conectados por colas acotadas, y los fotogramas se producen
+    en orden.
 
-            # Dibuja el recuadro, el centroide y el ID
-            (startX, startY, endX, endY) = rect
-            cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
-            text = f"ID {object_id}"
-            cv2.putText(frame, text, (centroid[0] - 10, centroid[1] - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            cv2.circle(frame, (centroid[0], centroid[1]), 4, (0, 255, 0), -1)
+    Args:
+        video_path (str): Ruta al archivo de video.
+        line_coords (tuple): Tupla con dos puntos ((x1, y1), (x2, y2)) que definen la línea.
+            Se ignora si se pasan `lines`.
+        detection_threshold (float): Umbral de confianza para la detección.
+        batch_size (int): Número de fotogramas que se envían juntos al modelo en cada inferencia.
+        queue_size (int): Capacidad de las colas entre etapas del pipeline.
+        model_weights (str): Pesos del modelo YOLOv8; se obtienen del registro compartido del proceso.
+        lines (list): Lista opcional de `CountingLine` con nombre para contar por línea y dirección.
+        zones (list): Lista opcional de `CountingZone` para contar entradas y salidas.
+        max_disappeared (int): Fotogramas sin detección antes de dar de baja un objeto.
+        max_distance (int): Distancia máxima (en píxeles) para asociar un objeto con una detección.
+        detection_store (DetectionStore): Almacén opcional de detecciones. Si ya contiene las
+            detecciones de este video, modelo y umbral, se usan en lugar de ejecutar YOLO; si no,
+            se guardan al terminar de procesar el video completo.
+        video_hash (str): Hash del contenido del video, si ya se calculó (ver `hash_file`).
+        motion_gate (MotionGate): Filtro de movimiento opcional. Los fotogramas que juzga estáticos
+            no pasan por YOLO y el tracker avanza sin detecciones; sus estadísticas quedan en
+            `motion_gate.stats`.
+        keyframe_policy (KeyframePolicy): Política opcional de fotogramas clave. El detector solo
+            corre en los fotogramas clave y entre ellos el tracker predice las posiciones con la
+            velocidad de cada objeto; los cruces se comprueban con las posiciones predichas.
+        annotate (bool): Si es False no se dibuja nada y `frame` es None en los resultados; es el
+            camino rápido para procesamiento sin interfaz.
+        start_frame (int): Fotograma (desde 0) en el que empieza el procesamiento; el video se
+            posiciona con `CAP_PROP_POS_FRAMES`. Los índices de fotograma siguen siendo los del
+            video completo.
+        end_frame (int): Fotograma (desde 0, excluido) en el que termina, o None hasta el final.
+            Con un rango parcial las detecciones no se guardan en `detection_store`.
+        video_info (VideoInfo): Metadatos del video si ya se leyeron con `probe_video`; si no,
+            se leen del propio video.
+        inference_service (InferenceService): Servicio de inferencia compartido opcional. Si se
+            pasa, los fotogramas se envían a él (que los agrupa con los de otras sesiones) en lugar
+            de llamar directamente al modelo; `model_weights` debe corresponder a su modelo.
+        inference_geometry (InferenceGeometry): Región de interés, tamaño de entrada del modelo y
+            mosaicos opcionales. Solo se envía al modelo la región (o sus mosaicos) y las cajas se
+            trasladan a coordenadas del fotograma. Con `inference_service`, su modelo debe usar el
+            mismo tamaño de entrada.
+        metrics (PipelineMetrics): Objeto de métricas a usar; si es None se crea uno. Registra
+            histogramas por etapa ("decode" e "inference" por lote; "track", "count" y "annotate"
+            por fotograma), FPS, objetos seguidos y ocupación de colas, y se entrega en cada resultado.
+        metrics_path (str): Archivo opcional donde exportar las métricas (texto de Prometheus si
+            termina en .prom, JSON si no) cada `metrics_interval` segundos y al terminar.
+        metrics_interval (float): Segundos entre exportaciones de las métricas.
+        profile_path (str): Si se indica, se perfilan los hilos del pipeline (pyinstrument si está
+            instalado, si no cProfile) y el informe se escribe en este archivo al terminar.
+        event_sink (JsonlEventSink): Destino opcional al que se envían los eventos de cada fotograma
+            a medida que ocurren (cualquier objeto con `write(events)`), para no acumularlos.
 
-            if len(tracked_paths[object_id]) > 1:
-                prev_centroid = tracked_paths[object_id][-2]
+    Yields:
+        FrameResult: Fotograma procesado, conteo actual, progreso, eventos de cruce y conteos
+        por línea y zona. Los tres primeros campos son los de la tupla (frame, count, progress).
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size debe ser al menos 1.")
+    counter = _make_counter(line_coords, lines, zones)
 
-                # Comprobar si el trayecto del centroide cruza la línea de conteo
-                if object_id not in counted_ids and do_intersect(prev_centroid, centroid, line_p1, line_p2):
-                    bicycle_count += 1
-                    counted_ids.add(object_id)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError("Error al abrir el archivo de video.")
 
-                    # Resaltar la línea momentáneamente para indicar el cruce
-                    cv2.line(frame, line_p1, line_p2, (0, 255, 0), 4)
+    # Si la preparación falla (modelo, servicio detenido, hash del video...), la captura se
+    # libera aquí: el pipeline que la cerraría no llega a arrancar
+    session = None
+    try:
+        if video_info is None:
+            video_info = VideoInfo(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                                   cap.get(cv2.CAP_PROP_FPS) or 0.0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        total_frames = video_info.frame_count
+        partial = start_frame > 0 or end_frame is not None
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        if end_frame is not None:
+            total_frames = min(total_frames, end_frame) if total_frames > 0 else end_frame
+        # Sin número de fotogramas no hay progreso que reportar
+        segment_frames = total_frames - start_frame if total_frames > start_frame else None
+
+        stored = None
+        writer = None
+        if detection_store is not None:
+            if video_hash is None:
+                video_hash = hash_file(video_path)
+            key = detection_key(detection_store, video_hash, model_weights, detection_threshold, motion_gate,
+                                keyframe_policy, inference_geometry)
+            stored = detection_store.load(key)
+            if stored is None and not partial:
+                writer = detection_store.create(key, {
+                    "model": str(model_weights),
+                    "threshold": float(detection_threshold),
+                    "fps": video_info.fps,
+                    "width": video_info.width,
+                    "height": video_info.height,
+                })
+
+        if stored is None:
+            if inference_service is not None:
+                # Las inferencias se agrupan con las de otras sesiones en el servicio compartido
+                session = inference_service.session()
+
+                def run_model(images):
+                    return session.detect(images, detection_threshold)
+            else:
+                # Obtener el modelo YOLOv8 ya cargado y calentado del registro del proceso
+                imgsz = inference_geometry.imgsz if inference_geometry is not None else DEFAULT_IMGSZ
+                model = get_model(model_weights, imgsz)
+
+                def run_model(images):
+                    return detect_bicycles_batch(images, model, detection_threshold)
+
+            def run_detector(frames):
+                if inference_geometry is None:
+                    return run_model(frames)
+                return inference_geometry.detect(frames, run_model)
+
+        if metrics is None:
+            metrics = PipelineMetrics()
+        profiler = SamplingProfiler(profile_path) if profile_path else None
+        analyzer = _FrameAnalyzer(counter, max_disappeared, max_distance, start_frame, metrics)
+    except Exception:
+        cap.release()
+        if session is not None:
+            session.close()
+        raise
+
+    last_export = [time.perf_counter()]
+
+    def timed_detector(frames):
+        with metrics.time("inference"):
+            return run_detector(frames)
+
+    def finish_frame(snapshot):
+        metrics.frame_done(len(snapshot))
+        if metrics_path and time.perf_counter() - last_export[0] >= metrics_interval:
+            last_export[0] = time.perf_counter()
+            metrics.export(metrics_path)
+
+    def detect(frames):
+        """Retorna las cajas de cada fotograma del lote, o None donde solo se predice."""
+        if stored is not None:
+            first = analyzer.frame_num
+            return [stored[first + i] for i in range(len(frames))]
+
+        if keyframe_policy is not None:
+            keyframes = keyframe_policy.plan(len(frames), analyzer.tracker, counter)
+        else:
+            keyframes = [True] * len(frames)
+        # Solo los fotogramas clave con movimiento pasan por el modelo
+        active = [is_key and (motion_gate is None or motion_gate.is_active(frame))
+                  for frame, is_key in zip(frames, keyframes)]
+
+        if all(active):
+            # Detectar bicicletas en todo el lote con una sola llamada al modelo
+            batch_rects = timed_detector(frames)
+        else:
+            active_rects = iter(timed_detector([frame for frame, is_active in zip(frames, active) if is_active]))
+            batch_rects = []
+            for is_key, is_active in zip(keyframes, active):
+                if is_active:
+                    batch_rects.append(next(active_rects))
+                elif is_key:
+                    batch_rects.append(np.empty((0, 4), dtype=np.int32))
+                else:
+                    batch_rects.append(None)
+        if writer is not None:
+            for rects in batch_rects:
+                writer.append(rects)
+        return batch_rects
+
+    def analyze(frames):
+        records = []
+        for frame, rects in zip(frames, detect(frames)):
+            frame_num, snapshot, events = analyzer.step(rects)
+            if event_sink is not None and events:
+                event_sink.write(events)
+            records.append((frame, frame_num, snapshot, events, counter.total, counter.counts()))
+        return records
+
+    def frame_progress(frame_num):
+        # El número de fotogramas del contenedor puede ser una estimación: nunca pasar de 1
+        if segment_frames is None:
+            return None
+        return min((frame_num - start_frame) / segment_frames, 1.0)
+
+    def draw(record):
+        frame, frame_num, snapshot, events, bicycle_count, counts = record
+        with metrics.time("annotate"):
+            _annotate_frame(frame, counter, snapshot, events, bicycle_count, counts)
+        finish_frame(snapshot)
+        return [FrameResult(frame, bicycle_count, frame_progress(frame_num), frame_num, events, counts, snapshot, metrics)]
+
+    def summarize(frames):
+        # Camino rápido sin anotación: no se conservan los fotogramas
+        results = []
+        for _, frame_num, snapshot, events, bicycle_count, counts in analyze(frames):
+            finish_frame(snapshot)
+            results.append(FrameResult(None, bicycle_count, frame_progress(frame_num), frame_num,
+                                       events, counts, snapshot, metrics))
+        return results
+
+    max_frames = end_frame - start_frame if end_frame is not None else None
+    stages = [analyze, draw] if annotate else [summarize]
+    try:
+        yield from run_pipeline(_decode_batches(cap, batch_size, max_frames, metrics), stages,
+                                queue_size=queue_size, metrics=metrics, profiler=profiler)
+    finally:
+        if session is not None:
+            session.close()
+        if metrics_path:
+            metrics.export(metrics_path)
+        if profiler is not None:
+            profiler.write()
+
+    # Solo se guardan las detecciones si se procesó el video completo
+    if writer is not None:
+        writer.commit()
+
+def replay_detections(stored, line_coords, lines=None, zones=None, max_disappeared=50, max_distance=75,
+                      metrics=None, event_sink=None):
+    """
+    Repite el seguimiento y el conteo desde detecciones guardadas, sin decodificar ni ejecutar YOLO.
 
-        # Mostrar el conteo total en el video
-        cv2.putText(frame, f"Conteo: {bicycle_count}", (20, 40),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+    Permite volver a contar un video con otra línea, otras zonas u otros parámetros del
+    tracker en segundos.
 
-        progress = frame_num / total_frames
-        yield frame, bicycle_count, progress
+    Args:
+        stored (StoredDetections): Detecciones guardadas con `DetectionStore`.
+        line_coords (tuple): Tupla con dos puntos ((x1, y1), (x2, y2)) que definen la línea.
+            Se ignora si se pasan `lines`.
+        lines (list): Lista opcional de `CountingLine`.
+        zones (list): Lista opcional de `CountingZone`.
+        max_disappeared (int): Fotogramas sin detección antes de dar de baja un objeto.
+        max_distance (int): Distancia máxima para asociar un objeto con una detección.
+        metrics (PipelineMetrics): Objeto de métricas a usar; si es None se crea uno.
+        event_sink (JsonlEventSink): Destino opcional de los eventos de cada fotograma.
 
-    cap.release()
+    Yields:
+        FrameResult: Igual que `process_video`, pero con `frame` en None.
+    """
+    counter = _make_counter(line_coords, lines, zones)
+    if metrics is None:
+        metrics = PipelineMetrics()
+    analyzer = _FrameAnalyzer(counter, max_disappeared, max_distance, metrics=metrics)
+    total_frames = len(stored)
+    for i in range(total_frames):
+        frame_num, snapshot, events = analyzer.step(stored[i])
+        if event_sink is not None and events:
+            event_sink.write(events)
+        metrics.frame_done(len(snapshot))
+        yield FrameResult(None, counter.total, frame_num / total_frames, frame_num, events, counter.counts(),
+                          snapshot, metrics)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Cuenta ciclistas en vivo sin interfaz, desde una cámara, un stream o un archivo
+reproducido en tiempo real.
+
+Se analiza siempre lo más reciente de la fuente (ver `streaming.process_stream`) y los
+conteos se agrupan en ventanas de tiempo alineadas con el reloj: por cada ventana cerrada
+se imprime una línea y, con --output, se agrega una fila a un CSV. Periódicamente se
+imprime también la latencia desde la captura hasta el conteo frente al presupuesto. Con
+--events cada cruce se agrega a un archivo JSON Lines con su hora de captura, sin acumularse
+en memoria, de modo que el proceso puede correr días sin crecer.
+
+Ejemplos:
+    python stream_process.py 0 --line h:50 --window 60
+    python stream_process.py rtsp://camara.local/stream --line v:50 --window 3600 --output conteos.csv
+    python stream_process.py grabacion.mp4 --loop --line v:50 --budget 0.3
+    python stream_process.py 0 --line h:50 --window 3600 --output conteos.csv --events cruces.jsonl
+"""
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from batch_process import parse_line_spec
+from event_sink import JsonlEventSink
+from streaming import DROP_NEWEST, DROP_OLDEST, FrameGrabber, process_stream
+from video_processing import DEFAULT_LINE_NAME, DEFAULT_WEIGHTS, line_coords_from_percent
+
+def _time_text(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+def write_window(path, window, partial=False):
+    """Agrega la fila de una ventana al CSV, con encabezado si el archivo es nuevo."""
+    new_file = not Path(path).exists()
+    direction_counts = window.counts[DEFAULT_LINE_NAME]
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["window_start", "window_end", "count", "count_in", "count_out", "frames", "partial"])
+        writer.writerow([_time_text(window.start), _time_text(window.end), window.count, direction_counts["in"],
+                         direction_counts["out"], window.frames, int(partial)])
+
+def report_window(window, output, partial=False):
+    direction_counts = window.counts[DEFAULT_LINE_NAME]
+    label = " (parcial)" if partial else ""
+    print(f"[{_time_text(window.start)}] {window.count} ciclistas{label}: "
+          f"{direction_counts['in']} entradas, {direction_counts['out']} salidas, {window.frames} fotogramas")
+    if output:
+        write_window(output, window, partial)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Número de cámara, URL del stream o ruta de un video.")
+    parser.add_argument("--line", required=True, type=parse_line_spec,
+                        help="Línea de conteo: h:Y, v:X o X1,Y1,X2,Y2 (en porcentaje).")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Umbral de confianza de detección.")
+    parser.add_argument("--model", default=DEFAULT_WEIGHTS, help="Pesos del modelo YOLOv8.")
+    parser.add_argument("--window", type=float, default=60,
+                        help="Duración de las ventanas de conteo en segundos (60 por minuto, 3600 por hora).")
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="Latencia máxima deseada entre la captura y el conteo, en segundos.")
+    parser.add_argument("--policy", choices=[DROP_OLDEST, DROP_NEWEST], default=DROP_OLDEST,
+                        help="Qué descartar cuando el análisis no alcanza a la fuente.")
+    parser.add_argument("--buffer", type=int, default=1, help="Fotogramas en espera en el búfer de captura.")
+    parser.add_argument("--loop", action="store_true", help="Si la fuente es un archivo, reproducirlo en bucle.")
+    parser.add_argument("--duration", type=float, default=None, help="Detenerse después de estos segundos.")
+    parser.add_argument("--status-interval", type=float, default=30,
+                        help="Segundos entre reportes de latencia y fotogramas descartados.")
+    parser.add_argument("--output", help="CSV al que agregar una fila por ventana de conteo.")
+    parser.add_argument("--events", help="Archivo JSON Lines al que agregar cada cruce a medida que ocurre.")
+    args = parser.parse_args()
+
+    try:
+        grabber = FrameGrabber(args.source, args.policy, args.buffer, loop=args.loop)
+    except IOError as e:
+        print(e)
+        sys.exit(1)
+    try:
+        line_type, line_percent = args.line
+        line_coords = line_coords_from_percent(line_type, line_percent, grabber.info.width, grabber.info.height)
+        event_sink = JsonlEventSink(args.events) if args.events else None
+    except Exception:
+        grabber.stop()
+        raise
+    print(f"Fuente {args.source}: {grabber.info.width}x{grabber.info.height} a {grabber.info.fps:.1f} FPS, "
+          f"ventanas de {args.window:g}s, presupuesto de latencia {args.budget * 1000:.0f} ms.")
+
+    results = process_stream(grabber, line_coords, args.threshold, window_seconds=args.window,
+                             latency_budget=args.budget, model_weights=args.model, annotate=False,
+                             event_sink=event_sink)
+    start = last_status = time.perf_counter()
+    result = None
+    failed = False
+    try:
+        for result in results:
+            for window in result.closed_windows:
+                report_window(window, args.output)
+            now = time.perf_counter()
+            if now - last_status >= args.status_interval:
+                last_status = now
+                latency = result.metrics.snapshot()["stages"].get("latency", {})
+                stats = grabber.stats
+                print(f"  latencia p50 {latency.get('p50_ms', 0):.0f} ms, p95 {latency.get('p95_ms', 0):.0f} ms, "
+                      f"p99 {latency.get('p99_ms', 0):.0f} ms (presupuesto {args.budget * 1000:.0f} ms); "
+                      f"{result.over_budget} fuera de presupuesto; "
+                      f"{stats['drop_ratio'] * 100:.0f}% de fotogramas descartados")
+            if args.duration is not None and now - start >= args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    except IOError as e:
+        print(f"Error: {e}")
+        failed = True
+    finally:
+        results.close()
+        if event_sink is not None:
+            event_sink.close()
+
+    # Al detenerse antes del final de la fuente, la ventana en curso se reporta como parcial
+    if result is not None and result.window is not None:
+        report_window(result.window, args.output, partial=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()